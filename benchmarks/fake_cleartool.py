@@ -0,0 +1,958 @@
+#!/usr/bin/env python3
+''' Fake cleartool backed by a synthetic VOB, to measure gfcc without a ClearCase server.
+
+    python3 fake_cleartool.py init --state DIR --root DIR [--elements N] [--depth D] [--branch-depth B]
+    GFCC_FAKE_STATE=DIR fake_cleartool.py <cleartool subcommand> ...   (no subcommand: interactive mode)
+
+    GFCC_FAKE_STARTUP and GFCC_FAKE_LATENCY add seconds of delay per process start and per command.
+    Every process start and command is appended to DIR/stats.log so callers can count them.
+
+    Element selection does not use gfcc.configspec: the view is walked from the VOB root through the entries of the
+    directory versions the cs selects, each element taking the version of the first rule that matches it, so the
+    fake can tell when gfcc evaluates a config spec wrongly.
+'''
+
+import os
+import re
+import sys
+import time
+import shlex
+import shutil
+import pickle
+import random
+import hashlib
+import difflib
+import argparse
+import subprocess
+
+from   os.path  import join, abspath, relpath, dirname, basename, isdir, exists, normpath
+from   fnmatch  import fnmatchcase
+
+
+VIEW = 'fakeview'
+USER = 'gfcc'
+DEFAULT_CS = ['element * CHECKEDOUT', 'element * /main/LATEST']
+MONTHS = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
+
+
+class Vob:
+
+    ''' Elements are {rel_path: {'kind', 'versions': {version: [labels, blob or None, time(, entries)]},
+                                 'co': None or [from, time(, entries)]}}
+        Directory versions and checked-out directories also hold the sorted names of their entries. After a mv the
+        element is kept under both paths (the same dict), older directory versions still name it by the old one. '''
+
+    def __init__(self, state):
+        self.state = state
+        self.model_path = join(state, 'model.pickle')
+        self.cs_path = join(state, 'cs.txt')
+        self.loaded_mtime = None
+        self.selection = None
+        self.reload()
+
+    def reload(self):
+        mtime = (os.stat(self.model_path).st_mtime_ns, os.stat(self.cs_path).st_mtime_ns)
+        if mtime == self.loaded_mtime:
+            return
+        with open(self.model_path, 'rb') as model_file:
+            model = pickle.load(model_file)
+        self.root = model['root']
+        self.elements = model['elements']
+        with open(self.cs_path) as cs_file:
+            self.cs = cs_file.read().splitlines()
+        self.loaded_mtime = mtime
+        self.selection = None
+
+    def save(self):
+        temp_path = self.model_path + '.tmp' + str(os.getpid())
+        with open(temp_path, 'wb') as model_file:
+            pickle.dump({'root': self.root, 'elements': self.elements}, model_file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, self.model_path)
+        self.loaded_mtime = None
+        self.selection = None
+
+    def save_cs(self, lines):
+        with open(self.cs_path, 'w') as cs_file:
+            cs_file.write('\n'.join(lines) + '\n')
+        self.loaded_mtime = None
+        self.selection = None
+
+    # Paths
+
+    def rel(self, path):
+        rel = relpath(split_extended(path)[0], self.root)
+        return None if rel.startswith('..') else rel
+
+    def version(self, path):
+
+        ''' Version named by a version-extended path, with LATEST resolved, or None '''
+
+        version = split_extended(path)[1]
+        rel = self.rel(path)
+        if version and version.endswith('/LATEST') and rel in self.elements:
+            return latest_on(self.elements[rel], branch_of(version))
+        return version
+
+    def abs(self, rel):
+        return normpath(join(self.root, rel))
+
+    # Contents
+
+    def content(self, rel, version):
+        blob = self.elements[rel]['versions'][version][1]
+        if blob:
+            with open(join(self.state, 'blobs', blob), 'rb') as blob_file:
+                return blob_file.read()
+        return ''.join(rel + ' ' + version + ' line ' + str(line) + '\n' for line in range(20)).encode('utf-8')
+
+    def store_blob(self, data):
+        blob = hashlib.sha1(data).hexdigest()
+        os.makedirs(join(self.state, 'blobs'), exist_ok=True)
+        with open(join(self.state, 'blobs', blob), 'wb') as blob_file:
+            blob_file.write(data)
+        return blob
+
+    def entries(self, rel, version):
+
+        ''' Names in a directory version, or in the directory as checked out '''
+
+        element = self.elements[rel]
+        if version.endswith('/CHECKEDOUT'):
+            return element['co'][2] if element['co'] and len(element['co']) > 2 else []
+        data = element['versions'].get(version)
+        return data[3] if data and len(data) > 3 else []
+
+    # Selection
+
+    def selected(self):
+
+        ''' {rel: (version, rule)} of the elements visible in the view for the current cs '''
+
+        if self.selection is None:
+            rules = parse_cs(self.cs)
+            self.selection = {}
+            pending = ['.']
+            while pending:
+                rel = pending.pop()
+                element = self.elements.get(rel)
+                chosen = first_match(rules, self.abs(rel), element) if element else None
+                if not chosen:
+                    continue
+                self.selection[rel] = chosen
+                if element['kind'] == 'directory':
+                    pending.extend(normpath(join(rel, name)) for name in self.entries(rel, chosen[0]))
+        return self.selection
+
+    def materialize(self):
+
+        ''' Make the files on disk match the versions selected by the current cs '''
+
+        selected = self.selected()
+        for rel in sorted(self.elements, reverse=True):
+            path = self.abs(rel)
+            if rel in selected or not exists(path):
+                continue
+            try:
+                if isdir(path):
+                    os.rmdir(path)
+                else:
+                    os.remove(path)
+            except OSError:
+                pass
+        for rel in sorted(selected):
+            element = self.elements[rel]
+            path = self.abs(rel)
+            if element['co']:
+                continue
+            if element['kind'] == 'directory':
+                os.makedirs(path, exist_ok=True)
+            else:
+                data = self.content(rel, selected[rel][0])
+                if not exists(path) or open(path, 'rb').read() != data:
+                    os.makedirs(dirname(path), exist_ok=True)
+                    with open(path, 'wb') as element_file:
+                        element_file.write(data)
+
+
+# Config specs
+
+def parse_cs(lines):
+
+    ''' [(element type or None, pattern, selector, rule shown by ls)] of the element rules of a config spec '''
+
+    rules = []
+    mkbranch = []
+    for line in lines:
+        words = line.split('#', 1)[0].split()
+        if not words or words[0] == 'load':
+            continue
+        if words[0] == 'element':
+            args = words[1:]
+            kind = args.pop(0) if args and args[0] in ('-file', '-directory') else None
+            if len(args) < 2 or args[1].startswith('{'):
+                raise ValueError(line)
+            branch = mkbranch[-1] if mkbranch else None
+            options = args[2:]
+            while options:
+                option = options.pop(0)
+                if option == '-mkbranch' and options:
+                    branch = options.pop(0)
+                elif option != '-nocheckout':
+                    raise ValueError(line)
+            rules.append((kind, args[0], args[1], args[1] + (' -mkbranch ' + branch if branch else '')))
+        elif words[0] == 'mkbranch':
+            mkbranch.append(words[1] if len(words) > 1 else None)
+        elif words[:2] == ['end', 'mkbranch'] and mkbranch:
+            mkbranch.pop()
+        elif words[0] == 'include' and len(words) > 1:
+            with open(words[1]) as included:
+                rules.extend(parse_cs(included.read().splitlines()))
+        else:
+            raise ValueError(line)
+    return rules
+
+
+def first_match(rules, path, element):
+
+    ''' (version, rule) chosen for an element by the first rule that matches it and selects a version, or None '''
+
+    for kind, pattern, selector, shown in rules:
+        if kind == ('-file' if element['kind'] == 'directory' else '-directory'):
+            continue
+        if not pattern_matches(pattern, path):
+            continue
+        version = version_for(selector, element)
+        if version:
+            return version, shown
+    return None
+
+
+def pattern_matches(pattern, path):
+
+    ''' Whether a rule pattern matches an absolute path: a single name matches at any depth, a relative pattern
+        matches the end of the path and "..." any number of directories '''
+
+    if '/' not in pattern:
+        return fnmatchcase(basename(path), pattern)
+    wanted = pattern.strip('/').split('/')
+    parts = path.strip('/').split('/')
+    if pattern.startswith('/'):
+        return components_match(wanted, parts)
+    return any(components_match(wanted, parts[start:]) for start in range(len(parts)))
+
+
+def components_match(wanted, parts):
+    if not wanted:
+        return not parts
+    if wanted[0] == '...':
+        return any(components_match(wanted[1:], parts[start:]) for start in range(len(parts) + 1))
+    return bool(parts) and fnmatchcase(parts[0], wanted[0]) and components_match(wanted[1:], parts[1:])
+
+
+def version_for(selector, element):
+
+    ''' Version of element named by a version selector (CHECKEDOUT, label, branch/LATEST or branch/N), or None '''
+
+    if selector == 'CHECKEDOUT':
+        return branch_of(element['co'][0]) + '/CHECKEDOUT' if element['co'] else None
+    if '/' not in selector:
+        return next((version for version, data in element['versions'].items() if selector in data[0]), None)
+    branch, _, number = selector.rpartition('/')
+    candidates = [version for version in element['versions'] if on_branch(branch_of(version), branch)]
+    if number == 'LATEST':
+        return max(candidates, key=version_number) if candidates else None
+    return next((version for version in candidates if version.rsplit('/', 1)[1] == number), None)
+
+
+def on_branch(branch, wanted):
+    if wanted.startswith('.../'):
+        return branch.endswith('/' + wanted[len('.../'):])
+    return branch == wanted
+
+
+def split_extended(path):
+
+    ''' (element path, version or None) of a path that may go through the version-extended namespace,
+        like dir@@/main/LATEST/sub/main/3/file or file@@/main/br/2 '''
+
+    if '@@' not in path:
+        return normpath(abspath(path)), None
+    head, tail = path.split('@@', 1)
+    element = normpath(abspath(head))
+    version = []
+    expect_name = False
+    for token in [token for token in tail.split('/') if token]:
+        if expect_name:
+            element = join(element, token)
+            version = []
+            expect_name = False
+        else:
+            version.append(token)
+            expect_name = token.isdigit() or token in ('LATEST', 'CHECKEDOUT')
+    return element, ('/' + '/'.join(version)) if version else None
+
+
+def branch_of(version):
+    return version.rsplit('/', 1)[0]
+
+
+def version_number(version):
+    tail = version.rsplit('/', 1)[1]
+    return int(tail) if tail.isdigit() else -1
+
+
+def latest_on(element, branch):
+    numbers = [version_number(v) for v in element['versions'] if branch_of(v) == branch]
+    return branch + '/' + str(max(numbers))
+
+
+def cc_time(timestamp):
+    local = time.localtime(timestamp)
+    return '%02d-%s-%04d.%02d:%02d:%02d' % (
+        local.tm_mday, MONTHS[local.tm_mon - 1], local.tm_year, local.tm_hour, local.tm_min, local.tm_sec)
+
+
+def parse_cc_time(text):
+    day, month, rest = text.split('-', 2)
+    year, clock = rest.split('.', 1) if '.' in rest else (rest, '00:00:00')
+    hour, minute, second = (clock.split(':') + ['0', '0'])[:3]
+    return time.mktime((int(year), MONTHS.index(month[:3].capitalize()) + 1, int(day),
+                        int(hour), int(minute), int(second), 0, 0, -1))
+
+
+def format_fmt(fmt, fields):
+
+    ''' Expand cleartool -fmt directives used by gfcc '''
+
+    fmt = fmt.replace('\\t', '\t').replace('\\n', '\n')
+    return re.sub(r'%(PVn|En|Vn|Nl|Nd|Nc|n|m|o|u|d|c|e)', lambda match: str(fields.get(match.group(1), '')), fmt)
+
+
+# Commands
+
+def out(text=''):
+    sys.stdout.write(text + '\n')
+
+
+def err(text):
+    sys.stderr.write('cleartool: Error: ' + text + '\n')
+
+
+def split_options(args, with_value=()):
+    options = {}
+    positional = []
+    index = 0
+    while index < len(args):
+        arg = args[index]
+        if arg.startswith('-') and len(arg) > 1:
+            if arg in with_value and index + 1 < len(args):
+                options[arg] = args[index + 1]
+                index += 1
+            else:
+                options[arg] = True
+        else:
+            positional.append(arg)
+        index += 1
+    return options, positional
+
+
+def under(vob, directory):
+    base = vob.rel(directory)
+    if base is None:
+        return []
+    return [rel for rel in vob.selected() if base == '.' or rel == base or rel.startswith(base + os.sep)]
+
+
+def recursive_targets(vob, targets):
+
+    ''' Targets of a recursive query, like cleartool the view-private ones are reported and skipped '''
+
+    selected = vob.selected()
+    found = []
+    for target in targets:
+        rel = vob.rel(target)
+        if rel == '.' or rel in selected:
+            found.append(target)
+        else:
+            err('Not a vob object: "' + target + '".')
+    return found
+
+
+def cmd_pwv(vob, args):
+    out('Working directory view: ' + VIEW)
+    out('Set view: ' + VIEW)
+
+
+def cmd_catcs(vob, args):
+    options, _ = split_options(args, ('-tag',))
+    if '-tag' in options:
+        tag_cs = join(vob.state, 'views', options['-tag'] + '.cs')
+        if not exists(tag_cs):
+            return err('View tag not found: "' + options['-tag'] + '".')
+        out(open(tag_cs).read().rstrip('\n'))
+    else:
+        out('\n'.join(vob.cs))
+
+
+def cmd_setcs(vob, args):
+    _, positional = split_options(args)
+    if not positional:
+        return err('Config spec file required.')
+    with open(positional[-1]) as cs_file:
+        lines = cs_file.read().splitlines()
+    try:
+        parse_cs(lines)
+    except (ValueError, OSError) as error:
+        return err('Unsupported rule in fake cleartool: ' + str(error))
+    vob.save_cs(lines)
+    vob.reload()
+    vob.materialize()
+
+
+def cmd_lsco(vob, args):
+    options, positional = split_options(args, ('-fmt',))
+    scope = under(vob, positional[0]) if positional else vob.selected()
+    for rel in sorted(scope):
+        element = vob.elements[rel]
+        if not element['co']:
+            continue
+        path = vob.abs(rel)
+        if '-fmt' in options:
+            kind = 'directory version' if element['kind'] == 'directory' else 'version'
+            sys.stdout.write(format_fmt(options['-fmt'], {
+                'En': path, 'n': path, 'Vn': branch_of(element['co'][0]) + '/CHECKEDOUT', 'PVn': element['co'][0],
+                'm': kind, 'o': 'checkout', 'e': 'checkout ' + kind, 'u': USER, 'd': cc_time(element['co'][1]),
+                'Nd': time.strftime('%Y%m%d.%H%M%S', time.localtime(element['co'][1])), 'c': '', 'Nc': ''}))
+        elif '-s' in options or '-short' in options:
+            out(path)
+        else:
+            out(cc_time(element['co'][1]) + '  ' + USER + '  checkout version "' + path + '" from ' + element['co'][0])
+
+
+def ls_line(vob, rel, selected, base, options):
+    shown = relpath(vob.abs(rel), base)
+    element = vob.elements[rel]
+    if '-short' in options or '-s' in options:
+        if '-nxname' in options:
+            return shown
+        return shown + '@@' + (branch_of(element['co'][0]) + '/CHECKEDOUT' if element['co'] else selected[rel][0])
+    if element['co']:
+        return shown + '@@' + branch_of(element['co'][0]) + '/CHECKEDOUT from ' + element['co'][0] + '             Rule: CHECKEDOUT'
+    version, rule = selected[rel]
+    return shown + '@@' + version + '                 Rule: ' + rule
+
+
+def view_private(vob, directory):
+    selected = vob.selected()
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(dirs) + sorted(files):
+            path = join(root, name)
+            rel = vob.rel(path)
+            if rel is not None and rel not in selected:
+                yield path
+
+
+def cmd_ls(vob, args):
+    options, positional = split_options(args)
+    recursive = '-r' in options or '-rec' in options or '-recurse' in options
+    cwd = os.getcwd()
+    if '-view_only' in options:
+        for path in view_private(vob, positional[0] if positional else '.'):
+            out(relpath(path, cwd))
+        return
+    selected = vob.selected()
+    targets = positional or ['.']
+    for target in targets:
+        rel = vob.rel(target)
+        if '@@' in target:
+            # Directory version: its entries, as version-extended paths
+            version = vob.version(target)
+            if rel not in vob.elements or version not in vob.elements[rel]['versions']:
+                err('Unable to access "' + target + '": No such file or directory.')
+                continue
+            for name in vob.entries(rel, version):
+                out(target + '/' + name)
+            continue
+        if rel is None or (rel != '.' and rel not in selected and not exists(target)):
+            err('Unable to access "' + target + '": No such file or directory.')
+            continue
+        if isdir(target):
+            # Like cleartool, the contents of a directory without the directory itself
+            scope = [r for r in under(vob, target) if r != rel] if recursive else [
+                r for r in selected if dirname(r) == ('' if rel == '.' else rel)]
+            for element_rel in sorted(scope):
+                out(ls_line(vob, element_rel, selected, cwd, options))
+            if recursive and '-vob_only' not in options:
+                for path in view_private(vob, target):
+                    out(relpath(path, cwd))
+        elif rel in selected:
+            out(ls_line(vob, rel, selected, cwd, options).replace(relpath(vob.abs(rel), cwd), target, 1))
+        elif '-vob_only' not in options:
+            out(target)
+
+
+def cmd_describe(vob, args):
+    options, positional = split_options(args, ('-fmt',))
+    selected = vob.selected()
+    for target in positional:
+        rel = vob.rel(target)
+        if rel not in vob.elements:
+            err('Not a vob object: "' + target + '".')
+            continue
+        element = vob.elements[rel]
+        version = vob.version(target)
+        if version and version not in element['versions']:
+            err('Version not found: "' + target + '".')
+            continue
+        if not version:
+            version = (branch_of(element['co'][0]) + '/CHECKEDOUT') if element['co'] else selected.get(rel, ('', ''))[0]
+        predecessor = element['co'][0] if element['co'] and version.endswith('/CHECKEDOUT') else ''
+        fields = {'En': vob.abs(rel), 'n': vob.abs(rel) + '@@' + version, 'Vn': version, 'PVn': predecessor,
+                  'Nl': ' '.join(element['versions'][version][0]) if version in element['versions'] else '',
+                  'm': 'directory version' if element['kind'] == 'directory' else 'version'}
+        if '-fmt' in options:
+            sys.stdout.write(format_fmt(options['-fmt'], fields))
+        else:
+            out('version "' + fields['n'] + '"')
+            out('  predecessor version: ' + predecessor)
+
+
+def cmd_get(vob, args):
+    options, positional = split_options(args, ('-to',))
+    target = positional[0] if positional else ''
+    rel = vob.rel(target)
+    version = vob.version(target)
+    if rel not in vob.elements or version not in vob.elements[rel]['versions']:
+        return err('Not a vob object: "' + target + '".')
+    with open(options['-to'], 'wb') as destination:
+        destination.write(vob.content(rel, version))
+
+
+def cmd_diff(vob, args):
+    _, positional = split_options(args)
+    target = positional[-1]
+    rel = vob.rel(target)
+    if rel not in vob.elements:
+        return err('Not a vob object: "' + target + '".')
+    element = vob.elements[rel]
+    predecessor = element['co'][0] if element['co'] else latest_on(element, '/main')
+    if element['kind'] == 'directory':
+        return out('Directories are identical')
+    old = vob.content(rel, predecessor).decode('utf-8', errors='replace').splitlines()
+    new = open(target, 'rb').read().decode('utf-8', errors='replace').splitlines()
+    if old == new:
+        return out('Files are identical')
+    out('********************************')
+    out('<<< file 1: ' + vob.abs(rel) + '@@' + predecessor)
+    out('>>> file 2: ' + target)
+    out('********************************')
+    for line in difflib.unified_diff(old, new, lineterm='', n=0):
+        if not line.startswith(('---', '+++')):
+            out(line)
+
+
+def element_args(vob, positional):
+    for target in positional:
+        yield target, vob.rel(target)
+
+
+def cmd_co(vob, args):
+    _, positional = split_options(args)
+    selected = vob.selected()
+    changed = False
+    for target, rel in element_args(vob, positional):
+        if rel not in vob.elements:
+            err('Not a vob object: "' + target + '".')
+            continue
+        if '@@' not in target and rel not in selected:
+            # An element the cs does not select is not in the view
+            err('Unable to access "' + target + '": No such file or directory.')
+            continue
+        element = vob.elements[rel]
+        if element['co']:
+            err('Element "' + target + '" is already checked out to view "' + VIEW + '".')
+            continue
+        version = target.split('@@', 1)[1] if '@@' in target else selected.get(rel, (latest_on(element, '/main'),))[0]
+        element['co'] = [version, time.time()]
+        if element['kind'] == 'directory':
+            element['co'].append(list(vob.entries(rel, version)))
+        changed = True
+        out('Checked out "' + target + '" from version "' + version + '".')
+    if changed:
+        vob.save()
+
+
+def cmd_ci(vob, args):
+    options, positional = split_options(args, ('-c',))
+    changed = False
+    for target, rel in element_args(vob, positional):
+        if rel not in vob.elements:
+            err('Not an element: "' + target + '".')
+            continue
+        element = vob.elements[rel]
+        if not element['co']:
+            err('Unable to check in "' + target + '": not checked out.')
+            continue
+        predecessor = element['co'][0]
+        branch = branch_of(predecessor)
+        data = b'' if element['kind'] == 'directory' else open(target, 'rb').read()
+        if element['kind'] != 'directory' and data == vob.content(rel, predecessor) and '-identical' not in options:
+            err("By default, won't create version with data identical to predecessor.")
+            err('Unable to check in "' + target + '".')
+            continue
+        new_version = branch + '/' + str(version_number(latest_on(element, branch)) + 1)
+        element['versions'][new_version] = [[], vob.store_blob(data) if data else None, time.time()]
+        if element['kind'] == 'directory':
+            element['versions'][new_version].append(sorted(vob.entries(rel, branch + '/CHECKEDOUT')))
+        element['co'] = None
+        changed = True
+        out('Checked in "' + target + '" version "' + new_version + '".')
+    if changed:
+        vob.save()
+
+
+def cmd_unco(vob, args):
+    options, positional = split_options(args)
+    changed = False
+    for target, rel in element_args(vob, positional):
+        element = vob.elements.get(rel)
+        if not element or not element['co']:
+            err('Element "' + target + '" is not checked out.')
+            continue
+        if element['kind'] != 'directory':
+            if '-keep' in options:
+                os.replace(target, target + '.keep')
+                out('Private version of "' + target + '" saved in "' + target + '.keep".')
+            with open(target, 'wb') as element_file:
+                element_file.write(vob.content(rel, element['co'][0]))
+        element['co'] = None
+        changed = True
+        out('Checkout cancelled for "' + target + '".')
+    if changed:
+        vob.save()
+
+
+def cmd_mkelem(vob, args):
+    options, positional = split_options(args, ('-c',))
+    changed = False
+    for target, rel in element_args(vob, [p for p in positional if p]):
+        parent = checked_out_parent(vob, target, rel)
+        if not parent:
+            continue
+        if basename(rel) in parent['co'][2]:
+            err('Entry named "' + target + '" already exists.')
+            continue
+        kind = 'directory' if isdir(target) else 'file'
+        now = time.time()
+        versions = {'/main/0': [[], vob.store_blob(b''), now]}
+        if '-ci' in options:
+            versions['/main/1'] = [[], vob.store_blob(open(target, 'rb').read()) if kind == 'file' else None, now]
+        if kind == 'directory':
+            for data in versions.values():
+                data.append([])
+        vob.elements[rel] = {'kind': kind, 'versions': versions, 'co': None if '-ci' in options else ['/main/0', now]}
+        if kind == 'directory' and vob.elements[rel]['co']:
+            vob.elements[rel]['co'].append([])
+        parent['co'][2] = sorted(parent['co'][2] + [basename(rel)])
+        changed = True
+        out('Created element "' + target + '" (type "' + ('directory' if kind == 'directory' else 'text_file') + '").')
+        if '-ci' in options:
+            out('Checked in "' + target + '" version "/main/1".')
+    if changed:
+        vob.save()
+
+
+def checked_out_parent(vob, target, rel):
+
+    ''' Element of the directory holding target if it is checked out, otherwise prints an error and returns None '''
+
+    parent = vob.elements.get(dirname(rel) or '.') if rel else None
+    if not parent or not parent['co'] or len(parent['co']) < 3:
+        err('Can\'t modify directory "' + (dirname(target) or '.') + '" because it is not checked out.')
+        return None
+    return parent
+
+
+def cmd_rmname(vob, args):
+    _, positional = split_options(args, ('-c',))
+    changed = False
+    for target, rel in element_args(vob, positional):
+        if rel not in vob.selected():
+            err('Unable to access "' + target + '": No such file or directory.')
+            continue
+        parent = checked_out_parent(vob, target, rel)
+        if not parent:
+            continue
+        parent['co'][2] = [name for name in parent['co'][2] if name != basename(rel)]
+        if isdir(target):
+            shutil.rmtree(target)
+        elif exists(target):
+            os.remove(target)
+        changed = True
+        out('Removed "' + target + '".')
+    if changed:
+        vob.save()
+
+
+def cmd_mv(vob, args):
+    _, positional = split_options(args, ('-c',))
+    if len(positional) != 2:
+        return err('Usage: mv pname target-pname')
+    source, target = positional
+    if isdir(target):
+        target = join(target, basename(source))
+    source_rel, target_rel = vob.rel(source), vob.rel(target)
+    if source_rel not in vob.selected():
+        return err('Unable to access "' + source + '": No such file or directory.')
+    source_parent = checked_out_parent(vob, source, source_rel)
+    target_parent = checked_out_parent(vob, target, target_rel) if source_parent else None
+    if not target_parent:
+        return
+    if basename(target_rel) in target_parent['co'][2]:
+        return err('Entry named "' + target + '" already exists.')
+    source_parent['co'][2] = [name for name in source_parent['co'][2] if name != basename(source_rel)]
+    target_parent['co'][2] = sorted(target_parent['co'][2] + [basename(target_rel)])
+    for rel in [rel for rel in vob.elements if rel == source_rel or rel.startswith(source_rel + os.sep)]:
+        vob.elements[target_rel + rel[len(source_rel):]] = vob.elements[rel]
+    os.rename(source, target)
+    vob.save()
+    out('Moved "' + source + '" to "' + target + '".')
+
+
+def history_events(vob, scope):
+    for rel in scope:
+        element = vob.elements[rel]
+        kind = 'directory version' if element['kind'] == 'directory' else 'version'
+        for version, data in element['versions'].items():
+            yield data[2], rel, version, data[0], 'checkin', kind
+        if element['co']:
+            yield element['co'][1], rel, branch_of(element['co'][0]) + '/CHECKEDOUT', [], 'checkout', kind
+
+
+def cmd_lshistory(vob, args):
+    options, positional = split_options(args, ('-fmt', '-last', '-since'))
+    targets = positional or ['.']
+    if '-graphical' in options:
+        return
+    if '-recurse' in options or '-r' in options:
+        scope = [rel for target in recursive_targets(vob, targets) for rel in under(vob, target)]
+    else:
+        scope = [vob.rel(target) for target in targets]
+    scope = [rel for rel in scope if rel in vob.elements]
+    since = parse_cc_time(options['-since']) if '-since' in options else None
+    events = sorted((event for event in history_events(vob, scope) if since is None or event[0] >= since), reverse=True)
+    if '-last' in options:
+        events = events[:int(options['-last'])]
+    for created, rel, version, labels, operation, kind in events:
+        path = vob.abs(rel)
+        if '-fmt' in options:
+            sys.stdout.write(format_fmt(options['-fmt'], {
+                'En': path, 'n': path + '@@' + version, 'Vn': version, 'Nl': ' '.join(labels), 'm': kind,
+                'o': operation, 'u': USER, 'd': cc_time(created), 'Nd': time.strftime('%Y%m%d.%H%M%S', time.localtime(created)),
+                'c': '', 'Nc': '', 'e': ('create ' if operation == 'checkin' else 'checkout ') + kind}))
+        elif '-short' in options:
+            out(path + '@@' + version)
+        else:
+            out(cc_time(created) + '  ' + USER + '  ' + ('create version' if operation == 'checkin' else 'checkout version')
+                + ' "' + relpath(path) + '@@' + version + '"' + (' (' + ', '.join(labels) + ')' if labels else ''))
+
+
+def version_query_matches(query, element, version):
+    for predicate in query.strip('{}').split('&&'):
+        predicate = predicate.strip()
+        negate = predicate.startswith('!')
+        predicate = predicate.lstrip('!').strip()
+        matched = re.match(r'(version|lbtype)\((.*)\)', predicate)
+        if not matched:
+            result = False
+        elif matched.group(1) == 'lbtype':
+            result = version in element['versions'] and matched.group(2) in element['versions'][version][0]
+        else:
+            wanted = '/' + matched.group(2).lstrip('/')
+            if wanted.endswith('/LATEST'):
+                branch = wanted[:-len('/LATEST')]
+                result = branch_of(version) == branch and version == latest_on(element, branch)
+            else:
+                result = version == wanted
+        if result == negate:
+            return False
+    return True
+
+
+def cmd_find(vob, args):
+    options, positional = split_options(args, ('-version', '-element', '-branch'))
+    targets = positional or ['.']
+    cwd = os.getcwd()
+    selected = vob.selected() if '-cview' in options else None
+    for rel in sorted(rel for target in recursive_targets(vob, targets) for rel in under(vob, target)):
+        element = vob.elements[rel]
+        if '-version' in options:
+            if selected is not None:
+                candidates = [selected[rel][0]] if rel in selected else []
+            else:
+                candidates = sorted(element['versions'], key=lambda v: (branch_of(v), version_number(v)))
+            for version in candidates:
+                if version_query_matches(options['-version'], element, version):
+                    out('./' + relpath(vob.abs(rel), cwd) + '@@' + version)
+        elif selected is None or rel in selected:
+            out('./' + relpath(vob.abs(rel), cwd))
+
+
+def cmd_startview(vob, args):
+    pass
+
+
+COMMANDS = {
+    'pwv': cmd_pwv, 'catcs': cmd_catcs, 'setcs': cmd_setcs, 'lsco': cmd_lsco, 'lscheckout': cmd_lsco,
+    'ls': cmd_ls, 'describe': cmd_describe, 'desc': cmd_describe, 'get': cmd_get, 'diff': cmd_diff,
+    'co': cmd_co, 'checkout': cmd_co, 'ci': cmd_ci, 'checkin': cmd_ci, 'unco': cmd_unco, 'uncheckout': cmd_unco,
+    'mkelem': cmd_mkelem, 'lshistory': cmd_lshistory, 'lshist': cmd_lshistory, 'find': cmd_find,
+    'mv': cmd_mv, 'move': cmd_mv, 'rmname': cmd_rmname, 'rm': cmd_rmname,
+    'startview': cmd_startview,
+}
+
+
+def log_stat(state, text):
+    with open(join(state, 'stats.log'), 'a') as stats:
+        stats.write(text + '\n')
+
+
+def run_command(vob, args):
+    if not args:
+        return
+    log_stat(vob.state, 'cmd ' + args[0])
+    time.sleep(float(os.environ.get('GFCC_FAKE_LATENCY', 0)))
+    if args[0] not in COMMANDS:
+        return err('Unrecognized command: "' + args[0] + '"')
+    vob.reload()
+    COMMANDS[args[0]](vob, args[1:])
+
+
+def interactive(vob):
+    for line in sys.stdin:
+        try:
+            args = shlex.split(line)
+        except ValueError:
+            err('Unbalanced quotes')
+            continue
+        if not args:
+            continue
+        if args[0] in ('quit', 'exit', 'q'):
+            break
+        if args[0] == 'cd':
+            try:
+                os.chdir(args[1])
+            except OSError as error:
+                err(str(error))
+        elif args[0] in ('shell', 'sh', '!'):
+            sys.stdout.flush()
+            sys.stderr.flush()
+            subprocess.run(' '.join(args[1:]), shell=True)
+        else:
+            run_command(vob, args)
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+
+# Synthetic VOB generation
+
+def init(state, root, elements=1000, depth=3, branch_depth=1, labels=('REL1', 'REL2'), seed=0):
+
+    ''' Create a VOB model with the given number of file elements spread over directories.
+        Every 4th directory has two versions, labeled with the first and the last label: the second one drops the
+        last file and a subdirectory that only the first one holds, and adds a file of its own. '''
+
+    rng = random.Random(seed)
+    os.makedirs(state, exist_ok=True)
+    os.makedirs(root, exist_ok=True)
+    now = time.time()
+    model = {}
+    per_directory = 20
+    directories = ['.']
+    for index in range(elements):
+        if index % per_directory == 0:
+            path_parts = ['d' + str(rng.randrange(8)) for _ in range(rng.randint(1, depth))]
+            directory = join('src', 'blk', *path_parts) + str(index // per_directory)
+            directories.append(directory)
+        rel = join(directories[-1], 'f' + str(index) + '.v')
+        versions = {}
+        branch = '/main'
+        for level in range(rng.randint(0, branch_depth) + 1):
+            if level:
+                branch = branch + '/br' + str(level)
+            for number in range(rng.randint(1, 5) + 1):
+                versions[branch + '/' + str(number)] = [[], None, now - rng.randint(3600, 3600 * 24 * 365)]
+        for label in labels:
+            labeled = rng.choice(sorted(versions))
+            versions[labeled][0].append(label)
+        model[rel] = {'kind': 'file', 'versions': versions, 'co': None}
+
+    # {directory: (file only in /main/1, subdirectory only in /main/1, file only in /main/2)}
+    changed = {}
+    for index, directory in enumerate(directories[1::4]):
+        files = sorted((rel for rel in model if dirname(rel) == directory), key=lambda rel: int(basename(rel)[1:-2]))
+        old_directory = join(directory, 'old' + str(index))
+        added = join(directory, 'n' + str(index) + '.v')
+        for name in ('g0.v', 'g1.v'):
+            model[join(old_directory, name)] = {'kind': 'file', 'co': None, 'versions': {
+                '/main/1': [[labels[0]], None, now - 3600 * 24 * 200], '/main/2': [[], None, now - 3600 * 24 * 100]}}
+        model[added] = {'kind': 'file', 'co': None, 'versions': {'/main/1': [[], None, now - 3600 * 24 * 50]}}
+        changed[directory] = (basename(files[-1]), basename(old_directory), basename(added))
+        model[old_directory] = {'kind': 'directory', 'co': None, 'versions': {}}
+
+    for directory in directories + [join(directory, changed[directory][1]) for directory in changed]:
+        parts = directory.split(os.sep)
+        for end in range(1, len(parts) + 1):
+            rel = join(*parts[:end]) if parts[0] != '.' else '.'
+            model.setdefault(rel, {'kind': 'directory', 'co': None, 'versions': {}})
+    children = {}
+    for rel in model:
+        if rel != '.':
+            children.setdefault(dirname(rel) or '.', []).append(basename(rel))
+    for rel, element in model.items():
+        if element['kind'] != 'directory':
+            continue
+        names = sorted(children.get(rel, []))
+        element['versions'] = {'/main/0': [[], None, now - 3600 * 24 * 400, []]}
+        if rel in changed:
+            dropped, old_directory, added = changed[rel]
+            element['versions']['/main/1'] = [[labels[0]], None, now - 3600 * 24 * 300,
+                                              [name for name in names if name != added]]
+            element['versions']['/main/2'] = [[labels[-1]], None, now - 3600 * 24 * 50,
+                                              [name for name in names if name not in (dropped, old_directory)]]
+        else:
+            element['versions']['/main/1'] = [[], None, now - 3600 * 24 * 300, names]
+    with open(join(state, 'model.pickle'), 'wb') as model_file:
+        pickle.dump({'root': abspath(root), 'elements': model}, model_file, protocol=pickle.HIGHEST_PROTOCOL)
+    with open(join(state, 'cs.txt'), 'w') as cs_file:
+        cs_file.write('\n'.join(DEFAULT_CS) + '\n')
+    open(join(state, 'stats.log'), 'w').close()
+    vob = Vob(state)
+    vob.materialize()
+    return vob
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == 'init':
+        parser = argparse.ArgumentParser(prog='fake_cleartool.py init')
+        parser.add_argument('--state', required=True)
+        parser.add_argument('--root', required=True)
+        parser.add_argument('--elements', type=int, default=1000)
+        parser.add_argument('--depth', type=int, default=3)
+        parser.add_argument('--branch-depth', type=int, default=1)
+        res = parser.parse_args(sys.argv[2:])
+        init(res.state, res.root, res.elements, res.depth, res.branch_depth)
+        return
+    state = os.environ['GFCC_FAKE_STATE']
+    log_stat(state, 'spawn ' + str(os.getpid()))
+    time.sleep(float(os.environ.get('GFCC_FAKE_STARTUP', 0)))
+    vob = Vob(state)
+    if len(sys.argv) == 1:
+        interactive(vob)
+    else:
+        run_command(vob, sys.argv[1:])
+
+
+if __name__ == '__main__':
+    main()
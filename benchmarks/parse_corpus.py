@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+''' Parse the cleartool outputs in benchmarks/corpus/ with gfcc.ccfmt and time the ls -r parser on many lines.
+
+    python3 benchmarks/parse_corpus.py [--lines 1000000] [--show] [--check | --update]
+
+    --show prints the records decoded from every corpus file, to review them after changing a parser.
+    --check compares them with the records expected in the .json file next to each corpus file and exits with 1
+    if any differs, --update writes the decoded records as the expected ones.
+'''
+
+import sys
+import json
+import time
+import argparse
+
+from   os.path  import join, dirname, abspath, splitext
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+from   gfcc     import ccfmt
+from   gfcc     import utils
+
+
+# Constants
+CORPUS = join(dirname(abspath(__file__)), 'corpus')
+PARSERS = {
+    'ls_r.txt': lambda lines: [ccfmt.parse_ls_line(line) for line in lines],
+    # A checked-out element is listed with its CHECKEDOUT version, not the one it was checked out from
+    'ls_checked_out.txt': lambda lines: list(utils.parse_file_versions(lines).items()),
+    'find_print.txt': lambda lines: [ccfmt.split_version_path(line) for line in lines if line],
+    'describe_version.txt': ccfmt.VERSION.parse,
+    'describe_predecessor.txt': ccfmt.PREDECESSOR.parse,
+    'describe_labeled_version.txt': ccfmt.LABELED_VERSION.parse,
+    'lshistory_tree_version.txt': ccfmt.TREE_VERSION.parse,
+    'lshistory_event.txt': ccfmt.EVENT.parse,
+    'checkin.txt': lambda lines: [ccfmt.quoted_after(line, 'version') for line in lines],
+    'pwv.txt': lambda lines: [ccfmt.parse_pwv(lines)],
+    'pwv_none.txt': lambda lines: [ccfmt.parse_pwv(lines)],
+    'diff_unified.txt': lambda lines: [ccfmt.diff_filename('\n'.join(lines))],
+    'diff_cleartool.txt': lambda lines: [ccfmt.diff_filename('\n'.join(lines))],
+}
+
+
+def read_lines(name):
+    with open(join(CORPUS, name)) as corpus_file:
+        return corpus_file.read().split('\n')
+
+
+def expected_path(name):
+    return join(CORPUS, splitext(name)[0] + '.json')
+
+
+def to_json(value):
+
+    ''' Decoded records as plain JSON values: records as objects, tuples as lists '''
+
+    if hasattr(value, '_asdict'):
+        return {field: to_json(field_value) for field, field_value in value._asdict().items()}
+    if isinstance(value, dict):
+        return {key: to_json(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_json(item) for item in value]
+    return value
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Parse the cleartool output corpus with gfcc.ccfmt.')
+    parser.add_argument('--lines', type=int, default=1000000, help='Number of ls -r lines to time the parser on.')
+    parser.add_argument('--show', action='store_true', help='Print the decoded records.')
+    checks = parser.add_mutually_exclusive_group()
+    checks.add_argument('--check', action='store_true', help='Compare the decoded records with the expected ones.')
+    checks.add_argument('--update', action='store_true', help='Write the decoded records as the expected ones.')
+    res = parser.parse_args()
+
+    mismatches = []
+    print('{:<32} {:>8}'.format('corpus file', 'records'))
+    for name, parse in PARSERS.items():
+        records = [record for record in parse(read_lines(name)) if record]
+        print('{:<32} {:>8}'.format(name, len(records)))
+        if res.show:
+            for record in records:
+                print('    ' + repr(record))
+        if res.update:
+            with open(expected_path(name), 'w') as expected_file:
+                json.dump(to_json(records), expected_file, indent=2)
+                expected_file.write('\n')
+        elif res.check:
+            with open(expected_path(name)) as expected_file:
+                expected = json.load(expected_file)
+            decoded = to_json(records)
+            for index in range(max(len(expected), len(decoded))):
+                if index >= len(decoded) or index >= len(expected) or decoded[index] != expected[index]:
+                    mismatches.append(name)
+                    print('    record {}: expected {}, decoded {}'.format(
+                        index, expected[index] if index < len(expected) else None,
+                        decoded[index] if index < len(decoded) else None))
+    if res.check:
+        if mismatches:
+            print('Error: decoded records differ from the expected ones in ' + ', '.join(sorted(set(mismatches))))
+            sys.exit(1)
+        print('All the decoded records match the expected ones.')
+        return
+
+    sample = [line for line in read_lines('ls_r.txt') if line]
+    lines = [
+        'd' + str(index // len(sample)) + '/' + sample[index % len(sample)]
+        for index in range(res.lines)
+    ]
+    start_time = time.time()
+    records = [ccfmt.parse_ls_line(line) for line in lines]
+    elapsed = time.time() - start_time
+    print('Parsed {} ls -r lines in {:.2f} s ({:.2f} us per line)'.format(
+        len(records), elapsed, elapsed * 1e6 / max(1, len(records))))
+
+
+if __name__ == '__main__':
+    main()
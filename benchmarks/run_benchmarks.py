@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+''' Time gfcc commands against fake_cleartool.py and count the cleartool processes and commands they need.
+
+    python3 benchmarks/run_benchmarks.py [--sizes 1000,10000,100000] [--startup 0.2] [--latency 0.01] [--check]
+
+    Each scenario is run --repeat times over the same VOB, the first run starts with empty gfcc caches.
+    --no-cs-engine runs them with GFCC_NO_CS_ENGINE=1. --check runs the scenarios that evaluate config specs once with
+    and once without the engine, the fake then selecting the versions itself with setcs and ls, and fails if the
+    outputs differ.
+'''
+
+import os
+import sys
+import time
+import json
+import shutil
+import difflib
+import argparse
+import tempfile
+import subprocess
+
+from   os.path  import join, dirname, abspath
+from   collections import Counter
+
+import fake_cleartool
+
+
+# Constants
+REPO = dirname(dirname(abspath(__file__)))
+SCENARIOS = {
+    'status':   ['status'],
+    'diff':     ['diff'],
+    'diffcs':   ['diffcs', 'other.cs'],
+    'find-nl':  ['find', '--not-latest'],
+    'ci-r':     ['ci', '-r', '-m', 'Benchmark checkin.'],
+    'savecs':   ['savecs', '--force'],
+    'log-r':    ['log', '-r', '-l', '20'],
+    'difflabels': ['difflabels', 'REL1', 'REL2'],
+}
+# Scenarios whose output depends on the local config spec engine
+ENGINE_SCENARIOS = ('diffcs', 'find-nl')
+CURRENT_CS = ['# gfcc_config = {"email_updates_to": []}', 'element * CHECKEDOUT', 'element * REL2', 'element * /main/LATEST']
+OTHER_CS = ['element * CHECKEDOUT', 'element * REL1', 'element * /main/LATEST']
+
+
+def prepare(work_dir, elements, checked_out_ratio):
+
+    ''' Build the VOB, check out and modify some files and leave a few view-private ones '''
+
+    state = join(work_dir, 'state')
+    root = join(work_dir, 'vob')
+    vob = fake_cleartool.init(state, root, elements)
+    vob.save_cs(CURRENT_CS)
+    vob.reload()
+    vob.materialize()
+
+    selected = vob.selected()
+    files = sorted(rel for rel in selected if vob.elements[rel]['kind'] == 'file')
+    step = max(1, int(1 / checked_out_ratio))
+    for index, rel in enumerate(files[::step]):
+        vob.elements[rel]['co'] = [selected[rel][0], time.time()]
+        if index % 2 == 0:
+            with open(vob.abs(rel), 'a') as element_file:
+                element_file.write('modified by benchmark\n')
+    vob.save()
+    block = join(root, 'src', 'blk')
+    for index in range(3):
+        with open(join(block, 'private' + str(index) + '.txt'), 'w') as private_file:
+            private_file.write('view-private\n')
+    with open(join(block, 'other.cs'), 'w') as cs_file:
+        cs_file.write('\n'.join(OTHER_CS) + '\n')
+
+    bin_dir = join(work_dir, 'bin')
+    os.makedirs(bin_dir)
+    shim = join(bin_dir, 'cleartool')
+    with open(shim, 'w') as shim_file:
+        shim_file.write('#!/bin/sh\nexec "' + sys.executable + '" "' + abspath(fake_cleartool.__file__) + '" "$@"\n')
+    os.chmod(shim, 0o755)
+    return state, root, block, bin_dir
+
+
+def read_stats(state):
+    with open(join(state, 'stats.log')) as stats_file:
+        lines = stats_file.read().splitlines()
+    spawns = sum(1 for line in lines if line.startswith('spawn '))
+    commands = Counter(line.split(' ', 1)[1] for line in lines if line.startswith('cmd '))
+    return spawns, commands
+
+
+def run_scenario(args, env, cwd, state):
+    open(join(state, 'stats.log'), 'w').close()
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, '-m', 'gfcc'] + args, cwd=cwd, env=env,
+                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    elapsed = time.perf_counter() - start
+    spawns, commands = read_stats(state)
+    return {
+        'seconds': round(elapsed, 3), 'spawns': spawns, 'commands': sum(commands.values()),
+        'per_subcommand': dict(commands), 'exit_status': result.returncode,
+        'output': result.stdout.decode('utf-8', errors='replace'),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark gfcc against a fake ClearCase.')
+    parser.add_argument('--sizes', default='1000,10000,100000', help='Comma separated numbers of elements.')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='Comma separated subset of: ' + ', '.join(SCENARIOS))
+    parser.add_argument('--startup', type=float, default=0.0, help='Seconds added to every cleartool process start.')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every cleartool command.')
+    parser.add_argument('--checked-out', type=float, default=0.01, help='Fraction of the files checked out.')
+    parser.add_argument('--repeat', type=int, default=2, help='Runs per scenario, the first one with cold caches.')
+    parser.add_argument('--no-session', action='store_true', help='Run with GFCC_NO_SESSION=1.')
+    parser.add_argument('--daemon', action='store_true', help='Start "gfcc daemon" on the block before the scenarios.')
+    parser.add_argument('--no-cs-engine', action='store_true', help='Run with GFCC_NO_CS_ENGINE=1.')
+    parser.add_argument('--check', action='store_true', help='Compare the output of the cs engine with setcs + ls.')
+    parser.add_argument('--json', help='Write all the results to this file.')
+    parser.add_argument('--verbose', action='store_true', help='Print the output of gfcc.')
+    res = parser.parse_args()
+
+    results = []
+    mismatches = []
+    print('%-8s %-10s %4s %9s %7s %9s  %s' % ('elements', 'scenario', 'run', 'seconds', 'spawns', 'commands', 'top subcommands'))
+    for size in [int(size) for size in res.sizes.split(',')]:
+        work_dir = tempfile.mkdtemp(prefix='gfcc_bench_')
+        try:
+            state, root, block, bin_dir = prepare(work_dir, size, res.checked_out)
+            env = dict(
+                os.environ,
+                PATH=bin_dir + os.pathsep + os.environ.get('PATH', ''),
+                PYTHONPATH=REPO + os.pathsep + os.environ.get('PYTHONPATH', ''),
+                GFCC_FAKE_STATE=state, GFCC_FAKE_STARTUP=str(res.startup), GFCC_FAKE_LATENCY=str(res.latency),
+                GFCC_CACHE_DIR=join(work_dir, 'cache'), PROJVOB=root,
+            )
+            if res.no_session:
+                env['GFCC_NO_SESSION'] = '1'
+            if res.no_cs_engine:
+                env['GFCC_NO_CS_ENGINE'] = '1'
+            if res.daemon:
+                subprocess.run([sys.executable, '-m', 'gfcc', 'daemon', 'start'], cwd=block, env=env, stdout=subprocess.DEVNULL)
+            for name in res.scenarios.split(','):
+                for run in range(res.repeat):
+                    result = run_scenario(SCENARIOS[name], env, block, state)
+                    result.update(elements=size, scenario=name, run=run)
+                    results.append(result)
+                    top = ', '.join(sub + ':' + str(count) for sub, count in Counter(result['per_subcommand']).most_common(4))
+                    print('%-8d %-10s %4d %9.3f %7d %9d  %s%s' % (
+                        size, name, run, result['seconds'], result['spawns'], result['commands'], top,
+                        '' if result['exit_status'] == 0 else '  (exit ' + str(result['exit_status']) + ')'))
+                    if res.verbose:
+                        print(result['output'])
+                if res.check and name in ENGINE_SCENARIOS:
+                    reference = run_scenario(SCENARIOS[name], dict(env, GFCC_NO_CS_ENGINE='1'), block, state)
+                    result = run_scenario(
+                        SCENARIOS[name], {key: value for key, value in env.items() if key != 'GFCC_NO_CS_ENGINE'}, block, state)
+                    if reference['output'] != result['output']:
+                        mismatches.append((size, name))
+                        print('%-8d %-10s cs engine output differs from setcs + ls:' % (size, name))
+                        print(''.join(difflib.unified_diff(
+                            reference['output'].splitlines(True), result['output'].splitlines(True),
+                            'setcs + ls', 'cs engine')))
+        finally:
+            if res.daemon:
+                subprocess.run([sys.executable, '-m', 'gfcc', 'daemon', 'stop'], cwd=block, env=env, stdout=subprocess.DEVNULL)
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    if res.json:
+        with open(res.json, 'w') as json_file:
+            json.dump(results, json_file, indent=2)
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+''' Time the startup of gfcc: "gfcc --help" end to end, and the imports "gfcc s" needs before it runs any
+    cleartool command. Each is measured in a new Python process and compared with its target.
+    Also check that no module is still lazy when a handler starts: LazyLoader is not thread-safe before Python 3.12
+    and handlers use these modules from worker threads.
+
+    python3 benchmarks/startup.py [--runs 20]
+'''
+
+import sys
+import argparse
+import statistics
+import subprocess
+
+from   os.path  import dirname, abspath
+
+
+# Constants
+REPO = dirname(dirname(abspath(__file__)))
+# Milliseconds, on top of the startup of an empty Python process. "gfcc s" cannot go much lower than the standard
+# modules it needs (asyncio, argparse, concurrent.futures, subprocess).
+HELP_TARGET_MS = 40
+STATUS_IMPORT_TARGET_MS = 100
+
+TIMED_HELP = '''
+import io, sys, time, contextlib
+start = time.perf_counter()
+sys.argv = ['gfcc', '--help']
+with contextlib.redirect_stdout(io.StringIO()), contextlib.suppress(SystemExit):
+    from gfcc.gfcc import main
+    main()
+print((time.perf_counter() - start) * 1000)
+'''
+TIMED_STATUS_IMPORT = '''
+import sys, time
+start = time.perf_counter()
+from gfcc import gfcc
+gfcc.build_parser(['s']).parse_args(['s'])
+gfcc.utils.JOBS, gfcc.aio.run
+print((time.perf_counter() - start) * 1000)
+'''
+# Prints the modules that are still lazy when the status handler is called
+LAZY_AT_HANDLER = '''
+import sys, importlib.util
+from gfcc import gfcc
+def handler(res):
+    print(' '.join(name for name, module in sys.modules.items() if isinstance(module, importlib.util._LazyModule)))
+aliases, help_text, add_arguments, _ = gfcc.COMMANDS['status']
+gfcc.COMMANDS['status'] = (aliases, help_text, add_arguments, handler)
+sys.argv = ['gfcc', 's']
+gfcc.main()
+'''
+
+
+def run_python(code):
+    result = subprocess.run([sys.executable, '-c', code], cwd=REPO, stdout=subprocess.PIPE, check=True)
+    return result.stdout.decode().strip().split('\n')[-1]
+
+
+def run_timed(code):
+    return float(run_python(code))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time the startup of gfcc.')
+    parser.add_argument('--runs', type=int, default=20, help='Processes started per measurement.')
+    res = parser.parse_args()
+
+    failed = False
+    print('{:<24} {:>10} {:>10} {:>10}'.format('measurement', 'median ms', 'max ms', 'target ms'))
+    for name, code, target in [
+        ('gfcc --help', TIMED_HELP, HELP_TARGET_MS),
+        ('gfcc s imports', TIMED_STATUS_IMPORT, STATUS_IMPORT_TARGET_MS),
+    ]:
+        times = [run_timed(code) for _ in range(res.runs)]
+        median = statistics.median(times)
+        failed = failed or median > target
+        print('{:<24} {:>10.1f} {:>10.1f} {:>10} {}'.format(
+            name, median, max(times), target, 'ok' if median <= target else 'SLOW'))
+
+    lazy = run_python(LAZY_AT_HANDLER)
+    if lazy:
+        failed = True
+        print('Modules still lazy when the handler starts: ' + lazy)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
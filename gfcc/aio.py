@@ -0,0 +1,348 @@
+import time
+import json
+import heapq
+import asyncio
+import weakref
+import tempfile
+import subprocess
+
+from   os       import getcwd
+from   os.path  import isdir, normpath
+from   gfcc     import utils
+from   gfcc     import cache
+from   gfcc     import session
+from   gfcc     import trace
+from   gfcc     import daemon
+from   gfcc     import textdiff
+from   gfcc     import ccfmt
+from   gfcc     import paths
+
+
+# Constants
+# Longest stdout line read at once from a streamed command
+STREAM_LINE_LIMIT = 2**20
+# (element, version) pairs sorted in memory before being spilled to a temporary file by sorted_versions
+SORT_RUN_SIZE = 50000
+
+_limiters = weakref.WeakKeyDictionary()
+
+
+def run(coroutine):
+
+    ''' Run a coroutine in a new event loop, one per gfcc invocation '''
+
+    return asyncio.run(coroutine)
+
+
+def limiter():
+
+    ''' Semaphore of the running loop that keeps at most GFCC_JOBS commands running '''
+
+    loop = asyncio.get_running_loop()
+    if loop not in _limiters:
+        _limiters[loop] = asyncio.Semaphore(utils.JOBS)
+    return _limiters[loop]
+
+
+async def run_cmd(cmd, get_lines=False, timeout=None):
+
+    ''' Async utils.run_cmd. Queries go to the cleartool sessions unless a timeout (in seconds) is given, then
+        they run in their own process, killed when the timeout expires (asyncio.TimeoutError) or the call is
+        cancelled. A cancelled session query still ends in the background, only its result is dropped. '''
+
+    argv = utils.cmd_to_argv(cmd)
+    memo = cache.get_query_memo() if argv else None
+    result = memo.get(argv) if memo else None
+    if result is None:
+        async with limiter():
+            if argv and session.handles(argv) and timeout is None:
+                result = await asyncio.get_running_loop().run_in_executor(
+                    None, lambda: trace.traced_run(argv, lambda: utils.execute_cmd(cmd, argv), True))
+            else:
+                result = await run_process(cmd, argv, timeout)
+        if memo:
+            memo.update(argv, result)
+        if argv and cache.mutates(argv):
+            daemon.notify(argv)
+    decoded_out, decoded_err, _ = result
+    return (decoded_out, decoded_err) if not get_lines else (decoded_out.split('\n'), decoded_err.split('\n'))
+
+
+async def start_process(cmd, stdout_limit=None):
+    options = {'stdout': subprocess.PIPE, 'stderr': subprocess.PIPE}
+    if stdout_limit:
+        options['limit'] = stdout_limit
+    if isinstance(cmd, (list, tuple)):
+        return await asyncio.create_subprocess_exec(*[str(arg) for arg in cmd], **options)
+    return await asyncio.create_subprocess_shell(cmd, **options)
+
+
+def kill(process):
+    if process.returncode is None:
+        try:
+            process.kill()
+        except ProcessLookupError:
+            pass
+
+
+async def run_process(cmd, argv, timeout=None):
+
+    ''' (stdout, stderr, exit status) of a command run in its own process '''
+
+    start_time = time.time()
+    process = await start_process(cmd)
+    try:
+        out, err = await asyncio.wait_for(process.communicate(), timeout)
+    except BaseException:
+        kill(process)
+        raise
+    trace.record(argv or cmd.split(), start_time, process.returncode, len(out), len(err))
+    return out.decode('utf-8', errors='replace'), err.decode('utf-8', errors='replace'), process.returncode
+
+
+async def stream_cmd(cmd, errors=None, timeout=None):
+
+    ''' Async utils.stream_cmd: yield stdout lines as they are produced, stderr lines are added to errors.
+        The process is killed if the consumer stops early, the call is cancelled or it runs longer than timeout. '''
+
+    argv = utils.cmd_to_argv(cmd)
+    errors = errors if errors is not None else []
+    memo = cache.get_query_memo() if argv else None
+    if memo:
+        memo.update(argv)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout if timeout is not None else None
+    start_time = time.time()
+    process = await start_process(cmd, STREAM_LINE_LIMIT)
+    error_reader = asyncio.ensure_future(process.stderr.read())
+    out_bytes = 0
+    exhausted = False
+    try:
+        while True:
+            remaining = None if deadline is None else max(0, deadline - loop.time())
+            line = await asyncio.wait_for(process.stdout.readline(), remaining)
+            if not line:
+                break
+            out_bytes += len(line)
+            yield line.decode('utf-8', errors='replace').rstrip('\r\n')
+        await process.wait()
+        exhausted = True
+    finally:
+        if not exhausted:
+            kill(process)
+            error_reader.cancel()
+        else:
+            error_output = (await error_reader).decode('utf-8', errors='replace')
+            errors.extend(line for line in error_output.split('\n') if line)
+            trace.record(argv or cmd.split(), start_time, process.returncode, out_bytes, len(error_output))
+
+
+async def collect(lines):
+    return [line async for line in lines]
+
+
+async def remote_or(directory, field, coroutine):
+
+    ''' Field as known by the gfcc daemon serving directory, the result of coroutine if there is none '''
+
+    remote = daemon.query_status(directory, field) if directory else None
+    if remote is not None:
+        coroutine.close()
+        return remote
+    return await coroutine
+
+
+async def get_working_view_name():
+    remote = daemon.query_status(getcwd(), 'view')
+    if remote:
+        return remote
+    return utils.view_name_from_pwv((await run_cmd(['cleartool', 'pwv'], get_lines=True))[0])
+
+
+async def list_checked_out(directory=None, absolute=False):
+    return utils.filter_checked_out(await collect(stream_cmd(utils.LIST_CHECKED_OUT_CMD)), directory, absolute)
+
+
+async def list_untracked(directory):
+    directory = directory or '.'
+    clearcase_cmd_find_untracked = ['cleartool', 'ls', '-rec', '-view_only', directory]
+    return list(utils.filter_untracked(await collect(stream_cmd(clearcase_cmd_find_untracked)), directory))
+
+
+async def cc_lshist(item, lines=15, recursive=False):
+    return (await run_cmd(utils.lshist_cmd(item, lines, recursive), True))[0]
+
+
+async def predecessor_versions(to_check, batch_size=None):
+
+    ''' Async utils.predecessor_versions, the describe batches run concurrently '''
+
+    batch_size = batch_size or utils.BATCH_SIZE
+    chunks = [to_check[start:start + batch_size] for start in range(0, len(to_check), batch_size)]
+    outputs = await asyncio.gather(*[run_cmd(utils.predecessors_cmd(chunk), True) for chunk in chunks])
+    predecessors = {}
+    for chunk, (output, _) in zip(chunks, outputs):
+        predecessors.update(utils.parse_predecessors(output, chunk))
+    return predecessors
+
+
+async def find_modifications(to_check, context=textdiff.DEFAULT_CONTEXT, ignore_whitespace=False):
+
+    ''' Async utils.find_modifications for a list of files, the diffs run on the default executor '''
+
+    to_check = list(to_check)
+    files = [file_i for file_i in to_check if not isdir(file_i)]
+    predecessors = await predecessor_versions(files) if files else {}
+    loop = asyncio.get_running_loop()
+
+    async def diff(file_i):
+        async with limiter():
+            return await loop.run_in_executor(
+                None, utils.diff_predecessor, file_i, predecessors.get(file_i), context, ignore_whitespace)
+
+    results = await asyncio.gather(*[diff(file_i) for file_i in to_check])
+    for file_i, (_, error) in zip(to_check, results):
+        if error:
+            utils.print_indent('Error: could not diff ' + file_i + ': ' + error.split('\n')[0], 1)
+    return [output for output, _ in results if output]
+
+
+async def label_versions(label, directory, errors):
+
+    ''' Yield the (element, version) pairs labeled with label under directory as cleartool finds them '''
+
+    async for line in stream_cmd(utils.label_find_cmd(label, directory), errors):
+        element, version = ccfmt.split_version_path(line)
+        if element:
+            yield normpath(element), version
+
+
+def version_key(pair):
+    return paths.sort_key(pair[0])
+
+
+def spill_run(run):
+
+    ''' Temporary file holding a sorted run of (element, version) pairs, one JSON list per line '''
+
+    run_file = tempfile.TemporaryFile(mode='w+')
+    for pair in run:
+        run_file.write(json.dumps(pair) + '\n')
+    run_file.seek(0)
+    return run_file
+
+
+def read_run(run_file):
+    with run_file:
+        for line in run_file:
+            yield tuple(json.loads(line))
+
+
+async def sorted_versions(stream):
+
+    ''' Iterator over the (element, version) pairs of stream sorted by paths.sort_key of the element. Runs of
+        SORT_RUN_SIZE pairs are sorted and spilled to temporary files, then merged, so memory stays bounded in
+        whatever order cleartool lists the elements '''
+
+    runs = []
+    run = []
+    async for pair in stream:
+        run.append(pair)
+        if len(run) >= SORT_RUN_SIZE:
+            run.sort(key=version_key)
+            runs.append(spill_run(run))
+            run = []
+    run.sort(key=version_key)
+    return heapq.merge(run, *[read_run(run_file) for run_file in runs], key=version_key)
+
+
+def merge_versions(sorted_a, sorted_b):
+
+    ''' utils.versions_diff of two iterators of (element, version) pairs sorted by element, walked side by side '''
+
+    only_a, only_b, different = {}, {}, {}
+    pair_a, pair_b = next(sorted_a, None), next(sorted_b, None)
+    while pair_a or pair_b:
+        key_a = version_key(pair_a) if pair_a else None
+        key_b = version_key(pair_b) if pair_b else None
+        if pair_b is None or (pair_a and key_a < key_b):
+            only_a[pair_a[0]] = pair_a[1]
+            pair_a = next(sorted_a, None)
+        elif pair_a is None or key_b < key_a:
+            only_b[pair_b[0]] = pair_b[1]
+            pair_b = next(sorted_b, None)
+        else:
+            if pair_a[1] != pair_b[1]:
+                different[pair_a[0]] = (pair_a[1], pair_b[1])
+            pair_a, pair_b = next(sorted_a, None), next(sorted_b, None)
+    return only_a, only_b, different
+
+
+async def versions_diff_streams(stream_a, stream_b):
+
+    ''' utils.versions_diff of two streams of (element, version) pairs, consumed concurrently. Each stream is
+        sorted with bounded memory (sorted_versions) and both are then merged, so only the differences are kept.
+        Returns ({element: version} only in a, {element: version} only in b, {element: (version_a, version_b)}) '''
+
+    sorted_a, sorted_b = await asyncio.gather(sorted_versions(stream_a), sorted_versions(stream_b))
+    return merge_versions(sorted_a, sorted_b)
+
+
+async def diff_labels(label_a, label_b, directories):
+
+    ''' {directory: (a_not_b, b_not_a, diff_v, errors)} of the versions labeled with label_a and label_b,
+        every directory and label is queried concurrently '''
+
+    async def diff_directory(directory):
+        errors = []
+        result = await versions_diff_streams(
+            label_versions(label_a, directory, errors), label_versions(label_b, directory, errors))
+        return result + (errors,)
+
+    results = await asyncio.gather(*[diff_directory(directory) for directory in directories])
+    return dict(zip(directories, results))
+
+
+async def get_file_versions(cs_filename=None, view=False, file_path='', get_latest=False):
+
+    ''' Async utils.get_file_versions, run on the default executor since it may switch the cs of the view '''
+
+    return await asyncio.get_running_loop().run_in_executor(
+        None, utils.get_file_versions, cs_filename, view, file_path, get_latest)
+
+
+async def status(item=None, whole_view=False, get_modified=False, get_untracked=False, get_checkedout_unmodified=False):
+
+    ''' Async utils.get_status, the checked-out and untracked queries overlap '''
+
+    directory = utils.status_directory(item, whole_view)
+    loop = asyncio.get_running_loop()
+    untracked = asyncio.ensure_future(remote_or(directory, 'untracked', list_untracked(directory))) \
+        if get_untracked else None
+
+    modified = []
+    unmodified = []
+    if get_modified or get_checkedout_unmodified:
+        checked_out = await remote_or(directory, 'checked_out', list_checked_out(directory))
+        remote = daemon.query_status(directory, 'modifications') if directory else None
+        if remote is not None:
+            modified = [utils.filename_from_diff(changed) for changed in remote]
+        else:
+            modified = await loop.run_in_executor(None, utils.modified_files, checked_out)
+        if get_checkedout_unmodified:
+            unmodified = list(set(checked_out) - set(modified))
+    return (
+        utils.to_abs_path(modified) if get_modified else [],
+        utils.to_abs_path(await untracked) if get_untracked else [],
+        utils.to_abs_path(unmodified),
+    )
+
+
+async def view_and_status(items, whole_view=False, **requested):
+
+    ''' Working view name and the status of every item, all queried concurrently '''
+
+    return await asyncio.gather(
+        get_working_view_name(),
+        asyncio.gather(*[status(item, whole_view, **requested) for item in items]),
+    )
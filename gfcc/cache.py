@@ -0,0 +1,471 @@
+import os
+import json
+import time
+import hashlib
+import tempfile
+import threading
+
+from   os.path  import join, exists, expanduser, dirname
+
+
+# Constants
+CACHE_DIR = os.environ.get('GFCC_CACHE_DIR') or join(os.environ.get('XDG_CACHE_HOME') or expanduser('~/.cache'), 'gfcc')
+CACHE_SIZE = int(float(os.environ.get('GFCC_CACHE_SIZE_MB', 512)) * 1024 * 1024)
+# Files modified this close to a stat index check are verified by content, covers coarse mtime resolution
+RACY_MARGIN_NS = 2 * 10**9
+# Read-only cleartool subcommands whose output is reused for the rest of the run
+MEMOIZED_SUBCOMMANDS = ('pwv', 'catcs', 'ls', 'lsco', 'describe', 'desc', 'lshistory', 'lshist', 'find', 'lsvtree')
+# Read-only subcommands that are never memoized but do not make other results stale either
+UNCACHED_SUBCOMMANDS = ('diff', 'get', 'xlsvtree')
+VERSION_QUERIES = ('ls', 'lsco', 'describe', 'desc', 'lshistory', 'lshist', 'find', 'lsvtree')
+# Memoized subcommands made stale by each mutating subcommand, any other subcommand drops everything
+INVALIDATED_BY = {
+    'setcs': ('catcs', 'ls', 'describe', 'desc', 'find', 'lsvtree'),
+    'co': VERSION_QUERIES, 'checkout': VERSION_QUERIES,
+    'ci': VERSION_QUERIES, 'checkin': VERSION_QUERIES,
+    'unco': VERSION_QUERIES, 'uncheckout': VERSION_QUERIES,
+    'mkelem': VERSION_QUERIES, 'mkdir': VERSION_QUERIES,
+}
+
+
+def atomic_write(path, data):
+
+    ''' Write bytes to path so that concurrent readers never see a partial file '''
+
+    os.makedirs(dirname(path), exist_ok=True)
+    file_descriptor, temp_path = tempfile.mkstemp(dir=dirname(path), prefix='.tmp')
+    try:
+        with os.fdopen(file_descriptor, 'wb') as temp_file:
+            temp_file.write(data)
+        os.replace(temp_path, path)
+    except BaseException:
+        if exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+class VersionCache:
+
+    ''' Content-addressed store of immutable version contents, keyed by version-extended path, LRU evicted '''
+
+    def __init__(self, directory=None, max_size=None):
+        self.directory = directory or join(CACHE_DIR, 'versions')
+        self.max_size = CACHE_SIZE if max_size is None else max_size
+        self.size = None
+        self.lock = threading.Lock()
+
+    def _key_path(self, version_path):
+        digest = hashlib.sha1(version_path.encode('utf-8')).hexdigest()
+        return join(self.directory, 'keys', digest[:2], digest[2:])
+
+    def _object_path(self, content_hash):
+        return join(self.directory, 'objects', content_hash[:2], content_hash[2:])
+
+    def get(self, version_path):
+
+        ''' Cached bytes of version_path, or None '''
+
+        try:
+            with open(self._key_path(version_path)) as key_file:
+                object_path = self._object_path(key_file.read().strip())
+            with open(object_path, 'rb') as object_file:
+                data = object_file.read()
+            os.utime(object_path)
+        except OSError:
+            return None
+        return data
+
+    def put(self, version_path, data):
+
+        ''' Store the bytes of version_path, evicting the least recently used objects if over max_size '''
+
+        content_hash = hashlib.sha256(data).hexdigest()
+        object_path = self._object_path(content_hash)
+        try:
+            added = 0
+            if not exists(object_path):
+                atomic_write(object_path, data)
+                added = len(data)
+            atomic_write(self._key_path(version_path), content_hash.encode('utf-8'))
+        except OSError:
+            return False
+        with self.lock:
+            if self.size is None:
+                self.size = sum(size for _, size, _ in self._objects())
+            else:
+                self.size += added
+            if self.size > self.max_size:
+                self.evict()
+        return True
+
+    def _objects(self):
+        objects_dir = join(self.directory, 'objects')
+        for root, _, files in os.walk(objects_dir):
+            for file_i in files:
+                path = join(root, file_i)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield path, stat.st_size, stat.st_mtime
+
+    def evict(self):
+
+        ''' Remove least recently used objects until the cache is below 90% of max_size '''
+
+        objects = sorted(self._objects(), key=lambda x: x[2])
+        self.size = sum(size for _, size, _ in objects)
+        for path, size, _ in objects:
+            if self.size <= 0.9 * self.max_size:
+                break
+            try:
+                os.remove(path)
+                self.size -= size
+            except OSError:
+                pass
+        for root, _, files in os.walk(join(self.directory, 'keys')):
+            for file_i in files:
+                key_path = join(root, file_i)
+                try:
+                    with open(key_path) as key_file:
+                        if not exists(self._object_path(key_file.read().strip())):
+                            os.remove(key_path)
+                except OSError:
+                    pass
+
+
+_version_cache = None
+
+
+def get_version_cache():
+
+    ''' Shared VersionCache, None if disabled with GFCC_NO_CACHE=1 '''
+
+    global _version_cache
+    if os.environ.get('GFCC_NO_CACHE'):
+        return None
+    if _version_cache is None:
+        _version_cache = VersionCache()
+    return _version_cache
+
+
+class QueryMemo:
+
+    ''' In-process results of read-only cleartool queries, dropped when a mutating command may have changed them '''
+
+    def __init__(self):
+        self.results = {}
+        self.lock = threading.Lock()
+
+    def _key(self, argv):
+        return os.getcwd(), tuple(argv)
+
+    def get(self, argv):
+
+        ''' Stored (stdout, stderr, status) of a previous identical query, or None '''
+
+        if not is_cleartool(argv) or argv[1] not in MEMOIZED_SUBCOMMANDS:
+            return None
+        with self.lock:
+            return self.results.get(self._key(argv))
+
+    def update(self, argv, result=None):
+
+        ''' Remember a successful read-only query, or forget what a mutating command may have changed '''
+
+        if not is_cleartool(argv):
+            return
+        subcommand = argv[1]
+        if subcommand in MEMOIZED_SUBCOMMANDS:
+            if result and not result[2] and 'Error' not in result[1] and '-view_only' not in argv:
+                with self.lock:
+                    self.results[self._key(argv)] = result
+        elif mutates(argv):
+            stale = INVALIDATED_BY.get(subcommand)
+            with self.lock:
+                if stale is None:
+                    self.results = {}
+                else:
+                    self.results = {key: value for key, value in self.results.items() if key[1][1] not in stale}
+
+    def clear(self):
+        with self.lock:
+            self.results = {}
+
+
+def is_cleartool(argv):
+    return bool(argv) and len(argv) > 1 and os.path.basename(argv[0]) == 'cleartool'
+
+
+def mutates(argv):
+
+    ''' Whether a cleartool command may change the view, anything not known to be read-only is assumed to '''
+
+    return is_cleartool(argv) and argv[1] not in MEMOIZED_SUBCOMMANDS and argv[1] not in UNCACHED_SUBCOMMANDS
+
+
+_query_memo = None
+
+
+def get_query_memo():
+
+    ''' Shared QueryMemo, None if disabled with GFCC_NO_CACHE=1 '''
+
+    global _query_memo
+    if os.environ.get('GFCC_NO_CACHE'):
+        return None
+    if _query_memo is None:
+        _query_memo = QueryMemo()
+    return _query_memo
+
+
+class StatIndex:
+
+    ''' Stat data, content hash and last modified/identical verdict of checked-out files, like the git index.
+        A verdict is reused while the size, mtime, ctime and inode of the file stay the same. '''
+
+    def __init__(self, path=None):
+        view_key = hashlib.sha1(os.environ.get('CLEARCASE_ROOT', '').encode('utf-8')).hexdigest()
+        self.path = path or join(CACHE_DIR, 'index', view_key + '.json')
+        self.entries = None
+        self.changed = False
+        self.lock = threading.Lock()
+
+    def _load(self):
+        if self.entries is None:
+            try:
+                with open(self.path) as index_file:
+                    self.entries = json.load(index_file)
+            except (OSError, ValueError):
+                self.entries = {}
+
+    def lookup(self, path):
+
+        ''' Last verdict (True if modified) for path if it did not change since, None otherwise '''
+
+        signature = stat_signature(path)
+        with self.lock:
+            self._load()
+            entry = self.entries.get(path)
+        if not entry or not signature or entry['stat'] != signature:
+            return None
+        # Racily clean: written so close to the check that the mtime may not show a later change
+        if signature[1] >= entry['checked_ns'] - RACY_MARGIN_NS and file_hash(path) != entry['hash']:
+            return None
+        return entry['modified']
+
+    def snapshot(self, path):
+
+        ''' (stat signature, content hash, time) of path, taken before it is diffed '''
+
+        return stat_signature(path), file_hash(path), time.time_ns()
+
+    def record(self, path, snapshot, modified):
+        signature, content_hash, checked_ns = snapshot
+        if not signature or not content_hash:
+            return
+        with self.lock:
+            self._load()
+            self.entries[path] = {'stat': signature, 'hash': content_hash, 'checked_ns': checked_ns, 'modified': modified}
+            self.changed = True
+
+    def forget(self, paths):
+        with self.lock:
+            self._load()
+            for path in paths:
+                if self.entries.pop(path, None) is not None:
+                    self.changed = True
+
+    def save(self):
+        with self.lock:
+            if not self.changed:
+                return
+            try:
+                atomic_write(self.path, json.dumps(self.entries).encode('utf-8'))
+                self.changed = False
+            except OSError:
+                pass
+
+
+def stat_signature(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns, stat.st_ctime_ns, stat.st_ino]
+
+
+def file_hash(path):
+    try:
+        with open(path, 'rb') as hashed_file:
+            return hashlib.sha1(hashed_file.read()).hexdigest()
+    except OSError:
+        return None
+
+
+_stat_index = None
+
+
+def get_stat_index():
+
+    ''' Shared StatIndex, None if disabled with GFCC_NO_CACHE=1 '''
+
+    global _stat_index
+    if os.environ.get('GFCC_NO_CACHE'):
+        return None
+    if _stat_index is None:
+        _stat_index = StatIndex()
+    return _stat_index
+
+
+class ManifestStore:
+
+    ''' On-disk snapshots of get_file_versions scans, keyed by config spec hash, view and directory '''
+
+    def __init__(self, directory=None):
+        self.directory = directory or join(CACHE_DIR, 'manifests')
+
+    def key(self, cs_text, view, directory, query='ls'):
+
+        ''' Key of a scan, cs_text is None for queries that do not depend on the config spec '''
+
+        cs_hash = hash_lines(cs_text) if cs_text is not None else '-'
+        return hashlib.sha1('\0'.join([cs_hash, view or '', directory, query]).encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return join(self.directory, key[:2], key[2:] + '.json')
+
+    def load(self, key):
+
+        ''' Stored manifest for key as a dict with "files" and its metadata, or None '''
+
+        try:
+            with open(self._path(key)) as manifest_file:
+                return json.load(manifest_file)
+        except (OSError, ValueError):
+            return None
+
+    def save(self, key, files, created=None, **metadata):
+
+        ''' Store a scan, created is when the scan started (defaults to now) '''
+
+        manifest = dict(metadata, key=key, created=created or time.time(), files=files)
+        try:
+            atomic_write(self._path(key), json.dumps(manifest).encode('utf-8'))
+        except OSError:
+            return None
+        return manifest
+
+    def snapshots(self, view=None, directory=None):
+
+        ''' Metadata of all the stored manifests, most recent first, optionally filtered by view/directory '''
+
+        found = []
+        for root, _, files in os.walk(self.directory):
+            for file_i in files:
+                if not file_i.endswith('.json'):
+                    continue
+                manifest = self.load(os.path.basename(root) + file_i[:-len('.json')])
+                if not manifest:
+                    continue
+                if (view and manifest.get('view') != view) or (directory and manifest.get('directory') != directory):
+                    continue
+                found.append({name: value for name, value in manifest.items()
+                              if name not in ('files', 'directory_mtimes', 'checked_out')})
+        return sorted(found, key=lambda x: x.get('created', 0), reverse=True)
+
+
+class HistoryStore:
+
+    ''' Parsed lshistory events of directory trees. History only grows, so a stored tree is extended with the
+        events since it was last queried instead of being fetched again. Events are appended to a file as rows,
+        one JSON list per query, next to a small file with the time of the last query and the scope (view, cs
+        and checked-out directories) the rows were listed in. Rows stored for another scope are discarded. '''
+
+    def __init__(self, directory=None):
+        self.directory = directory or join(CACHE_DIR, 'history')
+
+    def _path(self, root, extension='.json'):
+        return join(self.directory, hashlib.sha1(root.encode('utf-8')).hexdigest() + extension)
+
+    def find(self, path):
+
+        ''' Nearest directory stored that contains path (or is path), None if there is none '''
+
+        candidate = os.path.normpath(os.path.abspath(path))
+        while True:
+            if os.path.exists(self._path(candidate)):
+                return candidate
+            parent = os.path.dirname(candidate)
+            if parent == candidate:
+                return None
+            candidate = parent
+
+    def load(self, root, scope=None):
+
+        ''' (time of the last query, list of event rows) stored for root in scope, (None, []) if there is nothing '''
+
+        try:
+            with open(self._path(root)) as meta_file:
+                meta = json.load(meta_file)
+            if meta.get('scope') != scope:
+                return None, []
+            rows = []
+            with open(self._path(root, '.events')) as events_file:
+                for line in events_file:
+                    rows.extend(json.loads(line))
+            return meta['last_seen'], rows
+        except (OSError, ValueError, KeyError):
+            return None, []
+
+    def append(self, root, rows, last_seen, scope=None, replace=False):
+
+        ''' Add rows to those stored for root, replace drops the stored ones first '''
+
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            if rows or replace:
+                with open(self._path(root, '.events'), 'w' if replace else 'a') as events_file:
+                    if rows:
+                        events_file.write(json.dumps(rows) + '\n')
+            meta = {'root': root, 'scope': scope, 'last_seen': last_seen}
+            atomic_write(self._path(root), json.dumps(meta).encode('utf-8'))
+        except OSError:
+            pass
+
+
+_history_store = None
+
+
+def get_history_store():
+
+    ''' Shared HistoryStore, None if disabled with GFCC_NO_CACHE=1 '''
+
+    global _history_store
+    if os.environ.get('GFCC_NO_CACHE'):
+        return None
+    if _history_store is None:
+        _history_store = HistoryStore()
+    return _history_store
+
+
+def hash_lines(lines):
+
+    ''' Stable hash of a text given as list of lines, ignoring trailing whitespace '''
+
+    return hashlib.sha1('\n'.join(line.rstrip() for line in lines).strip().encode('utf-8')).hexdigest()
+
+
+_manifest_store = None
+
+
+def get_manifest_store():
+
+    ''' Shared ManifestStore, None if disabled with GFCC_NO_CACHE=1 '''
+
+    global _manifest_store
+    if os.environ.get('GFCC_NO_CACHE'):
+        return None
+    if _manifest_store is None:
+        _manifest_store = ManifestStore()
+    return _manifest_store
@@ -0,0 +1,134 @@
+from   collections import namedtuple
+
+
+# Constants
+FIELD_SEPARATOR = '\t'
+LS_RULE_SEPARATOR = ' Rule: '
+LS_SYMLINK_SEPARATOR = ' --> '
+
+LsRecord = namedtuple('LsRecord', ['element', 'version', 'rule'])
+
+
+class Format:
+
+    ''' A cleartool -fmt string that prints one record per line with its fields separated by tabs.
+        Lines are split at most len(fields) - 1 times, so the last field is kept whole and may hold spaces or tabs:
+        element paths and comments go there. With a marker, lines that do not start with it are continuation lines
+        of the last field of the previous record (multi-line comments). '''
+
+    def __init__(self, name, directives, marker=''):
+        self.fields = tuple(field for field, _ in directives)
+        self.fmt = (marker + '\\t' if marker else '') + '\\t'.join(directive for _, directive in directives) + '\\n'
+        self.prefix = marker + FIELD_SEPARATOR if marker else ''
+        self.record = namedtuple(name, self.fields)
+
+    def args(self):
+        return ['-fmt', self.fmt]
+
+    def parse_line(self, line):
+
+        ''' Record printed in line, None if it is not one '''
+
+        if self.prefix:
+            if not line.startswith(self.prefix):
+                return None
+            line = line[len(self.prefix):]
+        values = line.split(FIELD_SEPARATOR, len(self.fields) - 1)
+        return self.record._make(values) if len(values) == len(self.fields) else None
+
+    def parse(self, lines):
+
+        ''' Yield the records printed in lines '''
+
+        record = None
+        for line in lines:
+            parsed = self.parse_line(line)
+            if parsed:
+                if record:
+                    yield record
+                record = parsed
+            elif record and self.prefix and line:
+                record = record._replace(**{self.fields[-1]: record[-1] + '\n' + line})
+        if record:
+            yield record
+
+
+# Formats
+VERSION = Format('Version', [('version', '%Vn'), ('element', '%En')])
+PREDECESSOR = Format('Predecessor', [('predecessor', '%PVn'), ('element', '%En')])
+LABELED_VERSION = Format('LabeledVersion', [('version', '%Vn'), ('labels', '%Nl'), ('element', '%En')])
+TREE_VERSION = Format('TreeVersion', [('kind', '%m'), ('version', '%Vn'), ('labels', '%Nl'), ('element', '%En')])
+EVENT = Format('Event', [
+    ('date', '%Nd'), ('user', '%u'), ('operation', '%o'), ('kind', '%m'), ('element', '%En'), ('version', '%Vn'),
+    ('event', '%e'), ('comment', '%Nc'),
+], marker='GFCC_EVENT')
+
+
+# Commands without -fmt
+
+def parse_ls_line(line):
+
+    ''' LsRecord of a cleartool ls line such as
+            dir/file.c@@/main/br/CHECKEDOUT from /main/br/3     Rule: CHECKEDOUT
+        version and rule are empty for view-private files, None for empty lines '''
+
+    body, found, rule = line.rpartition(LS_RULE_SEPARATOR)
+    if not found:
+        body, rule = line, ''
+    element, found, version = body.partition('@@')
+    if found:
+        # Anything after the version: "from /main/3", "[hijacked]", "[loaded but missing]"...
+        version = version.split(' ', 1)[0]
+    else:
+        element = element.partition(LS_SYMLINK_SEPARATOR)[0]
+    element = element.rstrip()
+    return LsRecord(element, version.strip(), rule.strip()) if element else None
+
+
+def split_version_path(line):
+
+    ''' (element, version) of a path@@version line (find -print, describe -short...), (None, None) if there is none '''
+
+    element, found, version = line.rpartition('@@')
+    return (element, version) if found and element else (None, None)
+
+
+def quoted_after(line, keyword):
+
+    ''' First quoted string after keyword in line, as in: Checked in "file" version "/main/3". '''
+
+    _, found, rest = line.partition(keyword + ' "')
+    return rest.partition('"')[0] if found else None
+
+
+def quoted(line):
+
+    ''' Every quoted string in line '''
+
+    return line.split('"')[1:-1:2]
+
+
+def parse_pwv(lines):
+
+    ''' Set view of cleartool pwv, None if there is none '''
+
+    for line in lines:
+        key, _, value = line.partition(': ')
+        if key == 'Set view':
+            value = value.strip()
+            return value if value and value != '** NONE **' else None
+    return None
+
+
+def diff_filename(text):
+
+    ''' Compared file of a unified diff (+++ line) or of a cleartool diff header (file 2: line) '''
+
+    for line in text.split('\n'):
+        if line.startswith('+++ '):
+            return line[4:]
+        for header in ('file 2: ', 'directory 2: '):
+            _, found, name = line.partition(header)
+            if found:
+                return name.strip()
+    return None
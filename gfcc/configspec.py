@@ -0,0 +1,310 @@
+import re
+
+
+# Constants
+LABEL_SELECTOR = re.compile(r'^[A-Za-z_][\w.\-]*$')
+VERSION_NUMBER = re.compile(r'^(?P<branch>.*)/(?P<number>\d+)$')
+
+
+class UnsupportedRule(Exception):
+    ''' The config spec uses something that can only be resolved by ClearCase itself '''
+
+
+class Rule:
+
+    ''' One element rule: [element_type] pattern version_selector [-mkbranch branch] '''
+
+    def __init__(self, pattern, selector, element_type=None, mkbranch=None, text=''):
+        self.pattern = pattern
+        self.selector = selector
+        self.element_type = element_type
+        self.mkbranch = mkbranch
+        self.text = text
+        self.regex = pattern_to_regex(pattern)
+
+    def __repr__(self):
+        return 'Rule(' + repr(self.text) + ')'
+
+    def matches(self, path, kind):
+        if self.element_type == '-file' and kind == 'directory':
+            return False
+        if self.element_type == '-directory' and kind != 'directory':
+            return False
+        return bool(self.regex.match(path))
+
+    def rule_text(self):
+
+        ''' Rule as shown by cleartool ls '''
+
+        return self.selector + ((' -mkbranch ' + self.mkbranch) if self.mkbranch else '')
+
+
+def pattern_to_regex(pattern):
+
+    ''' Compile an element rule pattern (*, ?, ... and [] wildcards) into a regex over absolute paths '''
+
+    if '/' not in pattern:
+        return re.compile(r'^(?:.*/)?' + glob_component(pattern) + r'$')
+    regex = ''
+    for component in pattern.strip('/').split('/'):
+        if component == '...':
+            regex += r'(?:/[^/]+)*'
+        else:
+            regex += '/' + glob_component(component)
+    # Relative patterns match at any depth
+    return re.compile(('^' if pattern.startswith(('/', '...')) else '^.*') + regex + '$')
+
+
+def glob_component(component):
+
+    ''' Regex for a single path component with * ? and [] wildcards '''
+
+    regex = ''
+    index = 0
+    while index < len(component):
+        char = component[index]
+        if char == '*':
+            regex += '[^/]*'
+        elif char == '?':
+            regex += '[^/]'
+        elif char == '[':
+            end = component.find(']', index)
+            if end < 0:
+                regex += re.escape(char)
+            else:
+                regex += '[' + component[index + 1:end].replace('\\', '\\\\') + ']'
+                index = end
+        else:
+            regex += re.escape(char)
+        index += 1
+    return regex
+
+
+def strip_comment(line):
+    return line.split('#', 1)[0].strip()
+
+
+def parse(cs_lines, read_include=None):
+
+    ''' Parse config spec lines into element rules, includes are read with read_include(path) '''
+
+    rules = []
+    mkbranch_stack = []
+    for line in cs_lines:
+        text = strip_comment(line)
+        if not text:
+            continue
+        words = text.split()
+        keyword = words[0]
+        if keyword == 'element':
+            rules.append(parse_element_rule(words[1:], mkbranch_stack[-1] if mkbranch_stack else None, text))
+        elif keyword == 'mkbranch':
+            mkbranch_stack.append(words[1] if len(words) > 1 else None)
+        elif keyword == 'end':
+            if len(words) > 1 and words[1] == 'mkbranch' and mkbranch_stack:
+                mkbranch_stack.pop()
+            else:
+                raise UnsupportedRule(text)
+        elif keyword == 'include':
+            if len(words) < 2 or not read_include:
+                raise UnsupportedRule(text)
+            included = read_include(words[1])
+            if included is None:
+                raise UnsupportedRule(text)
+            rules.extend(parse(included, read_include))
+        elif keyword == 'load':
+            continue
+        else:
+            raise UnsupportedRule(text)
+    return rules
+
+
+def parse_element_rule(words, mkbranch=None, text=''):
+    element_type = None
+    if words and words[0].startswith('-'):
+        element_type = words.pop(0)
+        if element_type not in ('-file', '-directory'):
+            raise UnsupportedRule(text)
+    if len(words) < 2:
+        raise UnsupportedRule(text)
+    pattern, selector = words[0], words[1]
+    if selector.startswith('{'):
+        raise UnsupportedRule(text)
+    options = words[2:]
+    while options:
+        option = options.pop(0)
+        if option == '-mkbranch' and options:
+            mkbranch = options.pop(0)
+        elif option == '-nocheckout':
+            continue
+        else:
+            raise UnsupportedRule(text)
+    return Rule(pattern, selector, element_type, mkbranch, text)
+
+
+def branch_matches(branch_pattern, branch):
+    if branch_pattern.startswith('.../'):
+        return branch == '/' + branch_pattern[4:] or branch.endswith('/' + branch_pattern[4:])
+    return branch == branch_pattern
+
+
+def select_version(selector, tree, checked_out_version=None):
+
+    ''' Version of an element chosen by a version selector, None if the selector picks nothing '''
+
+    versions = tree['versions']
+    if selector == 'CHECKEDOUT':
+        return checked_out_version
+    if LABEL_SELECTOR.match(selector):
+        for version, labels in versions.items():
+            if selector in labels:
+                return version
+        return None
+    if selector.endswith('/LATEST'):
+        branch_pattern = selector[:-len('/LATEST')]
+        latest = None
+        for version in versions:
+            matched = VERSION_NUMBER.match(version)
+            if matched and branch_matches(branch_pattern, matched.group('branch')):
+                number = int(matched.group('number'))
+                if latest is None or number > latest[0]:
+                    latest = (number, version)
+        return latest[1] if latest else None
+    matched = VERSION_NUMBER.match(selector)
+    if matched:
+        for version in versions:
+            version_matched = VERSION_NUMBER.match(version)
+            if version_matched and version_matched.group('number') == matched.group('number') \
+                    and branch_matches(matched.group('branch'), version_matched.group('branch')):
+                return version
+        return None
+    raise UnsupportedRule(selector)
+
+
+def select(rules, path, tree, checked_out_version=None):
+
+    ''' {'version', 'rule'} chosen for an element by the first rule that matches it and selects a version, or None '''
+
+    for rule in rules:
+        if not rule.matches(path, tree.get('kind')):
+            continue
+        version = select_version(rule.selector, tree, checked_out_version)
+        if version:
+            return {'version': version, 'rule': rule.rule_text()}
+    return None
+
+
+def latest_on_main(trees, excluded_label=None):
+
+    ''' {element_path: {'version', 'rule'}} with the /main/LATEST version of every element '''
+
+    latest = {}
+    for path, tree in trees.items():
+        version = select_version('/main/LATEST', tree)
+        if version and not (excluded_label and excluded_label in tree['versions'][version]):
+            latest[path] = {'version': version, 'rule': ''}
+    return latest
+
+
+SECTION_SUBDIRS = ('rtl', 'tb', 'syn', 'sim', 'cs')
+WILDCARDS = re.compile(r'[*?\[]|\.\.\.')
+
+
+class ConfigSpec:
+
+    ''' Config spec lines (kept verbatim) with an index of comment sections and explicit element rules.
+        Rule insertions are queued with add_rule() and written all at once by apply(). '''
+
+    def __init__(self, lines):
+        self.lines = [line.rstrip('\n') for line in lines]
+        self.pending = []
+        self._index()
+
+    def _index(self):
+        self.sections = {}
+        self.elements = {}
+        self.checkedout_line = None
+        for index, line in enumerate(self.lines):
+            self._index_line(index, line)
+
+    def _index_line(self, index, line):
+        for subdir in SECTION_SUBDIRS:
+            if subdir not in self.sections and re.match(r'\s*#+\s*(' + subdir + '|' + subdir.upper() + ')', line):
+                self.sections[subdir] = index
+        if 'wip' not in self.sections and re.match(r'\s*#+\s*Work in progress:', line):
+            self.sections['wip'] = index
+        if self.checkedout_line is None and re.match(r'.*element.*\bCHECKEDOUT\b', line):
+            self.checkedout_line = index
+        words = strip_comment(line).split()
+        # The first explicit rule of an element is the one that applies, inserted lines may come before it
+        if len(words) >= 3 and words[0] == 'element' and not WILDCARDS.search(words[1]) \
+                and index < self.elements.get(words[1], index + 1):
+            self.elements[words[1]] = index
+
+    def _shift(self, position, count):
+        self.sections = {name: (index + count if index >= position else index) for name, index in self.sections.items()}
+        self.elements = {name: (index + count if index >= position else index) for name, index in self.elements.items()}
+        if self.checkedout_line is not None and self.checkedout_line >= position:
+            self.checkedout_line += count
+
+    def _insert_lines(self, position, new_lines):
+        self.lines[position:position] = new_lines
+        self._shift(position, len(new_lines))
+        for offset, line in enumerate(new_lines):
+            self._index_line(position + offset, line)
+
+    def rules(self):
+
+        ''' Element rules that can be parsed, as (line index, Rule) '''
+
+        found = []
+        for index, line in enumerate(self.lines):
+            words = strip_comment(line).split()
+            if words and words[0] == 'element':
+                try:
+                    found.append((index, parse_element_rule(words[1:], text=strip_comment(line))))
+                except UnsupportedRule:
+                    pass
+        return found
+
+    def rule_for(self, element_path):
+
+        ''' Line of the explicit rule for element_path, or None '''
+
+        index = self.elements.get(element_path)
+        return self.lines[index] if index is not None else None
+
+    def add_rule(self, rule, section=None):
+
+        ''' Queue a rule, it goes into section (rtl, tb, syn, sim, cs) or "Work in progress:" '''
+
+        self.pending.append((rule, section))
+
+    def insert_rule(self, rule, section=None):
+
+        ''' Insert one rule now at the top of its section. An explicit rule for the same element without
+            qualifiers (such as -mkbranch) is superseded by it and commented out, others are left as they are. '''
+
+        if section in self.sections:
+            position, new_lines = self.sections[section] + 1, [rule]
+        elif 'wip' in self.sections:
+            position, new_lines = self.sections['wip'] + 1, [rule]
+        elif self.checkedout_line is not None:
+            position, new_lines = self.checkedout_line + 1, ['', '', '# Work in progress:'] + [rule] + ['', '']
+        else:
+            return False
+        words = rule.split()
+        superseded = self.elements.get(words[1]) if len(words) >= 3 and words[0] == 'element' else None
+        if superseded is not None and len(strip_comment(self.lines[superseded]).split()) == 3:
+            self.lines[superseded] = '# ' + self.lines[superseded]
+            self._index()
+        self._insert_lines(position, new_lines)
+        return True
+
+    def apply(self):
+
+        ''' Insert all the queued rules, returns the rules that could not be placed '''
+
+        failed = [rule for rule, section in self.pending if not self.insert_rule(rule, section)]
+        self.pending = []
+        return failed
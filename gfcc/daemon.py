@@ -0,0 +1,402 @@
+import os
+import sys
+import json
+import time
+import struct
+import socket
+import hashlib
+import tempfile
+import threading
+
+from   os.path  import join, abspath, dirname, exists, isdir
+from   gfcc     import cache
+from   gfcc     import utils
+from   gfcc     import paths
+
+
+# Constants
+IN_MODIFY = 0x2
+IN_ATTRIB = 0x4
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_Q_OVERFLOW = 0x4000
+IN_IGNORED = 0x8000
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+ENTRY_EVENTS = IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+# Seconds after which the daemon reads lsco again, covers checkouts made without gfcc (0: only when notified)
+LSCO_MAX_AGE = float(os.environ.get('GFCC_DAEMON_LSCO_AGE', 300))
+# Seconds without queries after which the daemon exits
+IDLE_TIMEOUT = float(os.environ.get('GFCC_DAEMON_IDLE', 8 * 3600))
+CLIENT_TIMEOUT = 60
+
+
+class ViewStatus:
+
+    ''' Checked-out files, their diffs and view-private files of a directory tree, kept up to date from
+        file system events and refreshed from cleartool only for what the events made stale '''
+
+    def __init__(self, root):
+        self.root = root
+        self.lock = threading.RLock()
+        self.poller = None
+        self.view_name = None
+        self.started = time.time()
+        self.last_query = time.time()
+        self.queries = 0
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.checked_out = None
+            self.checked_out_time = 0
+            self.modifications = {}
+            self.untracked = None
+            self.dirty_dirs = set()
+
+    # Events
+
+    def changed_content(self, path):
+        with self.lock:
+            self.modifications.pop(path, None)
+
+    def changed_entries(self, directory):
+        with self.lock:
+            self.dirty_dirs.add(directory)
+            for path in (self.checked_out.under(directory, include_self=False) if self.checked_out is not None else []):
+                self.modifications.pop(path, None)
+
+    def changed_checkouts(self, paths=()):
+        with self.lock:
+            self.checked_out_time = 0
+            for path in paths:
+                self.modifications.pop(path, None)
+                self.dirty_dirs.add(dirname(path))
+
+    # Queries
+
+    def _refresh_checked_out(self):
+        if self.checked_out is not None and self.checked_out_time and \
+                (not LSCO_MAX_AGE or time.time() - self.checked_out_time < LSCO_MAX_AGE):
+            return
+        self.checked_out_time = time.time()
+        self._forget_queries()
+        self.checked_out = paths.PathIndex(utils.list_checked_out(self.root, absolute=True))
+        self.modifications = {path: diff for path, diff in self.modifications.items() if path in self.checked_out}
+
+    def _refresh_modifications(self, files):
+        stale = [path for path in files if path not in self.modifications]
+        for path, (output, error) in zip(stale, utils.diff_predecessors(stale)):
+            if not error:
+                self.modifications[path] = output
+
+    def _refresh_untracked(self):
+        if self.untracked is None:
+            self._forget_queries()
+            self.dirty_dirs = set()
+            self.untracked = paths.PathIndex(utils.list_untracked(self.root))
+            return
+        dirty = sorted(self.dirty_dirs, key=paths.sort_key)
+        self.dirty_dirs = set()
+        if dirty:
+            self._forget_queries()
+        rescanned = []
+        for directory in dirty:
+            if rescanned and paths.is_under(directory, rescanned[-1]):
+                continue
+            rescanned.append(directory)
+            self.untracked.remove_under(directory)
+            if isdir(directory):
+                self.untracked.update(utils.list_untracked(directory))
+
+    def _forget_queries(self):
+        memo = cache.get_query_memo()
+        if memo:
+            memo.clear()
+
+    def query(self, field, directory):
+
+        ''' Value of a status field restricted to directory '''
+
+        with self.lock:
+            self.queries += 1
+            self.last_query = time.time()
+            if self.poller:
+                self.poller.poll()
+            if field == 'view':
+                if self.view_name is None:
+                    self.view_name = utils.get_working_view_name()
+                return self.view_name
+            if field == 'untracked':
+                self._refresh_untracked()
+                return self.untracked.under(directory)
+            self._refresh_checked_out()
+            checked_out = self.checked_out.under(directory)
+            if field == 'checked_out':
+                return checked_out
+            if field == 'modifications':
+                self._refresh_modifications(checked_out)
+                return [self.modifications[path] for path in checked_out if self.modifications.get(path)]
+            raise ValueError('unknown field ' + str(field))
+
+    def info(self):
+        with self.lock:
+            return {
+                'root': self.root, 'pid': os.getpid(), 'uptime': time.time() - self.started, 'queries': self.queries,
+                'checked_out': None if self.checked_out is None else len(self.checked_out),
+                'untracked': None if self.untracked is None else len(self.untracked),
+                'watcher': 'polling' if self.poller else 'inotify',
+            }
+
+
+class InotifyWatcher:
+
+    ''' Recursive inotify watch of a directory tree, feeding a ViewStatus from its own thread '''
+
+    def __init__(self, root, status):
+        # Only the daemon process needs ctypes, not the commands that query it
+        import ctypes
+        import ctypes.util
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.get_errno = ctypes.get_errno
+        self.add_watch = libc.inotify_add_watch
+        self.fd = libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(self.get_errno(), 'inotify_init1 failed')
+        self.status = status
+        self.watches = {}
+        self.add_tree(root)
+
+    def add_tree(self, directory):
+        for root, _, _ in os.walk(directory):
+            watch = self.add_watch(self.fd, os.fsencode(root), WATCH_MASK)
+            if watch < 0:
+                # Out of watches (fs.inotify.max_user_watches), changes there would go unnoticed
+                raise OSError(self.get_errno(), 'inotify_add_watch failed for ' + root)
+            self.watches[watch] = root
+
+    def run(self):
+        while True:
+            data = os.read(self.fd, 65536)
+            offset = 0
+            while offset < len(data):
+                watch, mask, _, length = struct.unpack_from('iIII', data, offset)
+                name = data[offset + 16:offset + 16 + length].rstrip(b'\0')
+                offset += 16 + length
+                if mask & IN_Q_OVERFLOW:
+                    self.status.reset()
+                    continue
+                directory = self.watches.get(watch)
+                if directory is None:
+                    continue
+                if mask & IN_IGNORED:
+                    self.watches.pop(watch)
+                    continue
+                path = join(directory, os.fsdecode(name)) if name else directory
+                self.dispatch(path, mask)
+
+    def dispatch(self, path, mask):
+        if mask & ENTRY_EVENTS:
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                try:
+                    self.add_tree(path)
+                except OSError:
+                    self.status.reset()
+            self.status.changed_entries(dirname(path))
+        elif mask & IN_DELETE_SELF:
+            self.status.changed_entries(dirname(path))
+        elif mask & IN_ATTRIB:
+            # Checkouts and uncheckouts change the file mode
+            self.status.changed_checkouts([path])
+        elif mask & (IN_MODIFY | IN_CLOSE_WRITE):
+            self.status.changed_content(path)
+
+
+class PollingWatcher:
+
+    ''' Fallback for file systems without inotify (like MVFS): compares directory mtimes and the stats
+        of checked-out files every time the daemon is queried '''
+
+    def __init__(self, root, status):
+        self.root = root
+        self.status = status
+        self.directories = self.scan_directories()
+        self.files = {}
+
+    def scan_directories(self):
+        found = {}
+        for root, _, _ in os.walk(self.root):
+            try:
+                found[root] = os.stat(root).st_mtime_ns
+            except OSError:
+                pass
+        return found
+
+    def poll(self):
+        directories = self.scan_directories()
+        for directory in set(directories) | set(self.directories):
+            if directories.get(directory) != self.directories.get(directory):
+                self.status.changed_entries(directory if directory in directories else dirname(directory))
+        self.directories = directories
+        files = {}
+        for path in self.status.checked_out or []:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files[path] = (stat.st_mtime_ns, stat.st_size, stat.st_mode)
+            previous = self.files.get(path)
+            if previous and previous[2] != stat.st_mode:
+                self.status.changed_checkouts([path])
+            elif previous != files[path]:
+                self.status.changed_content(path)
+        self.files = files
+
+
+def socket_path(root):
+
+    ''' Unix socket of the daemon serving root in the current view (CLEARCASE_ROOT is set by setview) '''
+
+    key = hashlib.sha1((os.environ.get('CLEARCASE_ROOT', '') + '\0' + abspath(root)).encode('utf-8')).hexdigest()[:20]
+    path = join(cache.CACHE_DIR, 'daemon', key + '.sock')
+    if len(path) > 100:
+        # AF_UNIX paths are limited to ~108 bytes
+        path = join(tempfile.gettempdir(), 'gfcc-daemon-' + str(os.getuid()), key + '.sock')
+    return path
+
+
+def find_socket(directory):
+
+    ''' Socket of the daemon serving directory or one of its parents, None if there is none '''
+
+    directory = abspath(directory)
+    while True:
+        path = socket_path(directory)
+        if exists(path):
+            return path
+        parent = dirname(directory)
+        if parent == directory:
+            return None
+        directory = parent
+
+
+def request(directory, message, path=None):
+
+    ''' Send one request to the daemon serving directory, returns its answer or None if there is no daemon '''
+
+    if os.environ.get('GFCC_NO_DAEMON'):
+        return None
+    path = path or find_socket(directory)
+    if not path:
+        return None
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.settimeout(CLIENT_TIMEOUT)
+            client.connect(path)
+            client.sendall(json.dumps(message).encode('utf-8') + b'\n')
+            answer = b''
+            while not answer.endswith(b'\n'):
+                chunk = client.recv(1 << 20)
+                if not chunk:
+                    break
+                answer += chunk
+        answer = json.loads(answer.decode('utf-8'))
+    except (OSError, ValueError):
+        return None
+    return answer if answer.get('ok') else None
+
+
+def query_status(directory, field):
+
+    ''' Status field for directory as known by a daemon, None if no daemon serves it '''
+
+    answer = request(directory, {'query': 'status', 'field': field, 'directory': abspath(directory)})
+    return answer['result'] if answer else None
+
+
+def notify(argv):
+
+    ''' Tell the daemon serving the current directory that a cleartool command changed the view '''
+
+    path = None if os.environ.get('GFCC_NO_DAEMON') else find_socket(os.getcwd())
+    if path:
+        paths = [abspath(arg) for arg in argv[2:] if arg and not arg.startswith('-') and exists(arg)]
+        request(os.getcwd(), {'query': 'invalidate', 'subcommand': argv[1], 'paths': paths}, path)
+
+
+def handle(status, message):
+    query = message.get('query')
+    if query == 'status':
+        return status.query(message['field'], abspath(message.get('directory') or status.root))
+    if query == 'invalidate':
+        if message.get('subcommand') in ('setcs', 'setview', 'edcs'):
+            status.reset()
+        else:
+            status.changed_checkouts(message.get('paths') or [])
+        return True
+    if query == 'ping':
+        return status.info()
+    raise ValueError('unknown query ' + str(query))
+
+
+def serve(root):
+
+    ''' Run the daemon for root in the foreground until stopped or idle for IDLE_TIMEOUT '''
+
+    root = abspath(root)
+    # The daemon must not ask itself or notify itself
+    os.environ['GFCC_NO_DAEMON'] = '1'
+    os.chdir(root)
+    status = ViewStatus(root)
+    try:
+        watcher = InotifyWatcher(root, status)
+        threading.Thread(target=watcher.run, daemon=True).start()
+    except (OSError, AttributeError):
+        status.poller = PollingWatcher(root, status)
+
+    path = socket_path(root)
+    os.makedirs(dirname(path), mode=0o700, exist_ok=True)
+    if exists(path):
+        if request(root, {'query': 'ping'}, path):
+            sys.stderr.write('A gfcc daemon is already running for ' + root + '\n')
+            return False
+        os.remove(path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    server.listen(16)
+    server.settimeout(60)
+    try:
+        while time.time() - status.last_query < IDLE_TIMEOUT:
+            try:
+                connection, _ = server.accept()
+            except socket.timeout:
+                continue
+            with connection:
+                connection.settimeout(CLIENT_TIMEOUT)
+                data = b''
+                while not data.endswith(b'\n'):
+                    chunk = connection.recv(1 << 16)
+                    if not chunk:
+                        break
+                    data += chunk
+                try:
+                    message = json.loads(data.decode('utf-8'))
+                    if message.get('query') == 'stop':
+                        connection.sendall(b'{"ok": true}\n')
+                        break
+                    answer = {'ok': True, 'result': handle(status, message)}
+                except Exception as error:
+                    answer = {'ok': False, 'error': str(error)}
+                try:
+                    connection.sendall(json.dumps(answer).encode('utf-8') + b'\n')
+                except OSError:
+                    pass
+    finally:
+        server.close()
+        if exists(path):
+            os.remove(path)
+    return True
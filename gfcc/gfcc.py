@@ -1,46 +1,137 @@
 import os
 import sys
+import time
 import argparse
+import subprocess
+import importlib.util
 
 from   os      import getcwd, chdir, walk, remove
 from   os.path import abspath, relpath, isdir, basename, join
-from   gfcc import utils
+from   gfcc import trace
+from   gfcc import textdiff
 
 
-# Command parser
-parser = argparse.ArgumentParser()
-subparsers = parser.add_subparsers()
+def lazy_import(name):
 
+    ''' Module loaded the first time one of its attributes is used, so that "gfcc --help" does not import it.
+        LazyLoader is not thread-safe before Python 3.12: main() loads these modules before running a handler, so
+        they are never first used from the worker threads of a command. '''
 
-# Subparser for: gfcc status
-parser_status = subparsers.add_parser('status', aliases=['s'], help='List all new or modified files.')
-parser_status.add_argument(
-    '-u', '--untracked',
-    dest='untracked',
-    choices=['no','normal','all'],
-    default='normal',
-    help='Show untracked files.'
-)
-parser_status.add_argument(
-    '-wv', '--whole-view',
-    dest='whole-view',
-    action='store_true',
-    default=False,
-    help='Show modifications in the whole view.'
-)
-parser_status.add_argument(
-    '-co', '--checked-out',
-    dest='checked-out',
-    action='store_true',
-    default=False,
-    help='Show also files that are checked-out.'
-)
-parser_status.add_argument(
-    'items',
-    nargs='*',
-    help='Get status for a specific item(s).',
-)
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    spec.loader = importlib.util.LazyLoader(spec.loader)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+utils = lazy_import('gfcc.utils')
+daemon = lazy_import('gfcc.daemon')
+aio = lazy_import('gfcc.aio')
+LAZY_MODULES = (utils, daemon, aio)
+
+
+def load_lazy_modules():
+
+    ''' Finish loading the lazy modules on the main thread '''
+
+    for module in LAZY_MODULES:
+        getattr(module, '__file__')
+
+
+# Constants
+GLOBAL_OPTIONS_WITH_VALUE = ('-j', '--jobs', '--trace-file')
+
+# Command registry: {name: (aliases, help, add_arguments, handler)}. Every command is listed in the parser but only
+# the arguments of the one being run are added.
+COMMANDS = {}
+
+
+def register(name, aliases, help_text, add_arguments, handler):
+    COMMANDS[name] = (aliases, help_text, add_arguments, handler)
+
+
+def requested_command(argv):
+
+    ''' Command name or alias in argv, None if there is none '''
 
+    expects_value = False
+    for arg in argv:
+        if expects_value:
+            expects_value = False
+        elif arg in GLOBAL_OPTIONS_WITH_VALUE:
+            expects_value = True
+        elif not arg.startswith('-'):
+            return arg
+    return None
+
+
+def build_parser(argv):
+
+    ''' Command parser for argv '''
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '-j', '--jobs',
+        dest='jobs',
+        type=int,
+        default=None,
+        help='Max number of concurrent cleartool queries (default $GFCC_JOBS or 8).'
+    )
+    parser.add_argument(
+        '--profile',
+        dest='profile',
+        action='store_true',
+        default=False,
+        help='Print the time spent in external commands when done (same as GFCC_TRACE=1).'
+    )
+    parser.add_argument(
+        '--trace-file',
+        dest='trace_file',
+        default=None,
+        help='Also save every external command to this Chrome trace JSON file (same as GFCC_TRACE=<file>).'
+    )
+    subparsers = parser.add_subparsers()
+    requested = requested_command(argv)
+    for name, (aliases, help_text, add_arguments, handler) in COMMANDS.items():
+        subparser = subparsers.add_parser(name, aliases=aliases, help=help_text)
+        if requested in [name] + aliases:
+            if add_arguments:
+                add_arguments(subparser)
+            subparser.set_defaults(func=handler)
+    return parser
+
+
+# Subparser for: gfcc status
+def add_status_arguments(parser_status):
+    parser_status.add_argument(
+        '-u', '--untracked',
+        dest='untracked',
+        choices=['no','normal','all'],
+        default='normal',
+        help='Show untracked files.'
+    )
+    parser_status.add_argument(
+        '-wv', '--whole-view',
+        dest='whole-view',
+        action='store_true',
+        default=False,
+        help='Show modifications in the whole view.'
+    )
+    parser_status.add_argument(
+        '-co', '--checked-out',
+        dest='checked-out',
+        action='store_true',
+        default=False,
+        help='Show also files that are checked-out.'
+    )
+    parser_status.add_argument(
+        'items',
+        nargs='*',
+        help='Get status for a specific item(s).',
+    )
 
 def handler_status(res):
     untracked = getattr(res, 'untracked', None)
@@ -48,14 +139,14 @@ def handler_status(res):
     checked_out = getattr(res, 'checked-out', None)
     items = getattr(res, 'items', None) or [None]
 
-    utils.print_indent('Current view: ' + utils.get_working_view_name(), 0)
+    view_name, statuses = aio.run(aio.view_and_status(
+        items, whole_view,
+        get_modified=True, get_untracked=(untracked != 'no'), get_checkedout_unmodified=bool(checked_out)
+    ))
+    utils.print_indent('Current view: ' + view_name, 0)
 
-    for item in items:
+    for item, (modified_files, untracked_files, checked_out_unmodified) in zip(items, statuses):
         utils.print_indent('Status in ' +  (relpath(item) if item else basename(abspath('.'))) + ':', 0)
-        modified_files, untracked_files, checked_out_unmodified = utils.get_status(
-            get_modified=True, get_untracked=(untracked != 'no'), get_checkedout_unmodified=(checked_out),
-            item=item, whole_view=whole_view
-        )
         utils.print_indent('Modified files:', 1)
         utils.print_indent((utils.to_rel_path(modified_files) or ['None.']), 2)
 
@@ -72,78 +163,102 @@ def handler_status(res):
             utils.print_indent('Checked-out files unmodified:', 1)
             utils.print_indent((utils.to_rel_path(checked_out_unmodified) or ['None.']), 2)
 
-parser_status.set_defaults(func=handler_status)
+register('status', ['s'], 'List all new or modified files.', add_status_arguments, handler_status)
 
 
 # Subparser for: gfcc diff
-parser_diff = subparsers.add_parser('diff', aliases=['d'], help='Show differences in modified files.')
-parser_diff.add_argument(
-    '-g', '--graphical',
-    dest='graphical',
-    action='store_true',
-    default=False,
-    help='Open differences in GUI (if any).'
-)
-parser_diff.add_argument(
-    'items',
-    nargs='*',
-    help='Find diffs on a specific item(s).',
-)
+def add_diff_arguments(parser_diff):
+    parser_diff.add_argument(
+        '-g', '--graphical',
+        dest='graphical',
+        action='store_true',
+        default=False,
+        help='Open differences in GUI (if any).'
+    )
+    parser_diff.add_argument(
+        '-U', '--unified',
+        dest='unified',
+        type=int,
+        help='Number of context lines around each change (default 3).'
+    )
+    parser_diff.add_argument(
+        '-w', '--ignore-whitespace',
+        dest='ignore_whitespace',
+        action='store_true',
+        default=False,
+        help='Ignore whitespace when comparing lines.'
+    )
+    parser_diff.add_argument(
+        'items',
+        nargs='*',
+        help='Find diffs on a specific item(s).',
+    )
 
 def handler_diff(res):
     items = getattr(res, 'items', None)
     graphical = getattr(res, 'graphical', None)
+    unified = getattr(res, 'unified', None)
+    ignore_whitespace = getattr(res, 'ignore_whitespace', None)
 
-    modified_files, _, _ = utils.get_status(get_modified=True, item=getcwd())
-    for item in (items or modified_files):
-        if graphical:
+    status = utils.StatusSnapshot(item=getcwd())
+    if graphical:
+        modified_files = status.modified
+        for item in (items or modified_files):
             if modified_files:
                 utils.find_modifications([item], gui=True)
             else:
                 utils.print_indent('No differences.', 1)
+    else:
+        options = {
+            'context': textdiff.DEFAULT_CONTEXT if unified is None else max(0, unified),
+            'ignore_whitespace': ignore_whitespace,
+        }
+        if items:
+            modifications = [modification for modification, _ in utils.diff_predecessors(items, **options)]
+        elif unified is not None or ignore_whitespace:
+            modifications = utils.find_modifications(status.checked_out, **options)
         else:
-            checked_out_files = utils.list_checked_out()
-            modifications = utils.find_modifications([item] if item else checked_out_files)
+            modifications = status.modifications
+        for modification in modifications:
             utils.print_indent('Modifications:', 1)
-            for modification in (modifications or [utils.INDENTATION * 2 + 'None.']):
-                utils.print_indent(modification, 0)
+            utils.print_indent(modification or (utils.INDENTATION * 2 + 'None.'), 0)
 
-parser_diff.set_defaults(func=handler_diff)
+register('diff', ['d'], 'Show differences in modified files.', add_diff_arguments, handler_diff)
 
 
 # Subparser for: gfcc log
-parser_log = subparsers.add_parser('log', aliases=['l'], help='Show logerences in modified files.')
-parser_log.add_argument(
-    '-l', '--lines',
-    dest='lines',
-    help='Number of lines of history to print (default 15).'
-)
-parser_log.add_argument(
-    '-r', '--recursive',
-    dest='recursive',
-    action='store_true',
-    default=False,
-    help='Apply recursively going into subdirectories.'
-)
-parser_log.add_argument(
-    '-g', '--graphical',
-    dest='graphical',
-    action='store_true',
-    default=False,
-    help='Open history in GUI.'
-)
-parser_log.add_argument(
-    '-t', '--tree',
-    dest='tree',
-    action='store_true',
-    default=False,
-    help='Open history in visual version tree.'
-)
-parser_log.add_argument(
-    'items',
-    nargs='*',
-    help='You can provide one or more directory or file to get the history of that item(s) alone.',
-)
+def add_log_arguments(parser_log):
+    parser_log.add_argument(
+        '-l', '--lines',
+        dest='lines',
+        help='Number of lines of history to print (default 15).'
+    )
+    parser_log.add_argument(
+        '-r', '--recursive',
+        dest='recursive',
+        action='store_true',
+        default=False,
+        help='Apply recursively going into subdirectories.'
+    )
+    parser_log.add_argument(
+        '-g', '--graphical',
+        dest='graphical',
+        action='store_true',
+        default=False,
+        help='Open history in GUI.'
+    )
+    parser_log.add_argument(
+        '-t', '--tree',
+        dest='tree',
+        action='store_true',
+        default=False,
+        help='Open history in visual version tree.'
+    )
+    parser_log.add_argument(
+        'items',
+        nargs='*',
+        help='You can provide one or more directory or file to get the history of that item(s) alone.',
+    )
 
 def handler_log(res):
     lines = getattr(res, 'lines', None)
@@ -155,29 +270,30 @@ def handler_log(res):
     for item in items:
         if tree:
             utils.cc_xlsvtree(item)
+        elif graphical:
+            utils.cc_lshist(item, recursive=recursive, gui=True)
         else:
-            result = utils.cc_lshist(item, lines or 5, recursive, graphical)
-            if not graphical:
-                utils.print_indent('Change history of ' +  item, 0)
-                result = utils.print_indent(result, 1)
+            utils.print_indent('Change history of ' +  item, 0)
+            for event in utils.get_history(item, recursive, int(lines or 5)):
+                utils.print_indent(utils.format_event(event), 1)
 
-parser_log.set_defaults(func=handler_log)
+register('log', ['l'], 'Show logerences in modified files.', add_log_arguments, handler_log)
 
 
 # Subparser for: gfcc clean
-parser_clean = subparsers.add_parser('clean', aliases=['cl'], help='Remove untracked files.')
-parser_clean.add_argument(
-    '-a', '--all',
-    dest='clean_all',
-    action='store_true',
-    default=False,
-    help='Remove ALL untracked.'
-)
-parser_clean.add_argument(
-    'items',
-    nargs='*',
-    help='Clean one or several directories.',
-)
+def add_clean_arguments(parser_clean):
+    parser_clean.add_argument(
+        '-a', '--all',
+        dest='clean_all',
+        action='store_true',
+        default=False,
+        help='Remove ALL untracked.'
+    )
+    parser_clean.add_argument(
+        'items',
+        nargs='*',
+        help='Clean one or several directories.',
+    )
 
 def handler_clean(res):
     clean_all = getattr(res, 'clean_all', None)
@@ -193,30 +309,30 @@ def handler_clean(res):
             utils.print_indent('Removed: ' + file_deleted, 1)
         utils.print_indent('Directory ' + item + ' clean.', 1)
 
-parser_clean.set_defaults(func=handler_clean)
+register('clean', ['cl'], 'Remove untracked files.', add_clean_arguments, handler_clean)
 
 
 # Subparser for: gfcc checkout
-parser_checkout = subparsers.add_parser('checkout', aliases=['co'], help='Checkout file/dir/recursively in the ClearCase sense.')
-parser_checkout.add_argument(
-    '-r', '--recursive',
-    dest='recursive',
-    action='store_true',
-    default=False,
-    help='Apply to all subdirectories and files recursively.'
-)
-parser_checkout.add_argument(
-    '-e', '--edit',
-    dest='edit',
-    action='store_true',
-    default=False,
-    help='Open checked-out file in the editor defined by $EDITOR'
-)
-parser_checkout.add_argument(
-    'items',
-    nargs='*',
-    help='File(s) or dir(s) to check-out.',
-)
+def add_checkout_arguments(parser_checkout):
+    parser_checkout.add_argument(
+        '-r', '--recursive',
+        dest='recursive',
+        action='store_true',
+        default=False,
+        help='Apply to all subdirectories and files recursively.'
+    )
+    parser_checkout.add_argument(
+        '-e', '--edit',
+        dest='edit',
+        action='store_true',
+        default=False,
+        help='Open checked-out file in the editor defined by $EDITOR'
+    )
+    parser_checkout.add_argument(
+        'items',
+        nargs='*',
+        help='File(s) or dir(s) to check-out.',
+    )
 
 def handler_checkout(res):
     recursive = getattr(res, 'recursive', None)
@@ -235,50 +351,50 @@ def handler_checkout(res):
         elif not ('EDITOR' in os.environ):
             utils.print_indent('Error opening file: EDITOR environment variable is not set. You can set it like: setenv EDITOR gedit', 2)
 
-parser_checkout.set_defaults(func=handler_checkout)
+register('checkout', ['co'], 'Checkout file/dir/recursively in the ClearCase sense.', add_checkout_arguments, handler_checkout)
 
 
 # Subparser for: gfcc checkin
-parser_checkin = subparsers.add_parser('checkin', aliases=['ci'], help='Checkin file/dir/recursively in the ClearCase sense.')
-parser_checkin.add_argument(
-    '-m', '--message',
-    dest='message',
-    required=True,
-    help='Comment or description of the checkin (mandatory).'
-)
-parser_checkin.add_argument(
-    '-r', '--recursive',
-    dest='recursive',
-    action='store_true',
-    default=False,
-    help='Apply to all subdirectories and files recursively.'
-)
-parser_checkin.add_argument(
-    '-u', '--untracked',
-    dest='untracked',
-    action='store_true',
-    default=False,
-    help='Create element and check-in untracked items too.'
-)
-parser_checkin.add_argument(
-    '-i', '--identical',
-    dest='identical',
-    action='store_true',
-    default=False,
-    help='Checkin even if files are identical.'
-)
-parser_checkin.add_argument(
-    '-da', '--dont-add-to-cs',
-    dest='dont_add_to_cs',
-    action='store_true',
-    default=False,
-    help='Checkin even if files are identical.'
-)
-parser_checkin.add_argument(
-    'items',
-    nargs='*',
-    help='File(s) or dir(s) to check-in.',
-)
+def add_checkin_arguments(parser_checkin):
+    parser_checkin.add_argument(
+        '-m', '--message',
+        dest='message',
+        required=True,
+        help='Comment or description of the checkin (mandatory).'
+    )
+    parser_checkin.add_argument(
+        '-r', '--recursive',
+        dest='recursive',
+        action='store_true',
+        default=False,
+        help='Apply to all subdirectories and files recursively.'
+    )
+    parser_checkin.add_argument(
+        '-u', '--untracked',
+        dest='untracked',
+        action='store_true',
+        default=False,
+        help='Create element and check-in untracked items too.'
+    )
+    parser_checkin.add_argument(
+        '-i', '--identical',
+        dest='identical',
+        action='store_true',
+        default=False,
+        help='Checkin even if files are identical.'
+    )
+    parser_checkin.add_argument(
+        '-da', '--dont-add-to-cs',
+        dest='dont_add_to_cs',
+        action='store_true',
+        default=False,
+        help='Checkin even if files are identical.'
+    )
+    parser_checkin.add_argument(
+        'items',
+        nargs='*',
+        help='File(s) or dir(s) to check-in.',
+    )
 
 def handler_checkin(res):
     message = getattr(res, 'message', None)
@@ -290,34 +406,35 @@ def handler_checkin(res):
     recursive = recursive if items else True
     items = items or [getcwd()]
 
-    for item in items:
-        item = abspath(item)
-        utils.cc_checkx('in', recursive, item, untracked, message=message, identical=identical, add_rule_to_cs=(not dont_add_to_cs))
+    with utils.cs_transaction():
+        for item in items:
+            item = abspath(item)
+            utils.cc_checkx('in', recursive, item, untracked, message=message, identical=identical, add_rule_to_cs=(not dont_add_to_cs))
 
-parser_checkin.set_defaults(func=handler_checkin)
+register('checkin', ['ci'], 'Checkin file/dir/recursively in the ClearCase sense.', add_checkin_arguments, handler_checkin)
 
 
 # Subparser for: gfcc uncheckout
-parser_uncheckout = subparsers.add_parser('uncheckout', aliases=['un', 'unco'], help='Un-checkout file/dir/recursively in the ClearCase sense.')
-parser_uncheckout.add_argument(
-    '-r', '--recursive',
-    dest='recursive',
-    action='store_true',
-    default=False,
-    help='Apply to all subdirectories and files recursively.'
-)
-parser_uncheckout.add_argument(
-    '-k', '--keep',
-    dest='keep',
-    action='store_true',
-    default=False,
-    help='Keep private copy.'
-)
-parser_uncheckout.add_argument(
-    'items',
-    nargs='*',
-    help='File(s)/dir(s) to uncheckout.',
-)
+def add_uncheckout_arguments(parser_uncheckout):
+    parser_uncheckout.add_argument(
+        '-r', '--recursive',
+        dest='recursive',
+        action='store_true',
+        default=False,
+        help='Apply to all subdirectories and files recursively.'
+    )
+    parser_uncheckout.add_argument(
+        '-k', '--keep',
+        dest='keep',
+        action='store_true',
+        default=False,
+        help='Keep private copy.'
+    )
+    parser_uncheckout.add_argument(
+        'items',
+        nargs='*',
+        help='File(s)/dir(s) to uncheckout.',
+    )
 
 def handler_uncheckout(res):
     recursive = getattr(res, 'recursive', None)
@@ -334,23 +451,23 @@ def handler_uncheckout(res):
         item = abspath(item)
         utils.cc_checkx('un', recursive, item, keep=keep)
 
-parser_uncheckout.set_defaults(func=handler_uncheckout)
+register('uncheckout', ['un', 'unco'], 'Un-checkout file/dir/recursively in the ClearCase sense.', add_uncheckout_arguments, handler_uncheckout)
 
 
 # Subparser for: gfcc copyco
-parser_copyco = subparsers.add_parser('copyco', aliases=['cco'], help='Copy the checked-out modified version from some other view into yours.')
-parser_copyco.add_argument(
-    '-v', '--view',
-    dest='view',
-    default=None,
-    required=True,
-    help='Perform the search on another view.'
-)
-parser_copyco.add_argument(
-    'items',
-    nargs='*',
-    help='File(s)/dir(s) to copyco.',
-)
+def add_copyco_arguments(parser_copyco):
+    parser_copyco.add_argument(
+        '-v', '--view',
+        dest='view',
+        default=None,
+        required=True,
+        help='Perform the search on another view.'
+    )
+    parser_copyco.add_argument(
+        'items',
+        nargs='*',
+        help='File(s)/dir(s) to copyco.',
+    )
 
 def handler_copyco(res):
     view = getattr(res, 'view', None)
@@ -359,63 +476,63 @@ def handler_copyco(res):
     for item in items:
         utils.copy_co(item, view)
 
-parser_copyco.set_defaults(func=handler_copyco)
+register('copyco', ['cco'], 'Copy the checked-out modified version from some other view into yours.', add_copyco_arguments, handler_copyco)
 
 
 # Subparser for: gfcc edcs
-parser_edcs = subparsers.add_parser('edcs', aliases=['ed'], help='Edit current cs.')
-parser_edcs.add_argument(
-    'item',
-    nargs='?',
-    help='CS file to edit',
-)
+def add_edcs_arguments(parser_edcs):
+    parser_edcs.add_argument(
+        'item',
+        nargs='?',
+        help='CS file to edit',
+    )
 
 def handler_edcs(res):
     utils.run_cmd(['cleartool', 'edcs'], False, True)
 
-parser_edcs.set_defaults(func=handler_edcs)
+register('edcs', ['ed'], 'Edit current cs.', add_edcs_arguments, handler_edcs)
 
 
 # Subparser for: gfcc find
-parser_find = subparsers.add_parser('find', aliases=['f'], help='Quick access to useful filters.')
-parser_find.add_argument(
-    '-l', '--latest',
-    dest='latest',
-    action='store_true',
-    default=False,
-    help='Find files selected by rule /LATEST.'
-)
-parser_find.add_argument(
-    '-nl', '--not-latest',
-    dest='not-latest',
-    action='store_true',
-    default=False,
-    help='Find files for which a newer version exists.'
-)
-parser_find.add_argument(
-    '-g', '--gen_rules',
-    dest='gen_rules',
-    action='store_true',
-    default=False,
-    help='Generate cs rules so that you get the found versions.'
-)
-parser_find.add_argument(
-    '-v', '--view',
-    dest='view',
-    default=None,
-    help='Perform the search on another view.'
-)
-parser_find.add_argument(
-    '-d', '--directory',
-    dest='directory',
-    default='.',
-    help='Perform the search in the provided directory.'
-)
-parser_find.add_argument(
-    'item',
-    nargs='?',
-    help='Item.',
-)
+def add_find_arguments(parser_find):
+    parser_find.add_argument(
+        '-l', '--latest',
+        dest='latest',
+        action='store_true',
+        default=False,
+        help='Find files selected by rule /LATEST.'
+    )
+    parser_find.add_argument(
+        '-nl', '--not-latest',
+        dest='not-latest',
+        action='store_true',
+        default=False,
+        help='Find files for which a newer version exists.'
+    )
+    parser_find.add_argument(
+        '-g', '--gen_rules',
+        dest='gen_rules',
+        action='store_true',
+        default=False,
+        help='Generate cs rules so that you get the found versions.'
+    )
+    parser_find.add_argument(
+        '-v', '--view',
+        dest='view',
+        default=None,
+        help='Perform the search on another view.'
+    )
+    parser_find.add_argument(
+        '-d', '--directory',
+        dest='directory',
+        default='.',
+        help='Perform the search in the provided directory.'
+    )
+    parser_find.add_argument(
+        'item',
+        nargs='?',
+        help='Item.',
+    )
 
 def handler_find(res):
     item = getattr(res, 'item', None)
@@ -438,79 +555,74 @@ def handler_find(res):
         utils.print_indent(files_rule_latest or 'None.', 1)
 
     if not_latest:
-        files_versions = utils.get_file_versions(view, view=bool(view))[0]
-        files_latest_versions = utils.get_file_versions(get_latest=True)[0]
-        files_not_latest = [
-            file_i for file_i in files_versions
-            if ((file_i in files_latest_versions) and (files_versions[file_i]['version'] != files_latest_versions[file_i]['version']))]
+        files_not_latest = utils.not_latest_versions(view)
 
         utils.print_indent( \
             ('Rules for f' if gen_rules else 'F') + 'iles not at their latest version ' + \
             ((' in view ' + view) if view else '') + \
             ((' in ' + directory) if directory else '') + ': ', 0)
         if gen_rules:
-            for file_i in files_not_latest:
-                utils.print_rule(file_i, files_latest_versions[file_i]['version'], 0)
+            for file_i, _, latest_version in files_not_latest:
+                utils.print_rule(file_i, latest_version, 0)
         else:
-            result_text = [file_i + '   (selected: ' + files_versions[file_i]['version'] + ' vs latest: ' + files_latest_versions[file_i]['version']  + ')'for file_i in files_not_latest]
+            result_text = [file_i + '   (selected: ' + selected + ' vs latest: ' + latest_version + ')' for file_i, selected, latest_version in files_not_latest]
             utils.print_indent(result_text or 'None.', 1)
 
-
-parser_find.set_defaults(func=handler_find)
+register('find', ['f'], 'Quick access to useful filters.', add_find_arguments, handler_find)
 
 
 # Subparser for: gfcc diffcs
-parser_diffcs = subparsers.add_parser('diffcs', aliases=['dcs'], help='Diff the files selected by two Config-Spec files.')
-parser_diffcs.add_argument(
-    '-f', '--files',
-    dest='files',
-    action='store_true',
-    default=False,
-    help='Diff the actual CS files, instead of the list of files and versions selected by them.'
-)
-parser_diffcs.add_argument(
-    '-d', '--directory',
-    dest='directory',
-    nargs='*',
-    default=['.'],
-    help='Perform the comparison in the provided directory (or directories).'
-)
-parser_diffcs.add_argument(
-    '-b', '--block',
-    dest='block',
-    help='Block name (to diff against a block configspec).'
-)
-parser_diffcs.add_argument(
-    '-v', '--view',
-    dest='view',
-    help='Diff against current CS in the provided view.'
-)
-parser_diffcs.add_argument(
-    '-g', '--gen_rules',
-    dest='gen_rules',
-    action='store_true',
-    default=False,
-    help='Generate cs rules so that you get the same versions as others.'
-)
-parser_diffcs.add_argument(
-    '-p', '--previous',
-    dest='previous',
-    action='store_true',
-    default=False,
-    help='Diff against the previous to LATEST version of the provided cs.'
-)
-parser_diffcs.add_argument(
-    '-r', '--review',
-    dest='review',
-    action='store_true',
-    default=False,
-    help='Review the differences with your preferred difftool.'
-)
-parser_diffcs.add_argument(
-    'cs-file',
-    nargs='*',
-    help='CS file to diff against current one, or two CS files to be diffed.',
-)
+def add_diffcs_arguments(parser_diffcs):
+    parser_diffcs.add_argument(
+        '-f', '--files',
+        dest='files',
+        action='store_true',
+        default=False,
+        help='Diff the actual CS files, instead of the list of files and versions selected by them.'
+    )
+    parser_diffcs.add_argument(
+        '-d', '--directory',
+        dest='directory',
+        nargs='*',
+        default=['.'],
+        help='Perform the comparison in the provided directory (or directories).'
+    )
+    parser_diffcs.add_argument(
+        '-b', '--block',
+        dest='block',
+        help='Block name (to diff against a block configspec).'
+    )
+    parser_diffcs.add_argument(
+        '-v', '--view',
+        dest='view',
+        help='Diff against current CS in the provided view.'
+    )
+    parser_diffcs.add_argument(
+        '-g', '--gen_rules',
+        dest='gen_rules',
+        action='store_true',
+        default=False,
+        help='Generate cs rules so that you get the same versions as others.'
+    )
+    parser_diffcs.add_argument(
+        '-p', '--previous',
+        dest='previous',
+        action='store_true',
+        default=False,
+        help='Diff against the previous to LATEST version of the provided cs.'
+    )
+    parser_diffcs.add_argument(
+        '-r', '--review',
+        dest='review',
+        action='store_true',
+        default=False,
+        help='Review the differences with your preferred difftool.'
+    )
+    parser_diffcs.add_argument(
+        'cs-file',
+        nargs='*',
+        help='CS file to diff against current one, or two CS files to be diffed.',
+    )
 
 def handler_diffcs(res):
     diff_files = getattr(res, 'files', None)
@@ -539,6 +651,7 @@ def handler_diffcs(res):
         utils.print_indent('Error: max two files to diff.', 0)
 
     directory = [abspath(dir_i) for dir_i in directory]
+    versions = utils.diff_cs_directories(csfile_a, csfile_b, directory, bool(view)) if not diff_files else {}
     for dir_i in directory:
         utils.print_indent(
             'Comparing ' + \
@@ -548,63 +661,78 @@ def handler_diffcs(res):
             0
         )
 
-        utils.diffcs(csfile_a, csfile_b, view, diff_files, dir_i, gen_rules, review)
+        utils.diffcs(csfile_a, csfile_b, view, diff_files, dir_i, gen_rules, review, versions.get(dir_i))
 
-parser_diffcs.set_defaults(func=handler_diffcs)
+register('diffcs', ['dcs'], 'Diff the files selected by two Config-Spec files.', add_diffcs_arguments, handler_diffcs)
 
 
 # Subparser for: gfcc difflabels
-parser_difflabels = subparsers.add_parser('difflabels', aliases=['dl'], help='Diff the files selected by two different labels.')
-parser_difflabels.add_argument(
-    '-d', '--directory',
-    dest='directory',
-    nargs='*',
-    default=['.'],
-    help='Perform the comparison in the provided directory (or directories).'
-)
-parser_difflabels.add_argument(
-    'labels',
-    nargs=2,
-    help='Two labels to diff against each other.',
-)
+def add_difflabels_arguments(parser_difflabels):
+    parser_difflabels.add_argument(
+        '-d', '--directory',
+        dest='directory',
+        nargs='*',
+        default=['.'],
+        help='Perform the comparison in the provided directory (or directories).'
+    )
+    parser_difflabels.add_argument(
+        'labels',
+        nargs=2,
+        help='Two labels to diff against each other.',
+    )
 
 def handler_difflabels(res):
     directory = getattr(res, 'directory', None)
     labels = getattr(res, 'labels', None)
 
-parser_difflabels.set_defaults(func=handler_difflabels)
+    label_a, label_b = labels
+    directory = [abspath(dir_i) for dir_i in directory]
+    results = aio.run(aio.diff_labels(label_a, label_b, directory))
+    for dir_i in directory:
+        utils.print_indent(
+            'Comparing files labeled ' + label_a + ' vs ' + label_b + ' in ' + \
+            (relpath(dir_i) if dir_i != getcwd() else basename(dir_i)) + ':',
+            0
+        )
+        a_not_b, b_not_a, diff_v, errors = results[dir_i]
+        if errors:
+            utils.print_indent('Error: ' + errors[0], 1)
+            continue
+        utils.print_labels_diff(label_a, label_b, a_not_b, b_not_a, diff_v)
+
+register('difflabels', ['dl'], 'Diff the files selected by two different labels.', add_difflabels_arguments, handler_difflabels)
 
 
 # Subparser for: gfcc savecs
-parser_savecs = subparsers.add_parser('savecs', aliases=['scs'], help='Save your current cs state in cc.')
-parser_savecs.add_argument(
-    '-b', '--block',
-    dest='block',
-    help='Block name.'
-)
-parser_savecs.add_argument(
-    '-m', '--message',
-    dest='message',
-    required=False,
-    help='Comment or description (mandatory for shared cs files).'
-)
-parser_savecs.add_argument(
-    '-p', '--absolute-path',
-    dest='absolute-path',
-    help='Absolute path where the cs file will be saved (ignore blockname/cs structure and file name).'
-)
-parser_savecs.add_argument(
-    '-f', '--force',
-    dest='force',
-    action='store_true',
-    default=False,
-    help='Overrides "LATEST not allowed" and "identical versions are not checked in".'
-)
-parser_savecs.add_argument(
-    'cs-file-name',
-    nargs='?',
-    help='Name of a shared configspec to save to.',
-)
+def add_savecs_arguments(parser_savecs):
+    parser_savecs.add_argument(
+        '-b', '--block',
+        dest='block',
+        help='Block name.'
+    )
+    parser_savecs.add_argument(
+        '-m', '--message',
+        dest='message',
+        required=False,
+        help='Comment or description (mandatory for shared cs files).'
+    )
+    parser_savecs.add_argument(
+        '-p', '--absolute-path',
+        dest='absolute-path',
+        help='Absolute path where the cs file will be saved (ignore blockname/cs structure and file name).'
+    )
+    parser_savecs.add_argument(
+        '-f', '--force',
+        dest='force',
+        action='store_true',
+        default=False,
+        help='Overrides "LATEST not allowed" and "identical versions are not checked in".'
+    )
+    parser_savecs.add_argument(
+        'cs-file-name',
+        nargs='?',
+        help='Name of a shared configspec to save to.',
+    )
 
 def handler_savecs(res):
     block = getattr(res, 'block', None)
@@ -623,12 +751,15 @@ def handler_savecs(res):
         return utils.print_indent(
             'Error: Using LATEST in your CS is not allowed unless you --force it.', 1)
 
-    utils.write_to_file(current_cs, 'current.cs.bak')
-    utils.set_cs(utils.DEFAULT_CS)
     if not absolute_path:
         absolute_path = utils.get_cs_path(block, cs_file_name)
         if not absolute_path:
             return
+    utils.write_to_file(current_cs, 'current.cs.bak')
+    # Only fall back to DEFAULT_CS when the current cs does not show the LATEST version of the cs file
+    swap_cs = not utils.view_selects_latest(absolute_path)
+    if swap_cs:
+        utils.set_cs(utils.DEFAULT_CS)
 
     if not utils.exists_try(absolute_path):
         open(absolute_path, 'a').close()
@@ -650,7 +781,8 @@ def handler_savecs(res):
         identical=force,
         add_rule_to_cs=False
     )
-    utils.set_cs(current_cs)
+    if swap_cs:
+        utils.set_cs(current_cs)
     remove('current.cs.bak')
     utils.print_indent('Current version of your CS saved in: ' + relpath(absolute_path), 1)
 
@@ -662,47 +794,47 @@ def handler_savecs(res):
         utils.send_mail('CS Updated: ' + cs_file_name, mail_body, gfcc_config['email_updates_to'])
         utils.print_indent('Sent update email to ' + ', '.join(gfcc_config['email_updates_to']), 2)
 
-parser_savecs.set_defaults(func=handler_savecs)
+register('savecs', ['scs'], 'Save your current cs state in cc.', add_savecs_arguments, handler_savecs)
 
 
 # Subparser for: gfcc setcs
-parser_setcs = subparsers.add_parser('setcs', aliases=['stcs'], help='Save your current cs state in cc.')
-parser_setcs.add_argument(
-    '-b', '--block',
-    dest='block',
-    help='Block name (if you want to load a block or user cs file and the path cannot be automatically identified).'
-)
-parser_setcs.add_argument(
-    '-v', '--view',
-    dest='view',
-    help='Copy the current CS in another view to this one.'
-)
-parser_setcs.add_argument(
-    '-k', '--backup',
-    dest='backup',
-    action='store_true',
-    default=False,
-    help='Save current CS in a backup file before applying the new CS.'
-)
-parser_setcs.add_argument(
-    '-p', '--previous',
-    dest='previous',
-    action='store_true',
-    default=False,
-    help='Set to the previous to LATEST version of this cs.'
-)
-parser_setcs.add_argument(
-    '-s', '--setup',
-    dest='setup',
-    action='store_true',
-    default=False,
-    help='Set the environment up applying modules and environment variables.'
-)
-parser_setcs.add_argument(
-    'cs-file',
-    nargs='?',
-    help='Name or path of the configspec to apply.',
-)
+def add_setcs_arguments(parser_setcs):
+    parser_setcs.add_argument(
+        '-b', '--block',
+        dest='block',
+        help='Block name (if you want to load a block or user cs file and the path cannot be automatically identified).'
+    )
+    parser_setcs.add_argument(
+        '-v', '--view',
+        dest='view',
+        help='Copy the current CS in another view to this one.'
+    )
+    parser_setcs.add_argument(
+        '-k', '--backup',
+        dest='backup',
+        action='store_true',
+        default=False,
+        help='Save current CS in a backup file before applying the new CS.'
+    )
+    parser_setcs.add_argument(
+        '-p', '--previous',
+        dest='previous',
+        action='store_true',
+        default=False,
+        help='Set to the previous to LATEST version of this cs.'
+    )
+    parser_setcs.add_argument(
+        '-s', '--setup',
+        dest='setup',
+        action='store_true',
+        default=False,
+        help='Set the environment up applying modules and environment variables.'
+    )
+    parser_setcs.add_argument(
+        'cs-file',
+        nargs='?',
+        help='Name or path of the configspec to apply.',
+    )
 
 def handler_setcs(res):
     block = getattr(res, 'block', None)
@@ -746,36 +878,36 @@ def handler_setcs(res):
         utils.print_indent('Error: CS file not found. It could not be identified with the provided parameters or found in your filesystem, maybe not visible due to current cs.', 0)
         return
 
-parser_setcs.set_defaults(func=handler_setcs)
+register('setcs', ['stcs'], 'Save your current cs state in cc.', add_setcs_arguments, handler_setcs)
 
 
 # Subparser for: gfcc codereview
-parser_codereview = subparsers.add_parser('codereview', aliases=['cr'], help='Create, share and review sets of code changes.')
-parser_codereview.add_argument(
-    '-c', '--create',
-    dest='create',
-    help='Create a diffs bundle to be reviewed by others.'
-)
-parser_codereview.add_argument(
-    '-b', '--block',
-    dest='block',
-    help='Block to which this code review belongs.'
-)
-parser_codereview.add_argument(
-    '-o', '--old_cs',
-    dest='old_cs',
-    help='CS with versions reflecting the "OLD" state.'
-)
-parser_codereview.add_argument(
-    '-n', '--new_cs',
-    dest='new_cs',
-    help='CS with versions reflecting the "NEW" state.'
-)
-parser_codereview.add_argument(
-    'name',
-    nargs='*',
-    help='Name or path of the codereview you want to go through.',
-)
+def add_codereview_arguments(parser_codereview):
+    parser_codereview.add_argument(
+        '-c', '--create',
+        dest='create',
+        help='Create a diffs bundle to be reviewed by others.'
+    )
+    parser_codereview.add_argument(
+        '-b', '--block',
+        dest='block',
+        help='Block to which this code review belongs.'
+    )
+    parser_codereview.add_argument(
+        '-o', '--old_cs',
+        dest='old_cs',
+        help='CS with versions reflecting the "OLD" state.'
+    )
+    parser_codereview.add_argument(
+        '-n', '--new_cs',
+        dest='new_cs',
+        help='CS with versions reflecting the "NEW" state.'
+    )
+    parser_codereview.add_argument(
+        'name',
+        nargs='*',
+        help='Name or path of the codereview you want to go through.',
+    )
 
 def handler_codereview(res):
     create = getattr(res, 'create', None)
@@ -793,16 +925,84 @@ def handler_codereview(res):
     if old_cs and new_cs:
         utils.diffcs(old_cs, new_cs, review_diffs=True)
 
-parser_codereview.set_defaults(func=handler_codereview)
+register('codereview', ['cr'], 'Create, share and review sets of code changes.', add_codereview_arguments, handler_codereview)
+
+
+# Subparser for: gfcc daemon
+def add_daemon_arguments(parser_daemon):
+    parser_daemon.add_argument(
+        '-d', '--directory',
+        dest='directory',
+        default=None,
+        help='Directory tree served by the daemon (default: the current block, or the current directory).'
+    )
+    parser_daemon.add_argument(
+        'action',
+        choices=['start', 'stop', 'status', 'run'],
+        help='Start it in the background, stop it, show what it knows, or run it in the foreground.',
+    )
+
+def handler_daemon(res):
+    directory = getattr(res, 'directory', None)
+    action = getattr(res, 'action', None)
+
+    root = abspath(directory or utils.get_block_name_path()[1] or getcwd())
+    socket_path = daemon.socket_path(root)
+    if action == 'run':
+        daemon.serve(root)
+    elif action == 'start':
+        if daemon.request(root, {'query': 'ping'}, socket_path):
+            return utils.print_indent('A daemon is already serving ' + root, 0)
+        subprocess.Popen(
+            [sys.executable, '-m', 'gfcc', 'daemon', 'run', '-d', root],
+            stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True
+        )
+        for _ in range(100):
+            if daemon.request(root, {'query': 'ping'}, socket_path):
+                return utils.print_indent('Daemon serving ' + root, 0)
+            time.sleep(0.1)
+        utils.print_indent('Error: the daemon for ' + root + ' did not start.', 0)
+    elif action == 'stop':
+        if daemon.request(root, {'query': 'stop'}, socket_path):
+            utils.print_indent('Daemon for ' + root + ' stopped.', 0)
+        else:
+            utils.print_indent('No daemon is serving ' + root, 0)
+    else:
+        info = daemon.request(root, {'query': 'ping'}, socket_path)
+        if not info:
+            return utils.print_indent('No daemon is serving ' + root, 0)
+        info = info['result']
+        utils.print_indent('Daemon serving ' + info['root'] + ' (pid ' + str(info['pid']) + ', ' + info['watcher'] + ')', 0)
+        utils.print_indent('Up for ' + str(int(info['uptime'])) + ' s, ' + str(info['queries']) + ' queries answered.', 1)
+        utils.print_indent('Checked-out files: ' + str(info['checked_out']) + ', untracked files: ' + str(info['untracked']), 1)
+
+
 
 
 # main
+
+register('daemon', ['dm'], 'Keep the status of a directory tree in memory to answer status, diff and clean quickly.', add_daemon_arguments, handler_daemon)
+
+
 def main():
+    parser = build_parser(sys.argv[1:])
     if len(sys.argv) == 1:
         parser.print_help()
     else:
         res = parser.parse_args()
-        res.func(res)
+        load_lazy_modules()
+        if res.jobs:
+            utils.JOBS = res.jobs
+        if not hasattr(res, 'func'):
+            return parser.print_help()
+        if res.profile or res.trace_file:
+            trace.start(res.trace_file)
+        else:
+            trace.start_from_env()
+        try:
+            res.func(res)
+        finally:
+            trace.finish()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,99 @@
+import os
+import sys
+
+from   bisect   import bisect_left, insort
+from   os.path  import abspath, normpath
+
+
+# Constants
+# Separators become the lowest character in keys, so keys sort like paths compared component by component
+# and every subtree is a contiguous range of them
+KEY_SEPARATOR = '\0'
+KEY_SUBTREE_END = '\1'
+
+
+def path_key(path):
+
+    ''' Interned sort and lookup key of a path, made absolute and normalized '''
+
+    return sys.intern(normpath(abspath(path)).replace(os.sep, KEY_SEPARATOR))
+
+
+def key_path(key):
+    return key.replace(KEY_SEPARATOR, os.sep)
+
+
+def sort_key(path):
+
+    ''' Key to sort paths as written (relative ones too) in the order of their components '''
+
+    return normpath(path).replace(os.sep, KEY_SEPARATOR)
+
+
+def is_under(path, directory):
+
+    ''' Whether path is directory or inside it, comparing whole components '''
+
+    path_str = normpath(abspath(path))
+    directory = normpath(abspath(directory))
+    return path_str == directory or path_str.startswith(directory.rstrip(os.sep) + os.sep)
+
+
+class PathIndex:
+
+    ''' Sorted set of absolute paths: membership, subtree queries and ordered iteration, each subtree is found
+        with a binary search instead of scanning every path '''
+
+    def __init__(self, paths=()):
+        self.members = set(path_key(path) for path in paths)
+        self.keys = sorted(self.members)
+
+    def __contains__(self, path):
+        return path_key(path) in self.members
+
+    def __iter__(self):
+        return (key_path(key) for key in self.keys)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _subtree(self, directory, include_self):
+        key = path_key(directory)
+        prefix = key.rstrip(KEY_SEPARATOR) + KEY_SEPARATOR
+        start = bisect_left(self.keys, key if include_self else prefix)
+        if not include_self and start < len(self.keys) and self.keys[start] == key:
+            start += 1
+        return start, bisect_left(self.keys, key.rstrip(KEY_SEPARATOR) + KEY_SUBTREE_END)
+
+    def under(self, directory, include_self=True):
+
+        ''' Paths inside directory, in order, with directory itself if it is in the index and include_self '''
+
+        start, end = self._subtree(directory, include_self)
+        return [key_path(key) for key in self.keys[start:end]]
+
+    def add(self, path):
+        key = path_key(path)
+        if key not in self.members:
+            self.members.add(key)
+            insort(self.keys, key)
+
+    def update(self, paths):
+        self.members.update(path_key(path) for path in paths)
+        self.keys = sorted(self.members)
+
+    def discard(self, path):
+        key = path_key(path)
+        if key in self.members:
+            self.members.discard(key)
+            del self.keys[bisect_left(self.keys, key)]
+
+    def remove_under(self, directory, include_self=False):
+
+        ''' Drop the paths inside directory, returns them '''
+
+        start, end = self._subtree(directory, include_self)
+        removed = self.keys[start:end]
+        del self.keys[start:end]
+        self.members.difference_update(removed)
+        return [key_path(key) for key in removed]
@@ -0,0 +1,304 @@
+import os
+import re
+import queue
+import atexit
+import threading
+import subprocess
+
+from   shutil   import which
+
+
+# Constants
+CLEARTOOL = 'cleartool'
+PROMPT = 'cleartool> '
+# Subcommands that need a terminal, change the process state or must not share a session
+UNSAFE_SUBCOMMANDS = ('setview', 'edcs', 'shell', 'sh', '!', 'cd', 'quit', 'q', 'exit')
+# Read-only subcommands that can be re-sent if the session dies while running them
+RETRYABLE_SUBCOMMANDS = (
+    'pwv', 'catcs', 'ls', 'lsco', 'lshistory', 'lshist', 'diff', 'find', 'describe', 'desc', 'lsvtree', 'pwd',
+)
+SHELL_METACHARACTERS = re.compile(r'[|;&<>$`\n]')
+
+
+class SessionError(Exception):
+    ''' The cleartool co-process died or stopped answering '''
+
+
+class CleartoolSession:
+
+    ''' One long-lived interactive cleartool process, commands are framed by unique markers '''
+
+    def __init__(self, executable=CLEARTOOL, timeout=None):
+        self.executable = executable
+        self.timeout = timeout
+        self.process = None
+        self.cwd = None
+        self.counter = 0
+        self.token = os.urandom(6).hex()
+        self.lock = threading.Lock()
+
+    def start(self):
+        env = dict(os.environ, SHELL='/bin/sh')
+        self.process = subprocess.Popen(
+            [self.executable], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env
+        )
+        self.stdout_lines = queue.Queue()
+        self.stderr_lines = queue.Queue()
+        for stream, lines in ((self.process.stdout, self.stdout_lines), (self.process.stderr, self.stderr_lines)):
+            reader = threading.Thread(target=_read_lines, args=(stream, lines), daemon=True)
+            reader.start()
+        self.cwd = None
+
+    def alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def kill(self):
+        if self.process is not None:
+            if self.alive():
+                self.process.kill()
+            self.process.wait()
+        self.process = None
+
+    def close(self):
+        if self.alive():
+            try:
+                self.process.stdin.write(b'quit\n')
+                self.process.stdin.close()
+                self.process.wait(timeout=5)
+            except (OSError, subprocess.TimeoutExpired):
+                pass
+        self.kill()
+
+    def run(self, args):
+
+        ''' Run "cleartool <args>" in the session and return (stdout, stderr) as text '''
+
+        with self.lock:
+            restarted = False
+            if not self.alive():
+                self.start()
+                restarted = True
+            try:
+                return self._execute(args)
+            except SessionError:
+                self.kill()
+                if restarted or args[0] not in RETRYABLE_SUBCOMMANDS:
+                    return '', 'cleartool: Error: session terminated while running: ' + ' '.join(args) + '\n'
+                self.start()
+                try:
+                    return self._execute(args)
+                except SessionError:
+                    self.kill()
+                    return '', 'cleartool: Error: session terminated while running: ' + ' '.join(args) + '\n'
+
+    def stream(self, args, errors=None):
+
+        ''' Yield the stdout lines of "cleartool <args>" as they arrive, stderr lines are added to errors '''
+
+        with self.lock:
+            if not self.alive():
+                self.start()
+            marker = None
+            finished = False
+            try:
+                marker = self._send_command(args)
+                for line in self._iter_lines(self.stdout_lines, marker):
+                    yield line.rstrip('\r\n')
+                error_lines = self._collect(self.stderr_lines, marker)
+                finished = True
+                if errors is not None:
+                    errors.extend(error_lines.splitlines())
+            except SessionError:
+                self.kill()
+                if errors is not None:
+                    errors.append('cleartool: Error: session terminated while running: ' + ' '.join(args))
+            finally:
+                if marker and not finished and self.alive():
+                    # Consumer stopped early, drain the rest so the next command starts clean
+                    try:
+                        self._collect(self.stdout_lines, marker)
+                        self._collect(self.stderr_lines, marker)
+                    except SessionError:
+                        self.kill()
+
+    def _execute(self, args):
+        marker = self._send_command(args)
+        return self._collect(self.stdout_lines, marker), self._collect(self.stderr_lines, marker)
+
+    def _send_command(self, args):
+        cwd = os.getcwd()
+        if cwd != self.cwd:
+            cd_marker = self._send('cd ' + quote_arg(cwd))
+            self._collect(self.stdout_lines, cd_marker)
+            self._collect(self.stderr_lines, cd_marker)
+            self.cwd = cwd
+        return self._send(' '.join(quote_arg(arg) for arg in args))
+
+    def _send(self, command_line):
+
+        ''' Send one command followed by a marker echoed on each stream, returns the marker '''
+
+        self.counter += 1
+        marker = '__gfcc_end_' + self.token + '_' + str(self.counter) + '__'
+        request = command_line + '\n' + 'shell echo ' + marker + '; echo ' + marker + ' 1>&2\n'
+        try:
+            self.process.stdin.write(request.encode('utf-8'))
+            self.process.stdin.flush()
+        except OSError:
+            raise SessionError(command_line)
+        return marker
+
+    def _iter_lines(self, lines, marker):
+
+        ''' Lines of one stream up to the marker '''
+
+        while True:
+            try:
+                line = lines.get(timeout=self.timeout)
+            except queue.Empty:
+                raise SessionError('timeout')
+            if line is None:
+                raise SessionError('eof')
+            while line.startswith(PROMPT):
+                line = line[len(PROMPT):]
+            if line.rstrip('\r\n').endswith(marker):
+                prefix = line.rstrip('\r\n')[:-len(marker)]
+                if prefix:
+                    yield prefix
+                return
+            yield line
+
+    def _collect(self, lines, marker):
+        return ''.join(self._iter_lines(lines, marker))
+
+
+def _read_lines(stream, lines):
+    for line in iter(stream.readline, b''):
+        lines.put(line.decode('utf-8', errors='replace'))
+    lines.put(None)
+
+
+def can_quote(arg):
+
+    ''' Whether quote_arg keeps arg whole: a line break would end the command and there is no escape for an
+        argument with both kinds of quotes '''
+
+    return not re.search(r'[\r\n]', arg) and not ('"' in arg and "'" in arg)
+
+
+def quote_arg(arg):
+
+    ''' Quote one argument for the cleartool interactive command line, see can_quote '''
+
+    if arg and not re.search(r'[\s"\'\\]', arg):
+        return arg
+    if '"' not in arg:
+        return '"' + arg + '"'
+    return "'" + arg + "'"
+
+
+class SessionPool:
+
+    ''' Up to max_sessions cleartool processes shared by all the threads of one gfcc run '''
+
+    def __init__(self, max_sessions=1, executable=CLEARTOOL, timeout=None):
+        self.max_sessions = max(1, max_sessions)
+        self.executable = executable
+        self.timeout = timeout
+        self.sessions = []
+        self.idle = []
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        with self.condition:
+            while not self.idle and len(self.sessions) >= self.max_sessions:
+                self.condition.wait()
+            if self.idle:
+                return self.idle.pop()
+            session = CleartoolSession(self.executable, self.timeout)
+            self.sessions.append(session)
+            return session
+
+    def release(self, session):
+        with self.condition:
+            self.idle.append(session)
+            self.condition.notify()
+
+    def run(self, args):
+        session = self.acquire()
+        try:
+            return session.run(args)
+        finally:
+            self.release(session)
+
+    def stream(self, args, errors=None):
+        session = self.acquire()
+        try:
+            yield from session.stream(args, errors)
+        finally:
+            self.release(session)
+
+    def close(self):
+        with self.condition:
+            for session in self.sessions:
+                session.close()
+            self.sessions = []
+            self.idle = []
+
+
+_pool = None
+_pool_lock = threading.Lock()
+_enabled = None
+
+
+def enabled():
+
+    ''' Sessions can be disabled with GFCC_NO_SESSION=1, or when cleartool is not in the PATH '''
+
+    global _enabled
+    if _enabled is None:
+        _enabled = not os.environ.get('GFCC_NO_SESSION') and bool(which(CLEARTOOL))
+    return _enabled
+
+
+def get_pool():
+
+    ''' Pool for this run, sized by GFCC_SESSIONS (defaults to GFCC_JOBS, or 8) '''
+
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            timeout = os.environ.get('GFCC_SESSION_TIMEOUT')
+            _pool = SessionPool(
+                int(os.environ.get('GFCC_SESSIONS', os.environ.get('GFCC_JOBS', 8))), CLEARTOOL, float(timeout) if timeout else None
+            )
+            atexit.register(_pool.close)
+        return _pool
+
+
+def handles(argv):
+
+    ''' Whether an argv can be sent to a session instead of spawning its own cleartool. Arguments that cannot
+        be quoted whole, such as multi-line comments, are left to their own process. '''
+
+    return (
+        len(argv) > 1 and argv[0] == CLEARTOOL
+        and argv[1] not in UNSAFE_SUBCOMMANDS
+        and '-graphical' not in argv
+        and all(can_quote(arg) for arg in argv[1:])
+        and enabled()
+    )
+
+
+def run(argv):
+
+    ''' Run a full "cleartool ..." argv in a pooled session, returns (stdout, stderr) '''
+
+    return get_pool().run(list(argv[1:]))
+
+
+def stream(argv, errors=None):
+
+    ''' Yield the stdout lines of a full "cleartool ..." argv run in a pooled session '''
+
+    return get_pool().stream(list(argv[1:]), errors)
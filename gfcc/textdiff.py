@@ -0,0 +1,186 @@
+from   bisect   import bisect_left
+
+
+# Constants
+DEFAULT_CONTEXT = 3
+# Beyond this many edits a region without unique lines is shown as replaced instead of minimized
+MYERS_MAX_COST = 2000
+NO_NEWLINE = '\n\\ No newline at end of file'
+
+
+def split_lines(text):
+
+    ''' Lines without their ends, a missing newline at the end of text is kept as a marker on the last line '''
+
+    lines = text.split('\n')
+    if lines[-1] == '':
+        lines.pop()
+    else:
+        lines[-1] += NO_NEWLINE
+    return lines
+
+
+def line_key(line, ignore_whitespace):
+    return ''.join(line.replace(NO_NEWLINE, '').split()) if ignore_whitespace else line
+
+
+def unique_anchors(a, b, a_lo, a_hi, b_lo, b_hi):
+
+    ''' Longest increasing run of (i, j) pairs of lines that appear exactly once in both ranges '''
+
+    counts = {}
+    for i in range(a_lo, a_hi):
+        count = counts.setdefault(a[i], [0, 0, i])
+        count[0] += 1
+    for j in range(b_lo, b_hi):
+        count = counts.get(b[j])
+        if count is not None:
+            count[1] += 1
+            count.append(j)
+    pairs = sorted((count[2], count[3]) for count in counts.values() if count[0] == 1 and count[1] == 1)
+    # Patience sorting over the positions in b
+    tops = []
+    top_pairs = []
+    previous = {}
+    for pair in pairs:
+        pile = bisect_left(tops, pair[1])
+        previous[pair] = top_pairs[pile - 1] if pile else None
+        if pile == len(tops):
+            tops.append(pair[1])
+            top_pairs.append(pair)
+        else:
+            tops[pile] = pair[1]
+            top_pairs[pile] = pair
+    anchors = []
+    pair = top_pairs[-1] if top_pairs else None
+    while pair:
+        anchors.append(pair)
+        pair = previous[pair]
+    return anchors[::-1]
+
+
+def myers_matches(a, b, a_lo, a_hi, b_lo, b_hi):
+
+    ''' Matching (i, j) line pairs of a shortest edit script, none if it needs more than MYERS_MAX_COST edits '''
+
+    n, m = a_hi - a_lo, b_hi - b_lo
+    v = {1: 0}
+    trace = []
+    for d in range(min(n + m, MYERS_MAX_COST) + 1):
+        trace.append(dict(v))
+        for k in range(-d, d + 1, 2):
+            x = v[k + 1] if k == -d or (k != d and v[k - 1] < v[k + 1]) else v[k - 1] + 1
+            y = x - k
+            while x < n and y < m and a[a_lo + x] == b[b_lo + y]:
+                x += 1
+                y += 1
+            v[k] = x
+            if x >= n and y >= m:
+                return myers_backtrack(trace, n, m, a_lo, b_lo)
+    return []
+
+
+def myers_backtrack(trace, x, y, a_lo, b_lo):
+    matches = []
+    for d in range(len(trace) - 1, -1, -1):
+        v = trace[d]
+        k = x - y
+        previous_k = k + 1 if k == -d or (k != d and v[k - 1] < v[k + 1]) else k - 1
+        previous_x = v[previous_k]
+        previous_y = previous_x - previous_k
+        while x > previous_x and y > previous_y:
+            x -= 1
+            y -= 1
+            matches.append((a_lo + x, b_lo + y))
+        x, y = previous_x, previous_y
+    return matches
+
+
+def match_lines(a, b):
+
+    ''' Sorted (i, j) pairs of equal lines: patience diff on unique lines, Myers in between '''
+
+    matches = []
+    regions = [(0, len(a), 0, len(b))]
+    while regions:
+        a_lo, a_hi, b_lo, b_hi = regions.pop()
+        while a_lo < a_hi and b_lo < b_hi and a[a_lo] == b[b_lo]:
+            matches.append((a_lo, b_lo))
+            a_lo += 1
+            b_lo += 1
+        while a_lo < a_hi and b_lo < b_hi and a[a_hi - 1] == b[b_hi - 1]:
+            a_hi -= 1
+            b_hi -= 1
+            matches.append((a_hi, b_hi))
+        if a_lo == a_hi or b_lo == b_hi:
+            continue
+        anchors = unique_anchors(a, b, a_lo, a_hi, b_lo, b_hi)
+        if not anchors:
+            matches.extend(myers_matches(a, b, a_lo, a_hi, b_lo, b_hi))
+            continue
+        for i, j in anchors:
+            regions.append((a_lo, i, b_lo, j))
+            matches.append((i, j))
+            a_lo, b_lo = i + 1, j + 1
+        regions.append((a_lo, a_hi, b_lo, b_hi))
+    return sorted(matches)
+
+
+def hunk_range(start, length):
+    if length == 1:
+        return str(start + 1)
+    return str(start + 1 if length else start) + ',' + str(length)
+
+
+def unified_diff(a, b, fromfile='', tofile='', context=DEFAULT_CONTEXT, ignore_whitespace=False):
+
+    ''' Unified diff lines between two lists of lines from split_lines, empty if they are equivalent '''
+
+    keys_a = [line_key(line, ignore_whitespace) for line in a]
+    keys_b = [line_key(line, ignore_whitespace) for line in b]
+    changes = []
+    i = j = 0
+    for match_i, match_j in match_lines(keys_a, keys_b) + [(len(a), len(b))]:
+        if match_i > i or match_j > j:
+            changes.append((i, match_i, j, match_j))
+        i, j = match_i + 1, match_j + 1
+    if not changes:
+        return []
+
+    groups = [[changes[0]]]
+    for change in changes[1:]:
+        if change[0] - groups[-1][-1][1] <= 2 * context:
+            groups[-1].append(change)
+        else:
+            groups.append([change])
+    lines = ['--- ' + fromfile, '+++ ' + tofile]
+    for group in groups:
+        a_start = max(0, group[0][0] - context)
+        a_end = min(len(a), group[-1][1] + context)
+        b_start = group[0][2] - (group[0][0] - a_start)
+        b_end = group[-1][3] + (a_end - group[-1][1])
+        lines.append('@@ -' + hunk_range(a_start, a_end - a_start) + ' +' + hunk_range(b_start, b_end - b_start) + ' @@')
+        i = a_start
+        for change_a, change_a_end, change_b, change_b_end in group:
+            lines.extend(' ' + line for line in a[i:change_a])
+            lines.extend('-' + line for line in a[change_a:change_a_end])
+            lines.extend('+' + line for line in b[change_b:change_b_end])
+            i = change_a_end
+        lines.extend(' ' + line for line in a[i:a_end])
+    return lines
+
+
+def diff_bytes(old_data, new_data, fromfile='', tofile='', context=DEFAULT_CONTEXT, ignore_whitespace=False):
+
+    ''' Unified diff text between two file contents, None if they are equivalent '''
+
+    if old_data == new_data:
+        return None
+    if b'\0' in old_data or b'\0' in new_data:
+        return '--- ' + fromfile + '\n+++ ' + tofile + '\nBinary files differ\n'
+    lines = unified_diff(
+        split_lines(old_data.decode('utf-8', errors='replace')),
+        split_lines(new_data.decode('utf-8', errors='replace')),
+        fromfile, tofile, context, ignore_whitespace
+    )
+    return '\n'.join(lines) + '\n' if lines else None
@@ -0,0 +1,193 @@
+import os
+import sys
+import json
+import time
+import threading
+
+from   os.path  import dirname, abspath, basename
+
+
+# Constants
+PACKAGE_DIR = dirname(abspath(__file__))
+# Skipped when looking for the gfcc function that asked for a command
+RUNNER_FUNCTIONS = ('run_cmd', 'stream_cmd', 'traced_run', 'traced_stream', 'run_process', 'record')
+SLOWEST_SHOWN = 5
+
+
+class Tracer:
+
+    ''' Record of every external command run during one gfcc run '''
+
+    def __init__(self, trace_file=None):
+        self.trace_file = trace_file
+        self.records = []
+        self.lock = threading.Lock()
+        self.origin = time.time()
+
+    def record(self, argv, caller, start, end, status, out_bytes, err_bytes, in_session=False):
+        with self.lock:
+            self.records.append({
+                'argv': [str(arg) for arg in argv], 'command': command_name(argv), 'caller': caller,
+                'start': start, 'seconds': end - start, 'status': status,
+                'stdout_bytes': out_bytes, 'stderr_bytes': err_bytes, 'session': in_session,
+                'thread': threading.get_ident(),
+            })
+
+    def summary(self):
+
+        ''' Lines with count, total and p50/p95 time per command, slowest first, and the slowest calls '''
+
+        by_command = {}
+        for record in self.records:
+            by_command.setdefault(record['command'], []).append(record['seconds'])
+        total = sum(record['seconds'] for record in self.records)
+        lines = [
+            'Profile: ' + str(len(self.records)) + ' external commands, ' + '%.3f' % total + ' s in commands, '
+            + '%.3f' % (time.time() - self.origin) + ' s wall',
+            '  %-28s %6s %9s %9s %9s' % ('command', 'count', 'total s', 'p50 ms', 'p95 ms'),
+        ]
+        for command, times in sorted(by_command.items(), key=lambda x: sum(x[1]), reverse=True):
+            lines.append('  %-28s %6d %9.3f %9.1f %9.1f' % (
+                command, len(times), sum(times), 1000 * percentile(times, 50), 1000 * percentile(times, 95)))
+        slowest = sorted(self.records, key=lambda x: x['seconds'], reverse=True)[:SLOWEST_SHOWN]
+        if slowest:
+            lines.append('  Slowest calls:')
+            for record in slowest:
+                lines.append('    %9.1f ms  %-24s %s' % (1000 * record['seconds'], record['caller'], ' '.join(record['argv'])))
+        return lines
+
+    def write(self, path):
+
+        ''' Chrome trace (chrome://tracing, Perfetto) with one complete event per command '''
+
+        events = [{
+            'name': record['command'], 'cat': 'session' if record['session'] else 'process', 'ph': 'X',
+            'ts': int((record['start'] - self.origin) * 1e6), 'dur': int(record['seconds'] * 1e6),
+            'pid': os.getpid(), 'tid': record['thread'],
+            'args': {name: record[name] for name in ('argv', 'caller', 'status', 'stdout_bytes', 'stderr_bytes')},
+        } for record in self.records]
+        with open(path, 'w') as trace_file:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, trace_file)
+
+    def finish(self):
+        sys.stderr.write('\n'.join(self.summary()) + '\n')
+        if self.trace_file:
+            try:
+                self.write(self.trace_file)
+                sys.stderr.write('  Trace written to ' + self.trace_file + '\n')
+            except OSError as error:
+                sys.stderr.write('  Error: cannot write trace to ' + self.trace_file + ': ' + str(error) + '\n')
+
+
+def command_name(argv):
+
+    ''' "cleartool <subcommand>" for cleartool commands, the program name otherwise '''
+
+    if not argv:
+        return '?'
+    program = basename(str(argv[0]))
+    if program == 'cleartool' and len(argv) > 1:
+        return program + ' ' + str(argv[1])
+    return program
+
+
+def percentile(values, percent):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(percent / 100 * len(ordered) + 0.5)) - 1))]
+
+
+def caller_name():
+
+    ''' Innermost gfcc function outside the command runners, as "outer > inner" '''
+
+    names = []
+    frame = sys._getframe(1)
+    while frame and len(names) < 2:
+        code = frame.f_code
+        if dirname(abspath(code.co_filename)) == PACKAGE_DIR and code.co_name not in RUNNER_FUNCTIONS \
+                and basename(code.co_filename) != 'trace.py' and not code.co_name.startswith('<'):
+            names.append(code.co_name)
+        frame = frame.f_back
+    return ' > '.join(reversed(names)) or '?'
+
+
+_tracer = None
+
+
+def start(trace_file=None):
+
+    ''' Start recording commands, the summary is printed to stderr by finish() '''
+
+    global _tracer
+    _tracer = Tracer(trace_file)
+    return _tracer
+
+
+def start_from_env():
+
+    ''' GFCC_TRACE=1 prints the summary, any other value is also the path of a trace file '''
+
+    value = os.environ.get('GFCC_TRACE')
+    if value and value != '0':
+        return start(None if value == '1' else value)
+    return None
+
+
+def enabled():
+    return _tracer is not None
+
+
+def finish():
+    global _tracer
+    if _tracer is not None:
+        _tracer.finish()
+        _tracer = None
+
+
+def traced_run(argv, run, in_session=False):
+
+    ''' Call run() -> (stdout, stderr, status) and record it '''
+
+    if _tracer is None:
+        return run()
+    caller = caller_name()
+    start_time = time.time()
+    out, err, status = run()
+    tracer = _tracer
+    if tracer:
+        tracer.record(argv, caller, start_time, time.time(), status, len(out), len(err), in_session)
+    return out, err, status
+
+
+def traced_stream(argv, lines, errors, in_session=False):
+
+    ''' Yield from a line generator and record it when it ends, errors is the list its stderr goes to '''
+
+    if _tracer is None:
+        yield from lines
+        return
+    caller = caller_name()
+    start_time = time.time()
+    out_bytes = 0
+    errors_before = len(errors)
+    try:
+        for line in lines:
+            out_bytes += len(line) + 1
+            yield line
+    finally:
+        lines.close()
+        tracer = _tracer
+        if tracer:
+            new_errors = errors[errors_before:]
+            status = 1 if any('Error' in line for line in new_errors) else 0
+            tracer.record(argv, caller, start_time, time.time(), status, out_bytes,
+                          sum(len(line) + 1 for line in new_errors), in_session)
+
+
+def record(argv, start_time, status, out_bytes, err_bytes, in_session=False):
+
+    ''' Record a command that ended now, for runners that cannot go through traced_run (asyncio) '''
+
+    tracer = _tracer
+    if tracer:
+        tracer.record(argv, caller_name(), start_time, time.time(), status, out_bytes, err_bytes, in_session)
@@ -1,38 +1,139 @@
 import os
 import re
+import shlex
 import subprocess
 import json
-import readline
+import tempfile
+import threading
+import time
+import heapq
+
+from   contextlib         import contextmanager
+from   concurrent.futures import ThreadPoolExecutor, Future
 
 from   os       import getcwd, walk, remove, chdir
-from   os.path  import abspath, join, isdir, relpath, dirname, split, exists
+from   os.path  import abspath, join, isdir, relpath, dirname, split, exists, basename
 from   shutil   import rmtree, copyfile
-from   pathlib  import Path
-from   datetime import datetime
+from   gfcc     import session
+from   gfcc     import cache
+from   gfcc     import configspec
+from   gfcc     import trace
+from   gfcc     import daemon
+from   gfcc     import textdiff
+from   gfcc     import paths
+from   gfcc     import ccfmt
 
 
 # Constants
 INDENTATION = '  '
 TEMPORARY_FILE_EXTENSIONS = ('~', '.contrib', '.keep', '.bak', '.swp', '.mkelem')
+MONTHS = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
+# Resolve the files selected by a cs other than the view's own locally instead of applying it, disable with
+# GFCC_NO_CS_ENGINE=1. A cs with rules only ClearCase resolves falls back to setcs. The view's own cs is always
+# listed with ls, which also shows its view-private files.
+EVALUATE_CS = not os.environ.get('GFCC_NO_CS_ENGINE')
+# Seconds subtracted from local timestamps used in -since queries, covers clock skew with the server
+CLOCK_SKEW_MARGIN = 300
 DEFAULT_CS = [
     'element * CHECKEDOUT',
     'element * /main/LATEST',
 ]
+# Max concurrent cleartool queries, can be overridden with GFCC_JOBS or gfcc --jobs
+JOBS = int(os.environ.get('GFCC_JOBS', 8))
+# Max elements sent in a single co/ci/unco command, can be overridden with GFCC_BATCH_SIZE
+BATCH_SIZE = int(os.environ.get('GFCC_BATCH_SIZE', 100))
+LIST_CHECKED_OUT_CMD = ['cleartool', 'lsco', '-cview', '-a', '-s']
+# Order of the fields of the history rows kept in the HistoryStore
+HISTORY_FIELDS = ('element', 'version', 'operation', 'date', 'user', 'comment', 'kind', 'event')
+RESERVED_STR = 'is checked out reserved'
+NOT_IN_CC_STR = 'not an element'
 
 
 def run_cmd(cmd, get_lines=False, background=False):
     ''' Run a command in the shell and return the output '''
 
     is_shell = not isinstance(cmd, (list, tuple))
+    argv = cmd_to_argv(cmd)
+    memo = cache.get_query_memo() if argv else None
     if background:
+        if memo:
+            memo.update(argv)
         return subprocess.Popen(cmd, shell=is_shell, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
     else:
-        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=is_shell)
-        decoded_out = result.stdout.decode('utf-8')
-        decoded_err = result.stderr.decode('utf-8')
+        result = memo.get(argv) if memo else None
+        if result is None:
+            in_session = bool(argv) and session.handles(argv)
+            result = trace.traced_run(argv or cmd.split(), lambda: execute_cmd(cmd, argv if in_session else None), in_session)
+            if memo:
+                memo.update(argv, result)
+            if argv and cache.mutates(argv):
+                daemon.notify(argv)
+        decoded_out, decoded_err, _ = result
         return (decoded_out, decoded_err) if not get_lines else (decoded_out.split('\n'), decoded_err.split('\n'))
 
 
+def execute_cmd(cmd, session_argv=None):
+
+    ''' (stdout, stderr, exit status) of a command, sent to a cleartool session if session_argv is given '''
+
+    if session_argv:
+        decoded_out, decoded_err = session.run(session_argv)
+        return decoded_out, decoded_err, (1 if 'cleartool: Error' in decoded_err else 0)
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=not isinstance(cmd, (list, tuple)))
+    return result.stdout.decode('utf-8'), result.stderr.decode('utf-8'), result.returncode
+
+
+def stream_cmd(cmd, errors=None):
+
+    ''' Run a command and yield its stdout lines as they are produced, stderr lines are added to errors '''
+
+    argv = cmd_to_argv(cmd)
+    errors = errors if errors is not None else []
+    memo = cache.get_query_memo() if argv else None
+    if memo:
+        memo.update(argv)
+    if argv and session.handles(argv):
+        yield from trace.traced_stream(argv, session.stream(argv, errors), errors, True)
+    else:
+        yield from trace.traced_stream(argv or cmd.split(), stream_process(cmd, errors), errors)
+
+
+def stream_process(cmd, errors):
+
+    ''' stdout lines of a command run in its own process, stderr lines are added to errors '''
+
+    process = subprocess.Popen(cmd, shell=not isinstance(cmd, (list, tuple)), stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    error_output = []
+    error_reader = threading.Thread(target=lambda: error_output.append(process.stderr.read()), daemon=True)
+    error_reader.start()
+    exhausted = False
+    try:
+        for line in process.stdout:
+            yield line.decode('utf-8', errors='replace').rstrip('\r\n')
+        exhausted = True
+    finally:
+        if not exhausted and process.poll() is None:
+            process.kill()
+        process.wait()
+        error_reader.join()
+        if error_output:
+            errors.extend(error_output[0].decode('utf-8', errors='replace').splitlines())
+
+
+def cmd_to_argv(cmd):
+
+    ''' argv of a command given as list or as a plain shell string, None if it needs a real shell '''
+
+    if isinstance(cmd, (list, tuple)):
+        return list(cmd)
+    if session.SHELL_METACHARACTERS.search(cmd):
+        return None
+    try:
+        return shlex.split(cmd)
+    except ValueError:
+        return None
+
+
 def exists_try(filepath):
     ''' Alternative exists() for some clearcase files not being identified '''
 
@@ -71,11 +172,27 @@ def difftool(file_a, file_b, background=False):
     return run_cmd([os.environ['DIFFTOOL'], file_a, file_b], background=background)
 
 
-def diff_text(file_a, file_b):
+def diff_text(file_a, file_b, context=textdiff.DEFAULT_CONTEXT, ignore_whitespace=False):
 
-    ''' Return diffs between two files as text lines '''
+    ''' Return a unified diff between two files or versions (file@@/main/3) as text lines '''
 
-    return run_cmd('diff ' + file_a + ' ' + file_b, get_lines=True)[0]
+    contents = []
+    for file_i in (file_a, file_b):
+        data = read_version(file_i) if '@@' in file_i else read_bytes(file_i)
+        if data is None:
+            print_indent('Error: cannot read ' + file_i, 1)
+            return []
+        contents.append(data)
+    diff = textdiff.diff_bytes(contents[0], contents[1], file_a, file_b, context, ignore_whitespace)
+    return diff.splitlines() if diff else []
+
+
+def read_bytes(path):
+    try:
+        with open(path, 'rb') as read_file:
+            return read_file.read()
+    except OSError:
+        return None
 
 
 def send_mail(subject, body, send_to):
@@ -124,7 +241,7 @@ def get_date_string():
 
     ''' Current date as string '''
 
-    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    return time.strftime("%Y-%m-%d %H:%M:%S")
 
 
 def range_str_to_list(range_str):
@@ -139,6 +256,9 @@ def choose_options(options, indent=0, choose_message='Choice: '):
 
     ''' Show a list of options and return the chosen index '''
 
+    # Line editing for input(), only loaded by the commands that ask
+    import readline
+
     for (index, option) in enumerate(options):
         print_indent('[' + str(index) + '] ' + option, indent)
     selection = None
@@ -207,31 +327,199 @@ def list_checked_out(directory=None, absolute=False):
 
     ''' Take the whole view/directory and returns abs/rel paths of the files '''
 
-    clearcase_cmd_list_checked_out = ['cleartool', 'lsco', '-cview', '-a', '-s']
-    output = run_cmd(clearcase_cmd_list_checked_out, True)[0]
+    return filter_checked_out(stream_cmd(LIST_CHECKED_OUT_CMD), directory, absolute)
+
+
+def filter_checked_out(output, directory=None, absolute=False):
+
+    ''' Checked-out files from lsco output, those under directory as rel paths unless absolute '''
+
     if not directory:
-        result = [item for item in output if item]
-    else:
-        directory = abspath(directory)
-        result = [(relpath(item, getcwd()) if not absolute else item) for item in output
-                  if item and item.startswith(directory)]
-    return result
+        return [item for item in output if item]
+    under_directory = paths.PathIndex(item for item in output if item).under(directory)
+    return under_directory if absolute else [relpath(item, getcwd()) for item in under_directory]
+
+
+def parallel_map(fn, items, jobs=None):
+
+    ''' Apply fn to every item using up to jobs threads, results keep the order of items '''
 
+    items = list(items)
+    jobs = min(jobs or JOBS, len(items))
+    if jobs <= 1:
+        return [fn(item) for item in items]
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        return list(executor.map(fn, items))
 
-def find_modifications(to_check, gui=False):
 
-    ''' Take one or a list of abs or rel paths and return the differences reported by cleartool '''
+def shard_paths(directory, shards=None):
+
+    ''' Elements in directory split in up to shards groups, to run a recursive query on each group concurrently.
+        View-private files are left out, cleartool refuses them. [[directory]] if there is nothing to split. '''
+
+    shards = shards or JOBS
+    if shards < 2:
+        return [[directory]]
+    output, errors = run_cmd(['cleartool', 'ls', '-short', '-nxname', '-vob_only', directory], True)
+    if any('Error' in line for line in errors):
+        return [[directory]]
+    entries = sorted(set(join(directory, basename(line.rstrip('/'))) for line in output if line.strip()))
+    if len(entries) < 2:
+        return [[directory]]
+    return [entries[index::shards] for index in range(min(shards, len(entries)))]
+
+
+def query_shards(directory, query):
+
+    ''' Results of query(paths, errors) run concurrently on each group of shard_paths(directory), and the error
+        lines of all of them, which are printed as their output is used anyway '''
+
+    shards = shard_paths(directory)
+    shard_errors = [[] for _ in shards]
+    results = parallel_map(lambda x: query(*x), zip(shards, shard_errors))
+    errors = [line for lines in shard_errors for line in lines if line.strip()]
+    print_indent(errors)
+    return results, errors
+
+
+def predecessor_versions(to_check, batch_size=None):
+
+    ''' Map checked-out files to the version-extended path of their predecessor, one describe per batch '''
+
+    batch_size = batch_size or BATCH_SIZE
+    predecessors = {}
+    for start in range(0, len(to_check), batch_size):
+        chunk = to_check[start:start + batch_size]
+        output = run_cmd(predecessors_cmd(chunk), True)[0]
+        predecessors.update(parse_predecessors(output, chunk))
+    return predecessors
+
+
+def predecessors_cmd(files):
+    return ['cleartool', 'describe'] + ccfmt.PREDECESSOR.args() + list(files)
+
+
+def parse_predecessors(output, files):
+    keys = {element_key(file_i): file_i for file_i in files}
+    predecessors = {}
+    for record in ccfmt.PREDECESSOR.parse(output):
+        if record.predecessor and element_key(record.element) in keys:
+            predecessors[keys[element_key(record.element)]] = element_key(record.element) + '@@' + record.predecessor
+    return predecessors
+
+
+def read_version(version_path):
+
+    ''' Contents of an immutable version as bytes, from the local cache or from ClearCase '''
+
+    version_cache = cache.get_version_cache()
+    data = version_cache.get(version_path) if version_cache else None
+    if data is not None:
+        return data
+    try:
+        # Dynamic views expose every version in the MVFS
+        with open(version_path, 'rb') as version_file:
+            data = version_file.read()
+    except OSError:
+        file_descriptor, temp_path = tempfile.mkstemp(prefix='gfcc_version_')
+        os.close(file_descriptor)
+        remove(temp_path)
+        run_cmd(['cleartool', 'get', '-to', temp_path, version_path])
+        if exists(temp_path):
+            with open(temp_path, 'rb') as version_file:
+                data = version_file.read()
+            remove(temp_path)
+    if data is not None and version_cache:
+        version_cache.put(version_path, data)
+    return data
+
+
+def diff_local(to_check, predecessor, context=textdiff.DEFAULT_CONTEXT, ignore_whitespace=False):
+
+    ''' Diff a file against the contents of its predecessor, returns (differences or None, whether it could be done) '''
+
+    old_data = read_version(predecessor)
+    new_data = read_bytes(to_check)
+    if old_data is None or new_data is None:
+        return None, False
+    return textdiff.diff_bytes(old_data, new_data, predecessor, to_check, context, ignore_whitespace), True
+
+
+def diff_predecessor(to_check, predecessor=None, context=textdiff.DEFAULT_CONTEXT, ignore_whitespace=False):
+
+    ''' Diff one file against its predecessor, return (differences or None, error or None) '''
+
+    if predecessor:
+        output, done = diff_local(to_check, predecessor, context, ignore_whitespace)
+        if done:
+            return output, None
+    clearcase_cmd_find_modifications = ['cleartool', 'diff', '-predecessor', to_check]
+    output, error = run_cmd(clearcase_cmd_find_modifications)
+    if 'identical' in output:
+        return None, None
+    if not output.strip():
+        return None, (error.strip() or 'no output from cleartool diff')
+    return output, None
+
+
+def diff_predecessors(to_check, jobs=None, context=textdiff.DEFAULT_CONTEXT, ignore_whitespace=False):
+
+    ''' diff_predecessor for a list of files, compared locally against their (cached) predecessor versions '''
+
+    to_check = list(to_check)
+    files = [file_i for file_i in to_check if not isdir(file_i)]
+    predecessors = predecessor_versions(files) if files else {}
+    return parallel_map(
+        lambda file_i: diff_predecessor(file_i, predecessors.get(file_i), context, ignore_whitespace), to_check, jobs)
+
+
+def find_modifications(to_check, gui=False, jobs=None, context=textdiff.DEFAULT_CONTEXT, ignore_whitespace=False):
+
+    ''' Take one or a list of abs or rel paths and return their differences with their predecessors '''
 
     if isinstance(to_check, (list, tuple)):
-        return list(filter(lambda x: x, [find_modifications(file_i, gui) for file_i in to_check]))
+        if gui:
+            return [find_modifications(file_i, gui) for file_i in to_check]
+        results = diff_predecessors(to_check, jobs, context, ignore_whitespace)
+        for file_i, (_, error) in zip(to_check, results):
+            if error:
+                print_indent('Error: could not diff ' + file_i + ': ' + error.split('\n')[0], 1)
+        return [output for output, _ in results if output]
     else:
-        clearcase_cmd_find_modifications = ['cleartool', 'diff']  + (['-graphical'] if gui else []) + ['-predecessor', to_check]
         if gui:
-            output = run_cmd(clearcase_cmd_find_modifications, background=True)
+            clearcase_cmd_find_modifications = ['cleartool', 'diff', '-graphical', '-predecessor', to_check]
+            return run_cmd(clearcase_cmd_find_modifications, background=True)
         else:
-            output = run_cmd(clearcase_cmd_find_modifications)[0]
-            modified = not 'identical' in output
-            return output if modified else None
+            return diff_predecessors([to_check], 1, context, ignore_whitespace)[0][0]
+
+
+def modified_files(to_check, jobs=None):
+
+    ''' Files in to_check that differ from their predecessor, only the ones whose stat data changed since
+        the last check are diffed again '''
+
+    to_check = list(to_check)
+    index = cache.get_stat_index()
+    if not index:
+        return [filename_from_diff(changed) for changed in find_modifications(to_check, jobs=jobs)]
+    verdicts = {}
+    stale = []
+    for file_i in to_check:
+        verdict = None if isdir(file_i) else index.lookup(abspath(file_i))
+        if verdict is None:
+            stale.append(file_i)
+        else:
+            verdicts[file_i] = verdict
+    snapshots = {file_i: index.snapshot(abspath(file_i)) for file_i in stale if not isdir(file_i)}
+    for file_i, (output, error) in zip(stale, diff_predecessors(stale, jobs)):
+        if error:
+            print_indent('Error: could not diff ' + file_i + ': ' + error.split('\n')[0], 1)
+            continue
+        verdicts[file_i] = bool(output)
+        if file_i in snapshots:
+            index.record(abspath(file_i), snapshots[file_i], bool(output))
+    index.save()
+    return [file_i for file_i in to_check if verdicts.get(file_i)]
 
 
 def filename_from_diff(modification):
@@ -240,38 +528,149 @@ def filename_from_diff(modification):
 
     if not modification:
         return None
-    file2 = re.search(r'(file|directory) 2:\s(.+)\s', modification)
-    return file2.group(2) if file2 else None
+    return ccfmt.diff_filename(modification)
 
 
 def list_untracked(directory):
 
     '''List non-versioned files'''
 
+    return list(iter_untracked(directory))
+
+
+def iter_untracked(directory):
+
+    ''' Yield non-versioned files as cleartool finds them '''
+
     directory = directory or '.'
     clearcase_cmd_find_untracked = ['cleartool', 'ls', '-rec', '-view_only', directory]
-    result = run_cmd(clearcase_cmd_find_untracked, True)
-    directory = None if abspath(directory) == getcwd() else relpath(abspath(directory), getcwd())
-    return list(filter(
-        lambda x: x and ('Rule' not in x) and (not directory or x.startswith(directory) or x.startswith('./' + directory)),
-        result[0]
-    ))
+    return filter_untracked(stream_cmd(clearcase_cmd_find_untracked), directory)
 
 
-def cc_lshist(item, lines=15, recursive=False, gui=False):
+def filter_untracked(output, directory):
 
-    '''ClearCase list history'''
+    ''' Non-versioned files under directory from ls -view_only output '''
 
-    clearcase_cmd_lshist = ['cleartool', 'lshistory'] \
-        + (['-recurse'] if recursive else []) \
-        + (['-graphical'] if gui else ['-last', str(lines)]) \
-        + [item]
+    directory = None if abspath(directory) == getcwd() else directory
+    return filter(lambda x: x and ('Rule' not in x) and (not directory or paths.is_under(x, directory)), output)
+
+
+def cc_lshist(item, lines=15, recursive=False, gui=False, stream=False):
+
+    '''ClearCase list history, with stream=True the lines are yielded as they arrive'''
+
+    clearcase_cmd_lshist = lshist_cmd(item, lines, recursive, gui)
+    if stream and not gui:
+        return stream_cmd(clearcase_cmd_lshist)
     result = run_cmd(clearcase_cmd_lshist, True, gui)
     if gui:
         return result
     else:
         return result[0]
 
+def lshist_cmd(item, lines=15, recursive=False, gui=False):
+    return ['cleartool', 'lshistory'] \
+        + (['-recurse'] if recursive else []) \
+        + (['-graphical'] if gui else ['-last', str(lines)]) \
+        + [item]
+
+
+def parse_history(lines):
+
+    ''' History records (element, version, user, date, comment, operation, kind, event) from lshistory or lsco
+        output printed with ccfmt.EVENT, comments may span several lines '''
+
+    events = []
+    for record in ccfmt.EVENT.parse(lines):
+        try:
+            timestamp = time.mktime(time.strptime(record.date, '%Y%m%d.%H%M%S'))
+        except ValueError:
+            timestamp = 0
+        events.append({
+            'element': abspath(record.element), 'version': record.version, 'user': record.user, 'date': timestamp,
+            'comment': record.comment, 'operation': record.operation, 'kind': record.kind, 'event': record.event,
+        })
+    return events
+
+
+def get_history(item, recursive=False, limit=None):
+
+    ''' History events of item (with everything under it if recursive), newest first, at most limit of them.
+        Recursive histories are kept in the HistoryStore and extended with lshistory -since, a stored ancestor
+        also answers for its subdirectories. The stored rows belong to the view, cs and checked-out directories
+        they were listed with, and a new directory version (an element added, removed or moved) lists them again,
+        as elements may have appeared with an earlier history. Checkouts disappear from the history when they are
+        checked in or cancelled, so they are not stored but listed with lsco every time. '''
+
+    item = abspath(item)
+    store = cache.get_history_store()
+    root = store.find(item) if store else None
+    if root is None and not (recursive and isdir(item)):
+        clearcase_cmd_lshist = ['cleartool', 'lshistory'] + (['-last', str(limit)] if limit is not None else []) \
+            + ccfmt.EVENT.args() + [item]
+        return newest_events(parse_history(stream_cmd(clearcase_cmd_lshist)), limit)
+
+    root = root or item
+    clearcase_cmd_lsco = ['cleartool', 'lsco', '-recurse'] + ccfmt.EVENT.args() + [root]
+    checkouts = [[event[field] for field in HISTORY_FIELDS]
+                 for event in parse_history(run_cmd(clearcase_cmd_lsco, True)[0])]
+    scope = None
+    if store:
+        checked_out_directories = sorted(row[0] + '@@' + row[1] for row in checkouts if row[6] == 'directory version')
+        scope = cache.hash_lines([get_working_view_name()] + get_cs_text() + checked_out_directories)
+    last_seen, rows = store.load(root, scope) if store else (None, [])
+    query_started = time.time()
+    new_rows = history_rows(root, last_seen, rows)
+    if last_seen and any(row[6] == 'directory version' for row in new_rows):
+        last_seen, rows = None, []
+        new_rows = history_rows(root, None, rows)
+    if store:
+        store.append(root, new_rows, query_started, scope, replace=not last_seen)
+    rows += new_rows + checkouts
+
+    prefix = item.rstrip(os.sep) + os.sep
+    in_scope = [row for row in rows if row[0] == item or (recursive and row[0].startswith(prefix))]
+    # Elements renamed or removed since their rows were stored are no longer in the view
+    visible = set(element for element in set(row[0] for row in in_scope) if os.path.lexists(element))
+    in_scope = [row for row in in_scope if row[0] in visible]
+    newest = heapq.nlargest(limit, in_scope, key=lambda x: x[3]) if limit is not None \
+        else sorted(in_scope, key=lambda x: x[3], reverse=True)
+    return [dict(zip(HISTORY_FIELDS, row)) for row in newest]
+
+
+def history_rows(root, last_seen, rows):
+
+    ''' HistoryStore rows of the versions created under root, only since last_seen if provided (skipping those
+        already in rows) '''
+
+    since = last_seen - CLOCK_SKEW_MARGIN if last_seen else None
+    clearcase_cmd_lshist = ['cleartool', 'lshistory', '-recurse'] + ccfmt.EVENT.args() \
+        + (['-since', cc_date(since)] if since else []) + [root]
+    # -since repeats the events of the margin, skip those already stored
+    known = set(tuple(row[:4]) for row in rows if since and row[3] >= since)
+    new_rows = []
+    for event in parse_history(stream_cmd(clearcase_cmd_lshist)):
+        row = [event[field] for field in HISTORY_FIELDS]
+        if event['operation'] != 'checkout' and tuple(row[:4]) not in known:
+            known.add(tuple(row[:4]))
+            new_rows.append(row)
+    return new_rows
+
+
+def newest_events(events, limit=None):
+    events = sorted(events, key=lambda x: x['date'], reverse=True)
+    return events if limit is None else events[:limit]
+
+
+def format_event(event):
+
+    ''' Lines showing a history record like cleartool lshistory does '''
+
+    line = cc_date(event['date']) + '  ' + event['user'] + '  ' + event['event'] \
+        + ' "' + relpath(event['element']) + '@@' + event['version'] + '"'
+    return [line] + ['  "' + comment + '"' for comment in event['comment'].split('\n') if comment]
+
+
 def cc_xlsvtree(item):
 
     '''ClearCase open tree'''
@@ -288,8 +687,8 @@ def cc_get_selected(item):
         return [cc_get_selected(element) for element in item]
     else:
         clearcase_cmd_get_v_rule = ['cleartool', 'ls', item]
-        result = run_cmd(clearcase_cmd_get_v_rule, True)
-        return regex_match(r'^(?P<cc_path>.*?)\s', result[0][0])['cc_path']
+        record = ccfmt.parse_ls_line(run_cmd(clearcase_cmd_get_v_rule, True)[0][0])
+        return (record.element + '@@' + record.version if record.version else record.element) if record else None
 
 
 def start_view(view):
@@ -303,15 +702,80 @@ def start_view(view):
     return result
 
 
-def cc_checkout(to_cc, verbose_indent=1):
+def element_key(path):
+
+    ''' Normalized path of an element, without any @@version extension '''
+
+    return os.path.normpath(abspath(path.split('@@')[0]))
+
+
+def split_batch_output(elements, output_lines):
+
+    ''' Assign each line of a multi-element cleartool output to the element it talks about '''
+
+    keys = {element_key(element): index for index, element in enumerate(elements)}
+    per_element = [[] for _ in elements]
+    pending = []
+    last = None
+    for line in output_lines:
+        if not line:
+            continue
+        index = None
+        for quoted in ccfmt.quoted(line):
+            index = keys.get(element_key(quoted)) if quoted else None
+            if index is not None:
+                break
+        if index is None:
+            pending.append(line)
+        else:
+            per_element[index].extend(pending + [line])
+            pending = []
+            last = index
+    if pending:
+        for index in ([last] if last is not None else range(len(elements))):
+            per_element[index].extend(pending)
+    return per_element
+
+
+def cc_run_batch(clearcase_cmd, elements, batch_size=None):
+
+    ''' Run clearcase_cmd on chunks of elements, return one (stdout lines, stderr lines) per element '''
+
+    batch_size = batch_size or BATCH_SIZE
+    results = []
+    for start in range(0, len(elements), batch_size):
+        chunk = elements[start:start + batch_size]
+        out, err = run_cmd(clearcase_cmd + list(chunk), True)
+        results.extend(zip(split_batch_output(chunk, out), split_batch_output(chunk, err)))
+    return results
+
+
+def checkx_status(result, succes_str):
+
+    ''' Classify the (stdout lines, stderr lines) of one element as success, reserved, not_element or error '''
+
+    if any([(succes_str in line.lower()) for line in result[0]]):
+        return 'success'
+    elif any([(RESERVED_STR in line.lower()) for line in result[1]]):
+        return 'reserved'
+    elif any([(NOT_IN_CC_STR in line.lower()) for line in result[1]]):
+        return 'not_element'
+    return 'error'
+
+
+def cc_checkout(to_cc, verbose_indent=1, batch_size=None):
 
     '''ClearCase checkout wrapper'''
 
+    clearcase_cmd_checkout = ['cleartool', 'co', '-unr', '-nc', '-version']
     if isinstance(to_cc, (list, tuple)):
-        return [cc_checkout(element, verbose_indent) for element in to_cc]
+        results = cc_run_batch(clearcase_cmd_checkout, to_cc, batch_size)
+        if verbose_indent:
+            for element in to_cc:
+                print_indent('Checked out: ' + element, verbose_indent)
+        return results
     else:
-        clearcase_cmd_checkout = ['cleartool', 'co', '-unr', '-nc', '-version', to_cc]
-        result = run_cmd(clearcase_cmd_checkout, True)
+        result = run_cmd(clearcase_cmd_checkout + [to_cc], True)
         if verbose_indent:
             print_indent('Checked out: ' + to_cc, verbose_indent)
         return result
@@ -328,65 +792,135 @@ def copy_co(item, view):
     print_indent('Copied ' + item + ' from ' + view, 1)
 
 
-def cc_checkin(to_cc, message, identical=False, verbose_indent=1, add_rule_to_cs=False):
+def cc_checkin(to_cc, message, identical=False, verbose_indent=1, add_rule_to_cs=False, batch_size=None):
 
     ''' ClearCase checkin wrapper '''
 
+    clearcase_cmd_checkin = ['cleartool', 'ci', '-c', message] + (['-identical'] if identical else [])
     if isinstance(to_cc, (list, tuple)):
-        return [cc_checkin(element, message, identical, verbose_indent) for element in to_cc]
+        results = cc_run_batch(clearcase_cmd_checkin, to_cc, batch_size)
+        for element, result in zip(to_cc, results):
+            report_checkin(element, result, verbose_indent, add_rule_to_cs)
+        return results
     else:
-        clearcase_cmd_checkin = ['cleartool', 'ci', '-c', message] + (['-identical'] if identical else []) + [to_cc]
-        result = run_cmd(clearcase_cmd_checkin, True)
-        if verbose_indent:
-            search_version = re.search(r'^.*?version "(?P<version>.*?)"', result[0][0])
-            if search_version and search_version.group('version'):
-                rule = 'element ' + to_cc + ' ' + search_version.group('version')
-                if verbose_indent != None:
-                    print_indent('Checked in: ' + to_cc, verbose_indent)
-                    if not add_rule_to_cs:
-                        print_indent('Add the following rule to your cs to select this version:', verbose_indent + 1)
-                        print_indent(rule, verbose_indent + 1)
-                if add_rule_to_cs:
-                    print_indent('Added to your cs.', verbose_indent + 1)
-                    add_rule_to_current_cs(rule)
-            else:
-                print_indent('Error checking-in: ' + to_cc, verbose_indent)
+        result = run_cmd(clearcase_cmd_checkin + [to_cc], True)
+        report_checkin(to_cc, result, verbose_indent, add_rule_to_cs)
         return result
 
 
-def cc_uncheckout(to_cc, keep, verbose_indent=1):
+def report_checkin(to_cc, result, verbose_indent=1, add_rule_to_cs=False):
+
+    ''' Print the rule selecting a checked-in version, or add it to the cs '''
+
+    if verbose_indent:
+        version = ccfmt.quoted_after(result[0][0], 'version') if result[0] else None
+        if version:
+            rule = 'element ' + to_cc + ' ' + version
+            if verbose_indent != None:
+                print_indent('Checked in: ' + to_cc, verbose_indent)
+                if not add_rule_to_cs:
+                    print_indent('Add the following rule to your cs to select this version:', verbose_indent + 1)
+                    print_indent(rule, verbose_indent + 1)
+            if add_rule_to_cs:
+                print_indent('Added to your cs.', verbose_indent + 1)
+                add_rule_to_current_cs(rule)
+        else:
+            print_indent('Error checking-in: ' + to_cc, verbose_indent)
+
+
+def cc_uncheckout(to_cc, keep, verbose_indent=1, batch_size=None):
 
     ''' ClearCase uncheckout wrapper '''
 
+    clearcase_cmd_uncheckout = ['cleartool', 'unco', '-keep' if keep else '-rm']
     if isinstance(to_cc, (list, tuple)):
-        return [cc_uncheckout(element, keep, verbose_indent) for element in to_cc]
+        if verbose_indent:
+            for element in to_cc:
+                print_indent('Uncheckout: ' + element, verbose_indent)
+        return cc_run_batch(clearcase_cmd_uncheckout, to_cc, batch_size)
     else:
         if verbose_indent:
             print_indent('Uncheckout: ' + to_cc, verbose_indent)
-        clearcase_cmd_uncheckout = ['cleartool', 'unco', '-keep' if keep else '-rm']
         result = run_cmd(clearcase_cmd_uncheckout + [to_cc], True)
         return result
 
 
-def cc_mkelem(to_cc, message, verbose_indent=1, add_rule_to_cs=False):
+def cc_mkelem(to_cc, message, verbose_indent=1, add_rule_to_cs=False, batch_size=None):
+
+    ''' ClearCase make element wrapper. Every parent directory is checked out and in once, with its new children
+        created in batches in between, shallower directories first so new directories exist before their contents.
+        With add_rule_to_cs, the rules of the directories of each depth are set before going into the next one, as
+        the cs (for instance one pinned to a label) may not select them otherwise. '''
+
+    if not isinstance(to_cc, (list, tuple)):
+        return cc_mkelem([to_cc], message, verbose_indent, add_rule_to_cs, batch_size)[0]
+
+    by_parent = {}
+    for element in to_cc:
+        by_parent.setdefault(dirname(abspath(element)), []).append(element)
+    results = {}
+    rules = []
+    directory_rules = []
+    depths = sorted({parent.count(os.sep) for parent in by_parent})
+    for depth in depths:
+        depth_rules = []
+        parents = [parent for parent in by_parent if parent.count(os.sep) == depth]
+        cc_checkout(parents, verbose_indent=0, batch_size=batch_size)
+        for parent in parents:
+            children = by_parent[parent]
+            for directories in (True, False):
+                batch = [element for element in children if isdir(element) == directories]
+                if not batch:
+                    continue
+                clearcase_cmd_mkelem = ['cleartool', 'mkelem', '-c', message, '-ci'] + (['-mkpath'] if directories else [])
+                for element, result in zip(batch, cc_run_batch(clearcase_cmd_mkelem, batch, batch_size)):
+                    results[element] = result
+                    if verbose_indent:
+                        print_indent('Create and Checkin: ' + element, verbose_indent)
+                    version = checked_in_version(result)
+                    if version and abspath(element) in by_parent:
+                        # Checked out again below, its children must be visible to be created
+                        if add_rule_to_cs:
+                            depth_rules.append('element ' + element + ' ' + version)
+                    elif version:
+                        rules.append('element ' + element + ' ' + version)
+            added = ', '.join(basename(element) for element in children)
+            parent_result = run_cmd(['cleartool', 'ci', '-c', 'Added ' + added, parent], True)
+            version = checked_in_version(parent_result)
+            if version:
+                depth_rules.append('element ' + parent + ' ' + version)
+                if verbose_indent:
+                    print_indent('Checked in updated containing directory: ' + parent, verbose_indent)
+            else:
+                print_indent('Error checking-in: ' + parent, verbose_indent)
+        directory_rules.extend(depth_rules)
+        if add_rule_to_cs and depth != depths[-1]:
+            for rule in depth_rules:
+                add_rule_to_current_cs(rule)
+            flush_cs_transaction()
+
+    if add_rule_to_cs:
+        for rule in depth_rules:
+            add_rule_to_current_cs(rule)
+        if directory_rules and verbose_indent:
+            print_indent('Added the rules of the ' + str(len(directory_rules)) + ' updated directories to your cs.', verbose_indent)
+    else:
+        rules = directory_rules + rules
+    if rules and verbose_indent:
+        print_indent('Add the following rules to your cs to select these versions:', verbose_indent)
+        print_indent(rules, verbose_indent + 1)
+    return [results.get(element, ([], [])) for element in to_cc]
 
-    ''' ClearCase make element wrapper '''
 
-    if isinstance(to_cc, (list, tuple)):
-        return [cc_mkelem(element, message) for element in to_cc]
-    else:
-        cc_checkout(dirname(abspath(to_cc)))
-        clearcase_cmd_mkelem = ['cleartool', 'mkelem', '-c', message, '-ci', ('-mkpath' if isdir(to_cc) else ''), to_cc]
-        mk_result = run_cmd(clearcase_cmd_mkelem, True)
-        if verbose_indent:
-            print_indent('Create and Checkin: ' + to_cc, verbose_indent)
-            search_version = re.search(r'^.*?version "(?P<version>.*?)"', mk_result[0][0])
-            if search_version and search_version.group('version'):
-                print_indent('Add the following rule to your cs to select this version:', verbose_indent + 1)
-                print_indent('element ' + to_cc + ' ' + search_version.group('version'), verbose_indent + 1)
-            print_indent('Checking-in updated containing directory', verbose_indent)
-        cc_checkin(dirname(abspath(to_cc)), 'Added file ' + to_cc, verbose_indent=verbose_indent, add_rule_to_cs=add_rule_to_cs)
-        return mk_result
+def checked_in_version(result):
+
+    ''' Version reported in the (stdout lines, stderr lines) of a ci or mkelem -ci, None if there is none '''
+
+    for line in result[0]:
+        version = ccfmt.quoted_after(line, 'version')
+        if version:
+            return version
+    return None
 
 
 def cc_checkx(select, recursive, selected_item, untracked=False, **kwargs):
@@ -414,8 +948,6 @@ def cc_checkx(select, recursive, selected_item, untracked=False, **kwargs):
             'fn': cc_mkelem,
             'parameters': ['message', 'add_rule_to_cs']
         },
-        'reserved_str': 'is checked out reserved',
-        'not_in_cc_str': 'not an element',
     }
 
     arguments = {name: kwargs[name] for name in config[select]['parameters']}
@@ -429,76 +961,224 @@ def cc_checkx(select, recursive, selected_item, untracked=False, **kwargs):
     else:
         file_list = [selected_item]
 
-    modified_files, untracked_files, _ = get_status(get_modified=True, get_untracked=True,item=selected_item)
-    untracked_filtered = [f for f in untracked_files if not f.endswith(TEMPORARY_FILE_EXTENSIONS)]
+    to_checkin = []
+    if select == 'in' and not (single_item or arguments['identical']):
+        status = StatusSnapshot(item=selected_item)
+        status.prefetch('modified', *(['untracked'] if untracked else []))
+        untracked_filtered = [f for f in status.untracked if not f.endswith(TEMPORARY_FILE_EXTENSIONS)] if untracked else []
+        to_checkin = paths.PathIndex(status.modified + untracked_filtered)
 
     success = {file_i:{select: False} for file_i in file_list}
+    to_process = []
     for file_i in file_list:
         process_file = False
         if select == 'in':
             if single_item or arguments['identical']:
                 process_file = True
-            elif (file_i in modified_files + (untracked_filtered if untracked else [])):
+            elif (file_i in to_checkin):
                 process_file = True
         else:
             process_file = True
-
         if process_file:
-            result = config[select]['fn'](file_i, **arguments)
-            if any([(config[select]['succes_str'] in line.lower()) for line in result[0]]):
+            to_process.append(file_i)
+
+    with cs_transaction():
+        results = config[select]['fn'](to_process, **arguments) if to_process else []
+        stat_index = cache.get_stat_index()
+        if stat_index and to_process:
+            # The predecessor of these files changed, or they are no longer checked out
+            stat_index.forget([abspath(file_i) for file_i in to_process])
+            stat_index.save()
+        to_make = []
+        for file_i, result in zip(to_process, results):
+            status = checkx_status(result, config[select]['succes_str'])
+            if status == 'success':
                 success[file_i] = {select: True}
-            elif any([(config['reserved_str'] in line.lower()) for line in result[1]]):
+            elif status == 'reserved':
                 print_indent('Error File is reserved: ' + file_i, 1)
-            elif any([(config['not_in_cc_str'] in line.lower()) for line in result[1]]) and select == 'in':
-                mk_arguments = {name: kwargs[name] for name in config['mk']['parameters']}
-                mk_result = config['mk']['fn'](file_i, **mk_arguments)
-                if any([(config['mk']['succes_str'] in line.lower()) for line in mk_result[0]]):
-                    success[file_i] = {'mk': True}
-                else:
-                    print_indent(mk_result[0] + mk_result[1], 1)
+            elif status == 'not_element' and select == 'in':
+                to_make.append(file_i)
             elif single_item:
                 print_indent('Ignored: ' + file_i, 1)
             else:
                 if False: # Use for debug cc_checkx
                     print_indent('Unexpected result for ' + file_i, 1)
                     print_indent(result, 1)
+        if to_make:
+            mk_arguments = {name: kwargs[name] for name in config['mk']['parameters']}
+            for file_i, mk_result in zip(to_make, config['mk']['fn'](to_make, **mk_arguments)):
+                if checkx_status(mk_result, config['mk']['succes_str']) == 'success':
+                    success[file_i] = {'mk': True}
+                else:
+                    print_indent(mk_result[0] + mk_result[1], 1)
+    return success
 
 
-def add_rule_to_current_cs(rule):
-    block_subdirs = ('rtl', 'tb', 'syn', 'sim', 'cs')
-    configspec = get_cs_text()
+_cs_transaction = None
+
 
-    comment_line = None
-    checkout_line = None
+def rule_section(rule):
+
+    ''' Block subdirectory (rtl, tb, syn, sim, cs) a rule belongs to, None if it is not in the current block '''
 
     current_block = get_block_name_path()[1]
     rule_subdir = None
-    for subdir in block_subdirs:
-        test_subdir = join(abspath(current_block), subdir) + os.sep
-        if (' ' + test_subdir) in rule:
-            rule_subdir = subdir
-
-    found_comment = None
-    if rule_subdir:
-        found_comment = find_lines(r'\s*#+\s*(' + rule_subdir + '|' + rule_subdir.upper() + ')', configspec)
-    if not found_comment:
-        found_comment = find_lines(r'\s*#+\s*Work in progress:', configspec)
-
-    if found_comment:
-        comment_line = found_comment[0] + 1
-    else:
-        found_checkout = find_lines(r'.*element.*\bCHECKEDOUT\b', configspec)
-        if found_checkout:
-            checkout_line = found_checkout[0] + 1
-
-    if comment_line:
-        configspec[comment_line:comment_line] = [rule]
-    elif checkout_line:
-        configspec[checkout_line:checkout_line] = ['', '', '# Work in progress:'] + [rule] + ['', '']
-    else:
+    if current_block:
+        for subdir in configspec.SECTION_SUBDIRS:
+            test_subdir = join(abspath(current_block), subdir) + os.sep
+            if (' ' + test_subdir) in rule:
+                rule_subdir = subdir
+    return rule_subdir
+
+
+@contextmanager
+def cs_transaction():
+
+    ''' Queue every add_rule_to_current_cs() done inside the block and apply them with a single setcs '''
+
+    global _cs_transaction
+    if _cs_transaction is not None:
+        yield
+        return
+    _cs_transaction = []
+    try:
+        yield
+    finally:
+        pending, _cs_transaction = _cs_transaction, None
+        commit_rules(pending)
+
+
+def flush_cs_transaction():
+
+    ''' Apply the rules queued so far by cs_transaction() now, for commands that need the cs to select the new
+        versions before going on (mkelem inside a directory it just created) '''
+
+    if _cs_transaction:
+        pending = list(_cs_transaction)
+        del _cs_transaction[:]
+        commit_rules(pending)
+
+
+def commit_rules(pending):
+
+    ''' Add [(rule, section)] to the current cs with a single setcs '''
+
+    if pending:
+        configspec_model = configspec.ConfigSpec(get_cs_text())
+        for rule, section in pending:
+            configspec_model.add_rule(rule, section)
+        commit_cs(configspec_model)
+
+
+def commit_cs(configspec_model):
+
+    ''' Apply the queued rules of a ConfigSpec and set it as the current cs '''
+
+    if configspec_model.apply():
         print_indent('Error: CHECKEDOUT rule not found in the current cs.')
+    set_cs(configspec_model.lines)
+
+
+def add_rule_to_current_cs(rule):
+
+    ''' Add a rule to the current cs, inside cs_transaction() it is queued until the transaction ends '''
+
+    if _cs_transaction is not None:
+        _cs_transaction.append((rule, rule_section(rule)))
+    else:
+        configspec_model = configspec.ConfigSpec(get_cs_text())
+        configspec_model.add_rule(rule, rule_section(rule))
+        commit_cs(configspec_model)
+
+
+def status_directory(item=None, whole_view=False):
+
+    ''' Directory whose status is collected for item, None for the whole view '''
+
+    return item if (item and isdir(item)) else (None if whole_view else getcwd())
+
+
+class StatusSnapshot:
+
+    ''' Checked-out, modified, untracked and checked-out-unmodified files, each one computed on first access '''
+
+    def __init__(self, item=None, whole_view=False):
+        self.item = item
+        self.directory = status_directory(item, whole_view)
+        self.futures = {}
+        self.lock = threading.Lock()
+
+    def prefetch(self, *names):
+
+        ''' Start computing the given fields in the background, independent queries run concurrently '''
+
+        for name in names:
+            self._future(name)
+
+    def _future(self, name):
+        with self.lock:
+            if name not in self.futures:
+                future = Future()
+                self.futures[name] = future
+                threading.Thread(target=self._compute, args=(name, future), daemon=True).start()
+            return self.futures[name]
+
+    def _compute(self, name, future):
+        try:
+            future.set_result(getattr(self, '_compute_' + name)())
+        except BaseException as error:
+            future.set_exception(error)
+
+    def _get(self, name):
+        return self._future(name).result()
+
+    def _remote(self, name):
+
+        ''' Field as known by the gfcc daemon serving the directory, None if there is none '''
+
+        return daemon.query_status(self.directory, name) if self.directory else None
+
+    def _compute_checked_out(self):
+        remote = self._remote('checked_out')
+        return remote if remote is not None else list_checked_out(self.directory)
+
+    def _compute_modifications(self):
+        remote = self._remote('modifications')
+        return remote if remote is not None else find_modifications(self._get('checked_out'))
+
+    def _compute_modified(self):
+        remote = self._remote('modifications')
+        if remote is not None:
+            return [filename_from_diff(changed) for changed in remote]
+        return modified_files(self._get('checked_out'))
+
+    def _compute_untracked(self):
+        remote = self._remote('untracked')
+        return remote if remote is not None else list_untracked(self.directory)
+
+    def _compute_checked_out_unmodified(self):
+        self.prefetch('checked_out', 'modified')
+        return list(set(self._get('checked_out')) - set(self._get('modified')))
 
-    set_cs(configspec)
+    @property
+    def checked_out(self):
+        return to_abs_path(self._get('checked_out'))
+
+    @property
+    def modifications(self):
+        return self._get('modifications')
+
+    @property
+    def modified(self):
+        return to_abs_path(self._get('modified'))
+
+    @property
+    def untracked(self):
+        return to_abs_path(self._get('untracked'))
+
+    @property
+    def checked_out_unmodified(self):
+        return to_abs_path(self._get('checked_out_unmodified'))
 
 
 def get_status(get_modified=False, get_untracked=False, get_checkedout_unmodified=False,
@@ -506,27 +1186,32 @@ def get_status(get_modified=False, get_untracked=False, get_checkedout_unmodifie
 
     ''' Collect checked-out, modified, untracked if requested '''
 
-    directory = item if (item and isdir(item)) else (None if whole_view else getcwd())
-    checked_out_files = list_checked_out(directory)
-    modifications = find_modifications(checked_out_files)
-
-    modified_files = [filename_from_diff(changed) for changed in modifications] if get_modified else []
-    untracked_files = list_untracked(directory) if get_untracked else []
-    checked_out_unmodified = list(set(checked_out_files) - set(modified_files)) if get_checkedout_unmodified else []
-
-    return (to_abs_path(modified_files), to_abs_path(untracked_files), to_abs_path(checked_out_unmodified))
+    status = StatusSnapshot(item, whole_view)
+    status.prefetch(*[name for name, requested in (
+        ('modified', get_modified),
+        ('untracked', get_untracked),
+        ('checked_out_unmodified', get_checkedout_unmodified),
+    ) if requested])
+
+    return (
+        status.modified if get_modified else [],
+        status.untracked if get_untracked else [],
+        status.checked_out_unmodified if get_checkedout_unmodified else [],
+    )
 
 
 def get_working_view_name():
 
     " Get current view name as string "
 
-    result_pwv = run_cmd('cleartool pwv', get_lines=True)
-    if not any(['Set view: ** NONE **' in line for line in result_pwv[0]]):
-        search_view = re.search(r'^Set view: (?P<view>.*?)$', result_pwv[0][1])
-        if search_view:
-            return search_view.group('view')
-    return None
+    remote = daemon.query_status(getcwd(), 'view')
+    if remote:
+        return remote
+    return view_name_from_pwv(run_cmd('cleartool pwv', get_lines=True)[0])
+
+
+def view_name_from_pwv(lines):
+    return ccfmt.parse_pwv(lines)
 
 
 def get_cs_text(cs_filename=None, view=False):
@@ -550,6 +1235,235 @@ def get_cs_text(cs_filename=None, view=False):
         return run_cmd('cleartool catcs', get_lines=True)[0]
 
 
+def cc_date(timestamp):
+
+    ''' Format a unix timestamp as a cleartool date-time, independent of the locale '''
+
+    local = time.localtime(timestamp)
+    return '%02d-%s-%04d.%02d:%02d:%02d' % (
+        local.tm_mday, MONTHS[local.tm_mon - 1], local.tm_year, local.tm_hour, local.tm_min, local.tm_sec)
+
+
+def directory_mtimes(directory='.'):
+
+    ''' mtime of every directory under the provided one, elements or files added/removed change them '''
+
+    mtimes = {}
+    for root, _, _ in walk(directory):
+        try:
+            mtimes[root] = os.stat(root).st_mtime_ns
+        except OSError:
+            pass
+    return mtimes
+
+
+def changed_since(timestamp, directory='.', minor=False):
+
+    ''' Whether any version was created or checked out under directory after timestamp, minor includes labels '''
+
+    clearcase_cmd_lshist = ['cleartool', 'lshistory', '-recurse', '-short'] + (['-minor'] if minor else []) \
+        + ['-since', cc_date(timestamp - CLOCK_SKEW_MARGIN), directory]
+    output, error = run_cmd(clearcase_cmd_lshist, True)
+    return any(output) or any(['Error' in line for line in error])
+
+
+def checked_out_list(directory='.'):
+
+    ''' Sorted [[element abspath, version]] of the elements checked out under directory, as stored in manifests '''
+
+    return sorted([element, version] for element, version in checked_out_versions(directory).items())
+
+
+def manifest_is_current(manifest, live, directory='.'):
+
+    ''' A stored scan is current if no version changed since, the same elements are checked out (an uncheckout
+        leaves nothing in lshistory) and, for the live cs, no directory changed '''
+
+    if live and manifest.get('directory_mtimes') != directory_mtimes(directory):
+        return False
+    if manifest.get('query') == 'ls' and manifest.get('checked_out') != checked_out_list(directory):
+        return False
+    return not changed_since(manifest['created'], directory)
+
+
+def get_version_trees(directory='.'):
+
+    ''' Versions and labels of every element under directory, from one lshistory, cached locally '''
+
+    directory = abspath(directory)
+    manifest_store = cache.get_manifest_store()
+    if manifest_store:
+        manifest_key = manifest_store.key(None, get_working_view_name(), directory, 'version_trees')
+        manifest = manifest_store.load(manifest_key)
+        if manifest and not changed_since(manifest['created'], directory, minor=True):
+            return manifest['files']
+        scan_started = time.time()
+
+    # Subtrees are scanned concurrently, their elements do not overlap
+    trees = {}
+    shard_trees, errors = query_shards(directory, lambda paths, errors: parse_version_trees(stream_cmd(
+        ['cleartool', 'lshistory', '-recurse'] + ccfmt.TREE_VERSION.args() + paths, errors)))
+    for trees_i in shard_trees:
+        trees.update(trees_i)
+    trees.pop(directory, None)
+
+    if manifest_store and not errors:
+        manifest_store.save(manifest_key, trees, created=scan_started, view=get_working_view_name(),
+                            directory=directory, query='version_trees')
+    return trees
+
+
+def parse_version_trees(lines):
+
+    ''' {element: {'kind', 'versions': {version: labels}}} from lshistory lines printed with ccfmt.TREE_VERSION '''
+
+    trees = {}
+    for kind, version, labels, element in ccfmt.TREE_VERSION.parse(lines):
+        if not version.startswith('/') or version.endswith('/CHECKEDOUT'):
+            continue
+        tree = trees.setdefault(abspath(element), {'kind': None, 'versions': {}})
+        if 'directory' in kind:
+            tree['kind'] = 'directory'
+        matched = configspec.VERSION_NUMBER.match(version)
+        branch = matched.group('branch') if matched else version
+        tree['versions'].setdefault(branch + '/0', [])
+        if matched:
+            tree['versions'][version] = labels.split()
+    return trees
+
+
+def checked_out_versions(directory='.'):
+
+    ''' {element abspath: version} of the elements checked out in this view under directory '''
+
+    clearcase_cmd_lsco = ['cleartool', 'lsco', '-cview', '-recurse'] + ccfmt.VERSION.args() + [directory]
+    return {abspath(record.element): record.version.strip()
+            for record in ccfmt.VERSION.parse(run_cmd(clearcase_cmd_lsco, True)[0]) if record.version}
+
+
+def read_cs_include(path):
+
+    ''' Lines of a file included from a config spec, None if it cannot be read '''
+
+    try:
+        return get_cs_text(path)
+    except OSError:
+        return None
+
+
+def evaluate_cs(cs_text, get_latest=False, directory='.', known_trees=None):
+
+    ''' Files and versions a config spec selects under directory, computed locally without setcs.
+        Returns None when the cs uses rules that only ClearCase can resolve or a query fails.
+        known_trees ({directory: version trees}) shares the lshistory scans between several evaluations. '''
+
+    try:
+        rules = configspec.parse(cs_text, read_cs_include) if not get_latest else None
+    except configspec.UnsupportedRule:
+        return None
+    if known_trees is None:
+        trees = get_version_trees(directory)
+    else:
+        if directory not in known_trees:
+            known_trees[directory] = get_version_trees(directory)
+        trees = known_trees[directory]
+    strip_prefix = regex_match(r'^(?P<prefix>/view/[^/]+)/', abspath(directory))
+    if get_latest:
+        selected = configspec.latest_on_main(trees, excluded_label='find')
+    else:
+        try:
+            selected = select_visible(rules, directory, trees, checked_out_versions(directory),
+                                      strip_prefix['prefix'] if strip_prefix else None)
+        except configspec.UnsupportedRule:
+            return None
+        if selected is None:
+            return None
+        # View-private files stay in the view after a setcs, where their directory is still visible
+        for private in sorted(abspath(line) for line in iter_untracked(directory)):
+            if dirname(private) == abspath(directory) or dirname(private) in selected:
+                selected[private] = {'version': '', 'rule': ''}
+    return {relpath(path, abspath(directory)): selection for path, selection in selected.items()}
+
+
+def select_visible(rules, directory, trees, checked_out, strip_prefix=None):
+
+    ''' {path: {'version', 'rule'}} of the elements the rules make visible under directory. As in a view, elements are
+        the entries of the directory versions selected, down from directory itself, so the ones only some directory
+        versions hold are found or left out like setcs would. Elements are matched to trees by path, the trees of
+        the ones the view does not show are read with lshistory and added to trees. None if a query fails. '''
+
+    root = abspath(directory)
+    selected = {}
+    # (path, plain or version-extended path that reaches the element through the directory versions selected)
+    level = [(root, root)]
+    while level:
+        missing = [(path, extended) for path, extended in level if path not in trees]
+        for (path, _), tree in zip(missing, parallel_map(lambda x: element_tree(x[1]), missing)):
+            if tree is None:
+                return None
+            trees[path] = tree
+        directories = []
+        for path, extended in level:
+            match_path = path[len(strip_prefix):] if (strip_prefix and path.startswith(strip_prefix)) else path
+            choice = configspec.select(rules, match_path, trees[path], checked_out.get(path))
+            if not choice:
+                continue
+            if path != root:
+                selected[path] = choice
+            if trees[path]['kind'] == 'directory':
+                directories.append((path, extended, choice['version']))
+        level = []
+        entries = parallel_map(lambda x: directory_entries(*x), directories)
+        for (path, extended, version), names in zip(directories, entries):
+            if names is None:
+                return None
+            level.extend((join(path, name), version_path(extended, version) + '/' + name) for name in names)
+    return selected
+
+
+def version_path(extended, version):
+
+    ''' Version-extended path of a version of the element reached by a plain or version-extended path '''
+
+    return extended + version if '@@' in extended else extended + '@@' + version
+
+
+def element_tree(extended):
+
+    ''' Version tree of the element reached by a plain or version-extended path, None if lshistory fails '''
+
+    output, errors = run_cmd(['cleartool', 'lshistory'] + ccfmt.TREE_VERSION.args() + [extended], True)
+    trees = parse_version_trees(output)
+    if any('Error' in line for line in errors) or len(trees) != 1:
+        return None
+    return list(trees.values())[0]
+
+
+def directory_entries(path, extended, version):
+
+    ''' Names in a directory version, None if they cannot be listed. A checked-out directory is listed in the view,
+        other directory versions never change and are kept in the version cache. '''
+
+    if version.endswith('/CHECKEDOUT'):
+        listed = path
+        version_cache = None
+        clearcase_cmd_ls = ['cleartool', 'ls', '-short', '-nxname', '-vob_only', path]
+    else:
+        listed = version_path(extended, version)
+        version_cache = cache.get_version_cache()
+        data = version_cache.get(listed) if version_cache else None
+        if data is not None:
+            return [name for name in data.decode('utf-8').split('\n') if name]
+        clearcase_cmd_ls = ['cleartool', 'ls', '-short', '-nxname', listed]
+    output, errors = run_cmd(clearcase_cmd_ls, True)
+    if any('Error' in line for line in errors):
+        return None
+    names = [basename(line.rstrip('/')) for line in output if line.strip()]
+    if version_cache:
+        version_cache.put(listed, '\n'.join(names).encode('utf-8'))
+    return names
+
+
 def get_file_versions(cs_filename=None, view=False, file_path='', get_latest=False):
 
     ''' Get the files selected by a given configspec file and their versions '''
@@ -557,31 +1471,155 @@ def get_file_versions(cs_filename=None, view=False, file_path='', get_latest=Fal
     cs_file_current = get_cs_text()
     if cs_filename:
         cs_file_new = get_cs_text(cs_filename, view)
-        if cs_file_new:
-            set_cs(cs_file_new)
-        else:
+        if not cs_file_new:
             return None, None
+    cs_text = cs_file_new if cs_filename else cs_file_current
+
+    if EVALUATE_CS and not file_path and (cs_filename or get_latest):
+        cs_files = evaluate_cs(cs_text, get_latest)
+        if cs_files is not None:
+            return cs_files, cs_text
+
+    manifest_store = cache.get_manifest_store() if not file_path else None
+    live = not (cs_filename or get_latest)
+    if manifest_store:
+        view_name = get_working_view_name()
+        query = 'find_latest' if get_latest else 'ls'
+        manifest_key = manifest_store.key(None if get_latest else cs_text, view_name, getcwd(), query)
+        manifest = manifest_store.load(manifest_key)
+        if manifest and manifest_is_current(manifest, live):
+            return manifest['files'], cs_text
+        scan_started = time.time()
+        scan_mtimes = directory_mtimes() if live else None
+        scan_checked_out = checked_out_list() if query == 'ls' else None
+
+    if cs_filename:
+        set_cs(cs_file_new)
 
     if get_latest:
         cmd = 'cleartool find . -version "{version(main/LATEST) && ! lbtype(find)}" -print'
     else:
         cmd = 'cleartool ls -r ' + file_path
 
-    result = run_cmd(cmd, get_lines=True)[0]
+    cs_files = parse_file_versions(stream_cmd(cmd))
+
+    if cs_filename:
+        set_cs(cs_file_current)
+    if manifest_store:
+        manifest_store.save(
+            manifest_key, cs_files, created=scan_started, view=view_name, directory=getcwd(),
+            query=query, cs_hash=cache.hash_lines(cs_text), directory_mtimes=scan_mtimes,
+            checked_out=scan_checked_out,
+        )
+    return cs_files, cs_text
+
+
+def not_latest_versions(view=None, directory='.'):
+
+    ''' [(file, selected version, /main/LATEST version)] of the files under directory that are not at their latest
+        version in the current view (or in view). With the cs engine and another view, both versions come from one
+        lshistory scan, otherwise from one find of the selected versions that are not LATEST, sharded across
+        subtrees, and a describe of the LATEST version of those only. '''
+
+    cs_text = get_cs_text(view, True) if view else get_cs_text()
+    if not cs_text:
+        return []
+    if EVALUATE_CS and view:
+        known_trees = {}
+        selected = evaluate_cs(cs_text, False, directory, known_trees)
+        if selected is not None:
+            latest = evaluate_cs(cs_text, True, directory, known_trees)
+            return [
+                (file_i, selected[file_i]['version'], latest[file_i]['version']) for file_i in sort_paths(selected)
+                if file_i in latest and selected[file_i]['version'] != latest[file_i]['version']]
+
+    cs_file_current = get_cs_text()
+    if view:
+        set_cs(cs_text)
+    selected = {}
+    shard_versions, _ = query_shards(directory, lambda paths, errors: [
+        ccfmt.split_version_path(line) for line in stream_cmd(
+            ['cleartool', 'find'] + paths + ['-cview', '-version', '!version(/main/LATEST)', '-print'], errors)])
+    for versions_i in shard_versions:
+        selected.update((relpath(abspath(element), abspath(directory)), version)
+                        for element, version in versions_i if element)
+    if view:
+        set_cs(cs_file_current)
+
+    files = sort_paths(selected)
+    latest = {}
+    for output in parallel_map(
+            lambda x: run_cmd(['cleartool', 'describe'] + ccfmt.LABELED_VERSION.args()
+                              + [join(directory, file_i) + '@@/main/LATEST' for file_i in x], True)[0],
+            [files[start:start + BATCH_SIZE] for start in range(0, len(files), BATCH_SIZE)]):
+        for record in ccfmt.LABELED_VERSION.parse(output):
+            # Elements whose LATEST version is labeled 'find' are left out, as in get_file_versions
+            if 'find' not in record.labels.split():
+                latest[relpath(abspath(record.element), abspath(directory))] = record.version
+    return [(file_i, selected[file_i], latest[file_i]) for file_i in files if file_i in latest]
+
+
+def parse_file_versions(lines, directory=None):
+
+    ''' {file: {'version', 'rule'}} from cleartool ls/find output, paths made relative to directory if provided '''
+
     cs_files = {}
-    for item in result:
-        matched = re.search(r'^(.*from\s)?(?P<filename>.*?)(@@(?P<version>.*?))?\s*(Rule: (?P<rule>.*?))?$', item)
-        if matched:
-            if matched.group('filename'):
-                cs_files[matched.group('filename')] = {'version': '', 'rule': ''}
-                if matched.group('version'):
-                    cs_files[matched.group('filename')]['version'] = matched.group('version')
-                if matched.group('rule'):
-                    cs_files[matched.group('filename')]['rule'] = matched.group('rule')
+    for record in map(ccfmt.parse_ls_line, lines):
+        if record:
+            filename = relpath(abspath(record.element), directory) if directory else record.element
+            cs_files[filename] = {'version': record.version, 'rule': record.rule}
+    return cs_files
+
 
+def get_directories_file_versions(cs_filename, directories, view=False, known_trees=None):
+
+    ''' get_file_versions for several directories at once: the cs is read and, if it cannot be evaluated locally,
+        applied once, and the directories are scanned concurrently. Returns ({directory: cs_files}, cs_text),
+        the files of each directory relative to it. '''
+
+    cs_file_current = get_cs_text()
+    cs_text = get_cs_text(cs_filename, view) if cs_filename else cs_file_current
+    if not cs_text:
+        return None, None
+    directories = [abspath(directory) for directory in directories]
+    versions = {}
+    if EVALUATE_CS and cs_filename:
+        evaluated = parallel_map(lambda x: evaluate_cs(cs_text, directory=x, known_trees=known_trees), directories)
+        for directory, cs_files in zip(directories, evaluated):
+            if cs_files is not None:
+                versions[directory] = cs_files
+
+    manifest_store = cache.get_manifest_store()
+    live = not cs_filename
+    view_name = get_working_view_name() if manifest_store else None
+    to_scan = []
+    for directory in [directory for directory in directories if directory not in versions]:
+        if manifest_store:
+            manifest = manifest_store.load(manifest_store.key(cs_text, view_name, directory, 'ls'))
+            if manifest and manifest_is_current(manifest, live, directory):
+                versions[directory] = manifest['files']
+                continue
+        to_scan.append(directory)
+    if not to_scan:
+        return versions, cs_text
+
+    scan_started = time.time()
+    scan_mtimes = {directory: directory_mtimes(directory) for directory in to_scan} if live else {}
+    scan_checked_out = dict(zip(to_scan, parallel_map(checked_out_list, to_scan))) if manifest_store else {}
+    if cs_filename:
+        set_cs(cs_text)
+    scans = parallel_map(lambda x: parse_file_versions(stream_cmd(['cleartool', 'ls', '-r', x]), x), to_scan)
     if cs_filename:
         set_cs(cs_file_current)
-    return cs_files, cs_file_new if cs_filename else cs_file_current
+    for directory, cs_files in zip(to_scan, scans):
+        versions[directory] = cs_files
+        if manifest_store:
+            manifest_store.save(
+                manifest_store.key(cs_text, view_name, directory, 'ls'), cs_files, created=scan_started,
+                view=view_name, directory=directory, query='ls', cs_hash=cache.hash_lines(cs_text),
+                directory_mtimes=scan_mtimes.get(directory), checked_out=scan_checked_out.get(directory),
+            )
+    return versions, cs_text
 
 
 def get_single_file_version(file_path):
@@ -699,13 +1737,62 @@ def versions_diff(cs_files_a, cs_files_b):
     return list(files_a_not_b), list(files_b_not_a), different_versions
 
 
-def diffcs(csfile_a, csfile_b, view=None, diff_files=False, dir_path=None, gen_rules=False, review_diffs=False):
+def label_find_cmd(label, directory):
+    return ['cleartool', 'find', directory, '-version', 'lbtype(' + label + ')', '-print']
+
+
+def print_labels_diff(label_a, label_b, a_not_b, b_not_a, diff_v):
+
+    ''' Print the differences between the versions labeled with label_a and label_b, like diffcs does.
+        a_not_b and b_not_a are {element: version}, diff_v is {element: (version_a, version_b)} '''
 
-    ''' Find different versions selected by two cs files '''
+    if not any([a_not_b, b_not_a, diff_v]):
+        print_indent('Identical: Both labels select the same files and versions.', 1)
+        return
+    for label_i, label_j, only_i in [(label_b, label_a, b_not_a), (label_a, label_b, a_not_b)]:
+        print_indent('Files selected by ' + label_i + ' and NOT by ' + label_j + ':', 1)
+        if not only_i:
+            print_indent('None.', 2)
+        for item in sort_paths(only_i):
+            print_indent(relpath(item) + '   ' + only_i[item], 2)
+    print_indent('Files with different versions in ' + label_b + ' vs ' + label_a + ':', 1)
+    if not diff_v:
+        print_indent('None.', 2)
+    for item in sort_paths(diff_v):
+        print_indent(relpath(item) + '   ' + diff_v[item][1] + ' vs ' + diff_v[item][0], 2)
+
+
+def diff_cs_directories(csfile_a, csfile_b, directories, view=False):
+
+    ''' diff_cs_versions for several directories, each cs is resolved once for all of them.
+        Returns {directory: (cs_a, cs_b, a_not_b, b_not_a, diff_v)} '''
+
+    known_trees = {}
+    versions_a, text_a = get_directories_file_versions(csfile_a, directories, view, known_trees)
+    versions_b, text_b = get_directories_file_versions(csfile_b, directories, known_trees=known_trees)
+    results = {}
+    for directory in [abspath(directory) for directory in directories]:
+        files_a = versions_a.get(directory) if versions_a else None
+        files_b = versions_b.get(directory) if versions_b else None
+        if files_a is None or files_b is None:
+            results[directory] = (None, None, None, None, None)
+        else:
+            results[directory] = ((files_a, text_a), (files_b, text_b)) + versions_diff(files_a, files_b)
+    return results
+
+
+def diffcs(csfile_a, csfile_b, view=None, diff_files=False, dir_path=None, gen_rules=False, review_diffs=False,
+           versions=None):
+
+    ''' Find different versions selected by two cs files, versions is the result of diff_cs_directories if
+        it was already computed for dir_path '''
 
     if dir_path:
         chdir(dir_path)
-    cs_a, cs_b, a_not_b, b_not_a, diff_v = diff_cs_versions(csfile_a, csfile_b, bool(view), diff_files)
+    if versions and not diff_files:
+        cs_a, cs_b, a_not_b, b_not_a, diff_v = versions
+    else:
+        cs_a, cs_b, a_not_b, b_not_a, diff_v = diff_cs_versions(csfile_a, csfile_b, bool(view), diff_files)
 
     if not diff_files and (cs_a and cs_b):
         if not any([a_not_b, b_not_a, diff_v]):
@@ -789,8 +1876,7 @@ def sort_paths(path_list):
 
     ''' Sort paths in lexicographical order '''
 
-    sorted_paths = sorted([[filepath, Path(filepath)] for filepath in path_list], key = lambda x: x[1])
-    return [str(i[0]) for i in sorted_paths]
+    return sorted(path_list, key=paths.sort_key)
 
 
 def get_block_name_path(blockname=None):
@@ -825,14 +1911,20 @@ def find_save_cs_dir(blockname=None, user=False, code_review=False):
         needed_paths.append(join(needed_paths[0], 'user'))
     if code_review:
         needed_paths.append(join(needed_paths[0], 'code_review'))
-    current_cs = get_cs_text()
-    set_cs(DEFAULT_CS)
+    # Look for the directories in /main/LATEST of the block, only change the cs if one has to be created
+    missing = []
     for cs_path in needed_paths:
-        if not exists_try(cs_path):
-            print_indent('Creating ' + cs_path, 1)
-            os.mkdir(cs_path)
-            cc_checkx('in', recursive=False, selected_item=cs_path, message='Create directory to store CS files.', identical=False, untracked=True)
-    set_cs(current_cs)
+        if missing or not exists_on_main(block_path, cs_path):
+            missing.append(cs_path)
+    if missing:
+        current_cs = get_cs_text()
+        set_cs(DEFAULT_CS)
+        for cs_path in missing:
+            if not exists_try(cs_path):
+                print_indent('Creating ' + cs_path, 1)
+                os.mkdir(cs_path)
+                cc_checkx('in', recursive=False, selected_item=cs_path, message='Create directory to store CS files.', identical=False, untracked=True, add_rule_to_cs=False)
+        set_cs(current_cs)
 
     if code_review:
         return needed_paths[-1]
@@ -842,6 +1934,35 @@ def find_save_cs_dir(blockname=None, user=False, code_review=False):
         return needed_paths[0]
 
 
+def main_latest_path(base_path, path):
+
+    ''' Version-extended path to the element path as found in /main/LATEST of base_path and of every directory in between '''
+
+    parts = relpath(path, base_path).split(os.sep)
+    return base_path + '@@/main/LATEST' + ''.join('/' + part + '/main/LATEST' for part in parts[:-1]) + '/' + parts[-1]
+
+
+def exists_on_main(base_path, path):
+
+    ''' Whether the element path exists in /main/LATEST, whatever the current cs selects '''
+
+    result = run_cmd(['cleartool', 'describe', '-fmt', '%m\\n', main_latest_path(base_path, path)])
+    return bool(result[0].strip()) and 'Error' not in result[1]
+
+
+def view_selects_latest(path):
+
+    ''' Whether the view shows path at /main/LATEST (or checked out), so that it can be checked out and in
+        without changing the cs. A new file needs the same from its directory. '''
+
+    if not exists_try(path):
+        parent = dirname(path)
+        return parent != path and exists_try(parent) and view_selects_latest(parent)
+    result = run_cmd(['cleartool', 'describe', '-fmt', '%Vn\\n', path, path + '@@/main/LATEST'], True)
+    versions = [line.strip() for line in result[0] if line.strip()]
+    return len(versions) == 2 and (versions[0] == versions[1] or versions[0].endswith('/CHECKEDOUT'))
+
+
 def get_cs_path(block=None, cs_file_name=None):
 
     ''' Guess the full path were a given cs can be found '''